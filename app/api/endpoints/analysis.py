@@ -1,14 +1,52 @@
-from fastapi import APIRouter, HTTPException
-from app.schemas.risk import AnalysisRequest, AnalysisResponse
+import json
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from app.schemas.risk import AnalysisRequest, AnalysisResponse, BatchAnalysisRequest, BatchAnalysisResponse
 from app.services.risk_service import risk_service
 
 router = APIRouter()
 
 @router.post("/analyze", response_model=AnalysisResponse)
-async def analyze_company(request: AnalysisRequest):
+async def analyze_company(request: AnalysisRequest, response: Response):
     try:
         # Service returns a dictionary matching the response model
-        result = await risk_service.analyze(request.ticker, request.use_live_data)
+        result = await risk_service.analyze(request.ticker, request.use_live_data, request.bypass_cache)
+        if result.get("evidence_status") == "pending":
+            # Provisional score: filings are still being ingested, poll the job and ask again
+            response.status_code = 202
+            response.headers["Location"] = f"/jobs/{result['ingest_job_id']}"
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/analyze/batch", response_model=BatchAnalysisResponse)
+async def analyze_portfolio(request: BatchAnalysisRequest):
+    try:
+        # Errors are reported per ticker, so one bad symbol does not fail the portfolio
+        results = await risk_service.analyze_many(request.tickers, request.use_live_data, request.bypass_cache)
+        return {"results": results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/analyze/stream")
+async def analyze_company_stream(request: AnalysisRequest):
+    """
+    Server-Sent Events variant of /analyze: one typed event per pipeline stage as soon as it is ready
+    (financial_metrics, rag_evidences, probability_of_default, risk_factors), then done with the full response.
+    """
+    async def event_stream():
+        try:
+            async for event, payload in risk_service.analyze_stream(request.ticker, request.use_live_data, request.bypass_cache):
+                yield _sse(event, payload)
+        except Exception as e:
+            # Headers are already sent, so failures travel as an in-band event instead of a 500
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _sse(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
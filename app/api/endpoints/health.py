@@ -0,0 +1,16 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.services.risk_service import risk_service
+
+router = APIRouter(prefix="/health")
+
+@router.get("/live")
+async def liveness():
+    # The process is up and serving; components may still be loading
+    return {"status": "alive"}
+
+@router.get("/ready")
+async def readiness():
+    # 503 until the critical components have finished loading, with per-component status and load time
+    health = risk_service.health()
+    return JSONResponse(status_code=200 if health["ready"] else 503, content=health)
@@ -0,0 +1,66 @@
+import asyncio
+import json
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from app.schemas.risk import IngestRequest, JobListResponse, JobResponse
+from app.services.risk_service import risk_service
+
+router = APIRouter(prefix="/jobs")
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+@router.post("/ingest", response_model=JobResponse, status_code=202)
+async def submit_ingest(request: IngestRequest, response: Response):
+    # Deduplicated per ticker: asking again while a job is queued or running returns that job
+    job, created = await risk_service.ingest_ticker(request.ticker)
+    response.headers["Location"] = f"/jobs/{job['id']}"
+    return JobResponse(**job)
+
+@router.get("", response_model=JobListResponse)
+async def list_jobs(ticker: Optional[str] = None, status: Optional[str] = None, limit: int = 50):
+    jobs = await risk_service.jobs.list(ticker.upper() if ticker else None, status, min(limit, 500))
+    return {"jobs": jobs}
+
+@router.get("/stats")
+async def job_stats():
+    return risk_service.job_stats()
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    job = await risk_service.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+@router.get("/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Server-Sent Events: a progress event whenever the job's stage or progress changes, then done or failed.
+    """
+    job = await risk_service.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+
+    async def event_stream():
+        last = None
+        current = job
+        while current is not None:
+            state = (current["status"], current["stage"], current["progress"])
+            if state != last:
+                last = state
+                if current["status"] in TERMINAL_STATUSES:
+                    yield _sse("done" if current["status"] == "succeeded" else "failed", current)
+                    return
+                yield _sse("progress", current)
+            await asyncio.sleep(0.5)
+            current = await risk_service.jobs.get(job_id)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _sse(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
@@ -0,0 +1,35 @@
+import os
+from fastapi import APIRouter
+from app.services.risk_service import risk_service
+
+router = APIRouter(prefix="/system")
+
+@router.get("/executors")
+async def executor_stats():
+    # Pool queue depth plus per-stage queued/running/completed counters
+    return risk_service.executor_stats()
+
+@router.get("/inflight")
+async def inflight_stats():
+    # Single-flight registries: computations started vs. callers that joined one already running
+    return risk_service.inflight_stats()
+
+@router.get("/cache")
+async def cache_stats():
+    # Hit/miss, expiry and eviction counters for the analysis caches, plus the versions keying them
+    return risk_service.cache_stats()
+
+@router.get("/memory")
+async def memory_stats():
+    # Resident vs proportional memory of this worker: pages shared with the master and other workers
+    # count fully in rss but only pro rata in pss (Linux only)
+    stats = {"pid": os.getpid()}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty"):
+                    stats[key.lower() + "_mb"] = round(int(value.split()[0]) / 1024, 1)
+    except OSError:
+        pass
+    return stats
@@ -0,0 +1,88 @@
+import os
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    return value.lower() in ("1", "true", "yes") if value else default
+
+class Settings:
+    """
+    Runtime configuration, read from environment variables so deployments can tune it without code changes.
+    """
+    def __init__(self):
+        cpu_count = os.cpu_count() or 4
+
+        self.index_path = os.getenv("RISK_INDEX_PATH", "data/faiss_index.bin")
+        self.index_mmap = _env_bool("RISK_INDEX_MMAP", False)
+        # ANN index for new stores (flat, ivf_flat, ivf_pq, hnsw, or compressed sq_fp16, sq_int8, pq);
+        # switch an existing one with nlp/rebuild_index.py
+        self.index_type = os.getenv("RISK_INDEX_TYPE", "flat")
+        self.index_params = {
+            "nlist": _env_int("RISK_INDEX_NLIST", 256),
+            "nprobe": _env_int("RISK_INDEX_NPROBE", 16),
+            "pq_m": _env_int("RISK_INDEX_PQ_M", 48),
+            "pq_nbits": _env_int("RISK_INDEX_PQ_NBITS", 8),
+            "hnsw_m": _env_int("RISK_INDEX_HNSW_M", 32),
+            "ef_construction": _env_int("RISK_INDEX_EF_CONSTRUCTION", 80),
+            "ef_search": _env_int("RISK_INDEX_EF_SEARCH", 64),
+            "rerank": _env_int("RISK_INDEX_RERANK", 4),
+        }
+        # Ingests append segments to the index; this many of them are folded back into the base in the background
+        self.compact_segments = _env_int("RISK_COMPACT_SEGMENTS", 8)
+        # ... and once this share of the indexed chunks belongs to replaced filings, purging them
+        self.compact_deleted = _env_float("RISK_COMPACT_DELETED", 0.2)
+
+        # Cross-encoder cascade: re-rank only the first N fused candidates per query (0: all), and fall back to
+        # fused order for queries not scored within this many milliseconds per retrieval call (0: no limit)
+        self.rerank_top_n = _env_int("RISK_RERANK_TOP_N", 0)
+        self.rerank_budget_ms = _env_float("RISK_RERANK_BUDGET_MS", 0)
+
+        # Transformer inference (embedder, cross-encoder, FinBERT): torch, int8 (dynamic quantization) or onnx
+        # (ONNX Runtime), on this many intra-op threads each (0: one per core)
+        self.inference_backend = os.getenv("RISK_INFERENCE_BACKEND", "torch")
+        self.inference_threads = _env_int("RISK_INFERENCE_THREADS", 0)
+        # Score indexed chunks that have no stored FinBERT score (e.g. an index built before scores were stored)
+        # in the background once FinBERT is loaded, instead of at query time
+        self.backfill_sentiment = os.getenv("RISK_BACKFILL_SENTIMENT", "1") != "0"
+
+        # Multi-worker serving (python -m app.server): workers share the artifacts loaded by the master
+        self.workers = _env_int("RISK_WORKERS", 1)
+        self.manifest_poll_seconds = _env_int("RISK_MANIFEST_POLL_SECONDS", 5)
+
+        # Executor pools: network calls wait on sockets, model inference needs cores
+        self.io_workers = _env_int("RISK_IO_WORKERS", 16)
+        self.cpu_workers = _env_int("RISK_CPU_WORKERS", cpu_count)
+
+        # Per-stage concurrency limits: stage -> (pool, max in-flight calls)
+        self.stage_limits = {
+            "market_data": ("io", _env_int("RISK_LIMIT_MARKET_DATA", 8)),
+            "sec_download": ("io", _env_int("RISK_LIMIT_SEC_DOWNLOAD", 2)),
+            "ingest": ("cpu", _env_int("RISK_LIMIT_INGEST", 1)),
+            "retrieval": ("cpu", _env_int("RISK_LIMIT_RETRIEVAL", max(1, cpu_count // 2))),
+            "sentiment": ("cpu", _env_int("RISK_LIMIT_SENTIMENT", 2)),
+            "scoring": ("cpu", _env_int("RISK_LIMIT_SCORING", 2)),
+        }
+
+        # Analysis cache: market data goes stale faster than filing evidence
+        self.cache_market_ttl = _env_int("RISK_CACHE_MARKET_TTL", 3600)
+        self.cache_evidence_ttl = _env_int("RISK_CACHE_EVIDENCE_TTL", 24 * 3600)
+        self.cache_max_entries = _env_int("RISK_CACHE_MAX_ENTRIES", 2048)
+        self.cache_max_bytes = _env_int("RISK_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+
+        # Background ingestion: uncovered tickers get a provisional score while their filings are fetched
+        self.background_ingest = _env_bool("RISK_BACKGROUND_INGEST", True)
+        self.jobs_db_path = os.getenv("RISK_JOBS_DB", "data/jobs.db")
+        self.job_workers = _env_int("RISK_JOB_WORKERS", 2)
+        # A job whose worker died this many times (it was claimed but never finished) is marked failed, not requeued
+        self.job_max_attempts = _env_int("RISK_JOB_MAX_ATTEMPTS", 3)
+        # A failed ingest is not retried for this long, so every request for a bad ticker does not start a new job
+        self.job_retry_seconds = _env_int("RISK_JOB_RETRY_SECONDS", 600)
+
+settings = Settings()
@@ -1,13 +1,15 @@
 from fastapi import FastAPI
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse
+import asyncio
 import os
 import sys
 
 # Add project root to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.api.endpoints import analysis
+from app.api.endpoints import analysis, health, jobs, system
 from app.services.risk_service import risk_service
+from app.core.metrics import metrics
 
 app = FastAPI(title="Credit Risk RAG System", version="2.0")
 
@@ -23,10 +25,26 @@ app.add_middleware(
 
 # Include Routers
 app.include_router(analysis.router)
+app.include_router(system.router)
+app.include_router(health.router)
+app.include_router(jobs.router)
 
 @app.on_event("startup")
 async def startup_event():
-    await risk_service.initialize()
+    # Load components in the background so the server accepts connections (and /health/live) right away;
+    # analysis requests await readiness, and /health/ready reports progress
+    asyncio.ensure_future(risk_service.initialize())
+    # Resume queued or interrupted ingest jobs from the job table
+    risk_service.start_background_jobs()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await risk_service.shutdown()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    # Prometheus text exposition: per-stage latency histograms, event counters, cache and executor stats
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/", response_class=HTMLResponse)
 def read_root():
@@ -81,7 +99,7 @@ def read_root():
                 </div>
             </div>
 
-            <div id="loading" class="loading">Analyzing market data & news... (First time analysis may take up to 20s)... please wait...</div>
+            <div id="loading" class="loading">Analyzing market data & news... (New companies get a provisional score while their filings are fetched)... please wait...</div>
 
             <div id="resultArea">
                 <!-- Summary Card -->
@@ -117,37 +135,92 @@ def read_root():
                     const liveData = document.getElementById('liveData').checked;
                     
                     document.getElementById('loading').style.display = 'block';
-                    document.getElementById('resultArea').style.display = 'none';
+                    resetDashboard(ticker);
                     
+                    pendingJob = null;
                     try {
-                        // Increase timeout for on-demand downloading (can take 15-20s)
-                        const controller = new AbortController();
-                        const timeoutId = setTimeout(() => controller.abort(), 60000); // 60 seconds
-
-                        const response = await fetch('/analyze', {
+                        // Each pipeline stage arrives as its own Server-Sent Event, so render as we go.
+                        // Uncovered tickers no longer block on the 10-K download: they get a provisional score now.
+                        const response = await fetch('/analyze/stream', {
                             method: 'POST',
                             headers: { 'Content-Type': 'application/json' },
-                            body: JSON.stringify({ ticker: ticker, use_live_data: liveData }),
-                            signal: controller.signal
+                            body: JSON.stringify({ ticker: ticker, use_live_data: liveData })
                         });
-                        clearTimeout(timeoutId);
-                        const data = await response.json();
-                        
-                        renderDashboard(data);
+
+                        const reader = response.body.getReader();
+                        const decoder = new TextDecoder();
+                        let buffer = '';
+                        while (true) {
+                            const { value, done } = await reader.read();
+                            if (done) break;
+                            buffer += decoder.decode(value, { stream: true });
+
+                            let boundary;
+                            while ((boundary = buffer.indexOf('\\n\\n')) !== -1) {
+                                handleEvent(buffer.slice(0, boundary));
+                                buffer = buffer.slice(boundary + 2);
+                            }
+                        }
                     } catch (e) {
                         alert("Error: " + e.message);
                     } finally {
                         document.getElementById('loading').style.display = 'none';
                     }
+                    if (pendingJob) followIngestJob(pendingJob);
+                }
+
+                let pendingJob = null;
+
+                function followIngestJob(jobId) {
+                    // Re-run the analysis once the background ingest has indexed the filing
+                    const source = new EventSource(`/jobs/${jobId}/events`);
+                    source.addEventListener('progress', (e) => {
+                        const job = JSON.parse(e.data);
+                        document.getElementById('ragEvidence').innerText =
+                            `Fetching the latest 10-K in the background (${job.stage}, ${Math.round(job.progress * 100)}%). The score above is provisional.`;
+                    });
+                    source.addEventListener('done', () => { source.close(); analyze(); });
+                    source.addEventListener('failed', (e) => {
+                        source.close();
+                        document.getElementById('ragEvidence').innerText =
+                            "Could not fetch filings for this company: " + JSON.parse(e.data).error;
+                    });
+                    source.onerror = () => source.close();
+                }
+
+                function handleEvent(raw) {
+                    let event = 'message';
+                    let data = '';
+                    raw.split('\\n').forEach(line => {
+                        if (line.startsWith('event: ')) event = line.slice(7);
+                        if (line.startsWith('data: ')) data += line.slice(6);
+                    });
+                    const payload = JSON.parse(data);
+
+                    if (event === 'financial_metrics') renderMetrics(payload.financial_metrics);
+                    if (event === 'rag_evidences') {
+                        renderEvidences(payload.rag_evidences);
+                        if (payload.evidence_status === 'pending') pendingJob = payload.ingest_job_id;
+                    }
+                    if (event === 'probability_of_default') renderRiskBadge(payload.probability_of_default);
+                    if (event === 'risk_factors') renderDrivers(payload.risk_factors);
+                    if (event === 'error') alert("Error: " + payload.detail);
                 }
 
-                function renderDashboard(data) {
+                function resetDashboard(ticker) {
                     document.getElementById('resultArea').style.display = 'block';
-                    document.getElementById('companyName').innerText = `Analysis for ${data.ticker}`;
+                    document.getElementById('companyName').innerText = `Analysis for ${ticker}`;
+                    document.getElementById('riskBadge').className = 'risk-badge';
+                    document.getElementById('riskBadge').innerText = 'Analyzing...';
+                    document.getElementById('riskDesc').innerText = '';
+                    document.getElementById('driversList').innerHTML = '';
+                    document.getElementById('metricsGrid').innerHTML = '';
+                    document.getElementById('ragEvidence').innerHTML = '';
+                }
 
+                function renderRiskBadge(pd) {
                     // 1. Risk Badge
                     const badge = document.getElementById('riskBadge');
-                    const pd = data.probability_of_default;
                     const percent = (pd * 100).toFixed(2);
                     
                     if (pd > 0.5) {
@@ -159,12 +232,13 @@ def read_root():
                         badge.innerText = `LOW RISK (${percent}% PD)`;
                         document.getElementById('riskDesc').innerText = `This company appears financially stable with healthy indicators.`;
                     }
+                }
 
+                function renderDrivers(factors) {
                     // 2. Key Drivers (SHAP)
                     const driversList = document.getElementById('driversList');
                     driversList.innerHTML = '';
-                    const factors = data.risk_factors || {};
-                    const sortedFactors = Object.entries(factors).sort((a,b) => Math.abs(b[1]) - Math.abs(a[1]));
+                    const sortedFactors = Object.entries(factors || {}).sort((a,b) => Math.abs(b[1]) - Math.abs(a[1]));
                     
                     sortedFactors.slice(0, 4).forEach(([key, val]) => {
                         const li = document.createElement('li');
@@ -184,11 +258,12 @@ def read_root():
                         li.innerHTML = `<span><b>${name}</b> <small>${reason}</small></span> <span class="${colorClass}">${impact}</span>`;
                         driversList.appendChild(li);
                     });
+                }
 
+                function renderMetrics(metrics) {
                     // 3. Financial Metrics
                     const grid = document.getElementById('metricsGrid');
                     grid.innerHTML = '';
-                    const metrics = data.financial_metrics;
                     const displayMetrics = {
                         "debt_to_equity": "Debt/Equity",
                         "current_ratio": "Current Ratio",
@@ -207,9 +282,11 @@ def read_root():
                             </div>
                         `;
                     }
+                }
 
+                function renderEvidences(evidences) {
                     // 4. RAG Evidence
-                    const evidences = data.rag_evidences || [];
+                    evidences = evidences || [];
                     document.getElementById('ragEvidence').innerHTML = evidences.length > 0 ?
                         evidences.map(e => `<p>related excerpt: "${e.substring(0, 150)}..."</p>`).join('') :
                         "No specific textual risk factors found in recent filings.";
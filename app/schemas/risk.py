@@ -1,9 +1,10 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Dict, Any, List, Optional
 
 class AnalysisRequest(BaseModel):
     ticker: str
     use_live_data: bool = True
+    bypass_cache: bool = False
 
 class AnalysisResponse(BaseModel):
     ticker: str
@@ -12,3 +13,40 @@ class AnalysisResponse(BaseModel):
     financial_metrics: Dict[str, Any]
     rag_evidences: List[str]
     risk_factors: Dict[str, float]
+    # "pending" while a background ingest fetches the ticker's filings; the score is provisional until then
+    evidence_status: str = "available"
+    ingest_job_id: Optional[str] = None
+
+class BatchAnalysisRequest(BaseModel):
+    tickers: List[str] = Field(..., min_length=1, max_length=500)
+    use_live_data: bool = True
+    bypass_cache: bool = False
+
+class BatchAnalysisItem(BaseModel):
+    ticker: str
+    result: Optional[AnalysisResponse] = None
+    error: Optional[str] = None
+
+class BatchAnalysisResponse(BaseModel):
+    results: List[BatchAnalysisItem]
+
+class IngestRequest(BaseModel):
+    ticker: str
+
+class JobResponse(BaseModel):
+    id: str
+    kind: str
+    ticker: str
+    status: str
+    stage: Optional[str] = None
+    progress: float
+    attempts: int
+    error: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    created_at: float
+    updated_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+class JobListResponse(BaseModel):
+    jobs: List[JobResponse]
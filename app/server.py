@@ -0,0 +1,175 @@
+"""
+Pre-forking multi-worker server.
+
+The master loads every model and the index once, freezes the heap and forks the workers, so the
+read-only artifacts (MiniLM, FinBERT and cross-encoder weights, the GBR model, documents and BM25)
+are shared copy-on-write instead of loaded once per worker. With RISK_INDEX_MMAP the FAISS vectors
+are memory-mapped and shared through the page cache as well.
+
+When a worker ingests new filings it publishes a new index generation (see Retriever.refresh);
+the master notices, reloads the index and replaces the workers one set at a time, so they keep
+sharing one copy of the new generation.
+
+Usage:
+    python -m app.server --workers 4 --port 8000
+"""
+import argparse
+import asyncio
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+
+class PreforkServer:
+    def __init__(self, host: str, port: int, workers: int, timeout_graceful: int = 30):
+        self.host = host
+        self.port = port
+        self.num_workers = workers
+        self.timeout_graceful = timeout_graceful
+        self.workers = {}  # pid -> index generation the worker was forked from
+        self.generation = 0
+        self.running = True
+
+    def run(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        self.sock = sock
+
+        from app.main import app
+        from app.services.risk_service import risk_service
+        self.app = app
+        self.risk_service = risk_service
+
+        print(f"Loading artifacts in master (pid {os.getpid()})...")
+        asyncio.run(risk_service.warm_up())
+        self.generation = risk_service.retriever.generation if risk_service.retriever else 0
+        self._freeze()
+
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        print(f"Serving on http://{self.host}:{self.port} with {self.num_workers} workers")
+        self._spawn(self.num_workers)
+        next_poll = time.monotonic() + settings.manifest_poll_seconds
+        while self.running:
+            self._reap()
+            if not self.running:
+                break
+            # Replace workers that died unexpectedly
+            missing = self.num_workers - sum(1 for gen in self.workers.values() if gen == self.generation)
+            if missing > 0:
+                self._spawn(missing)
+            if time.monotonic() >= next_poll:
+                self._check_generation()
+                next_poll = time.monotonic() + settings.manifest_poll_seconds
+            time.sleep(0.5)
+
+        self._terminate(list(self.workers))
+        self._wait(list(self.workers), self.timeout_graceful)
+        sock.close()
+
+    def _freeze(self):
+        # Move everything loaded so far into the permanent generation: the workers' collector then
+        # never writes to these objects' GC headers, which would un-share their pages
+        gc.collect()
+        gc.freeze()
+
+    def _spawn(self, count: int):
+        threads = max(1, (os.cpu_count() or 1) // self.num_workers)
+        for _ in range(count):
+            pid = os.fork()
+            if pid == 0:
+                self._serve(threads)
+            self.workers[pid] = self.generation
+
+    def _serve(self, threads: int):
+        status = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            # Split the cores between workers instead of every worker starting one torch thread per core
+            if "torch" in sys.modules:
+                sys.modules["torch"].set_num_threads(threads)
+            config = uvicorn.Config(self.app, timeout_graceful_shutdown=self.timeout_graceful)
+            uvicorn.Server(config).run(sockets=[self.sock])
+        except BaseException as e:
+            print(f"Worker {os.getpid()} failed: {e}")
+            status = 1
+        finally:
+            os._exit(status)
+
+    def _check_generation(self):
+        retriever = self.risk_service.retriever
+        if retriever is None or retriever.read_manifest()["generation"] <= self.generation:
+            return
+        try:
+            retriever.refresh()
+        except Exception as e:
+            print(f"Warning: could not load index generation ({e}).")
+            return
+        self.generation = retriever.generation
+        self._freeze()
+
+        # Start the new set before retiring the old one so there is no gap in capacity
+        old = [pid for pid, gen in self.workers.items() if gen != self.generation]
+        print(f"Publishing index generation {self.generation}: replacing {len(old)} workers")
+        self._spawn(self.num_workers)
+        self._terminate(old)
+
+    def _reap(self):
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if self.workers.pop(pid, None) is not None and self.running and status != 0:
+                print(f"Worker {pid} exited with status {status}")
+
+    def _terminate(self, pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self.workers.pop(pid, None)
+
+    def _wait(self, pids, timeout: float):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and any(pid in self.workers for pid in pids):
+            self._reap()
+            time.sleep(0.1)
+        for pid in pids:
+            if pid in self.workers:
+                os.kill(pid, signal.SIGKILL)
+        self._reap()
+
+    def _stop(self, signum, frame):
+        self.running = False
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the API from pre-forked workers that share loaded artifacts.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=settings.workers)
+    parser.add_argument("--no-mmap", action="store_true", help="Read the FAISS index into memory instead of mapping it")
+    args = parser.parse_args()
+
+    if not args.no_mmap:
+        settings.index_mmap = True
+    PreforkServer(args.host, args.port, args.workers).run()
+
+if __name__ == "__main__":
+    main()
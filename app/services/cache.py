@@ -0,0 +1,106 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional
+
+class TTLCache:
+    """
+    Bounded in-process cache with per-entry TTL and LRU eviction by entry count and approximate bytes.
+    Entries can carry tags (e.g. "ticker:AAPL") so related entries can be invalidated together.
+    """
+    def __init__(self, name: str, ttl: float, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, expires_at, size, tags)
+        self._bytes = 0
+        # Ingest invalidations arrive from worker threads
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self.invalidated = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at, _, _ = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.expired += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __contains__(self, key: Hashable) -> bool:
+        # Live entry check that leaves the hit/miss counters and LRU order alone
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[1] > time.monotonic()
+
+    def put(self, key: Hashable, value: Any, ttl: float = None, tags: Iterable[str] = ()):
+        size = self._estimate_size(value)
+        if size > self.max_bytes:
+            return
+
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires_at, size, frozenset(tags))
+            self._bytes += size
+
+            # Evict least recently used entries until both bounds hold
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evicted += 1
+
+    def invalidate_tag(self, tag: str) -> int:
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if tag in entry[3]]
+            for key in keys:
+                self._remove(key)
+            self.invalidated += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self.invalidated += len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "invalidated": self.invalidated,
+            }
+
+    def _remove(self, key: Hashable):
+        _, _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _estimate_size(self, value: Any) -> int:
+        nbytes = getattr(value, "nbytes", None)  # numpy arrays, e.g. embeddings
+        return nbytes if isinstance(nbytes, int) else len(json.dumps(value, default=str))
@@ -0,0 +1,60 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+class ComponentLoader:
+    """
+    Loads service components concurrently and records their status and load time.
+    Each component's load is a task, so callers that need one can simply await it.
+    """
+    def __init__(self):
+        self.components = {}
+        self._tasks = {}
+
+    def start(self, name: str, load: Callable[[], Awaitable[Any]], critical: bool = True) -> asyncio.Task:
+        if name in self._tasks:
+            return self._tasks[name]
+
+        self.components[name] = {"status": "pending", "critical": critical, "load_seconds": None, "error": None}
+        task = asyncio.ensure_future(self._load(name, load))
+        self._tasks[name] = task
+        return task
+
+    async def wait(self, name: str) -> Any:
+        """
+        Await a component's load. Returns None if it failed or was never started.
+        """
+        task = self._tasks.get(name)
+        if task is None:
+            return None
+        return await asyncio.shield(task)
+
+    async def wait_all(self, names: List[str]):
+        await asyncio.gather(*(self.wait(name) for name in names))
+
+    def is_ready(self) -> bool:
+        # Ready once every critical component has finished loading (successfully or not); not before any has started
+        return bool(self.components) and all(
+            c["status"] in ("ready", "failed")
+            for c in self.components.values() if c["critical"]
+        )
+
+    def status(self) -> Dict[str, Any]:
+        return {name: dict(c) for name, c in self.components.items()}
+
+    async def _load(self, name: str, load: Callable[[], Awaitable[Any]]) -> Any:
+        component = self.components[name]
+        component["status"] = "loading"
+        start = time.perf_counter()
+        try:
+            result = await load()
+            component["status"] = "ready"
+            return result
+        except Exception as e:
+            component["status"] = "failed"
+            component["error"] = str(e)
+            print(f"Warning: Could not load {name} ({e}).")
+            return None
+        finally:
+            component["load_seconds"] = round(time.perf_counter() - start, 3)
+            print(f"Component {name} {component['status']} after {component['load_seconds']:.2f}s")
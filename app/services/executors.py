@@ -0,0 +1,144 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Tuple
+from app.core.metrics import EXECUTOR_WAIT_SECONDS
+
+class StagePool:
+    """
+    Thread pool for one kind of work (network I/O or model inference).
+    The executor is created lazily so a pool built before a fork still works in the child.
+    """
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._waiting = 0  # submitted but not yet picked up by a thread
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"{self.name}-pool")
+                self._pid = os.getpid()
+            return self._executor
+
+    def submit(self, fn: Callable) -> Future:
+        def started():
+            with self._lock:
+                self._waiting -= 1
+            return fn()
+
+        executor = self.executor
+        with self._lock:
+            self._waiting += 1
+        try:
+            future = executor.submit(started)
+        except BaseException:
+            with self._lock:
+                self._waiting -= 1
+            raise
+        # Cancelled before a thread picked it up: started() never runs
+        future.add_done_callback(lambda f: self._uncount_cancelled() if f.cancelled() else None)
+        return future
+
+    def _uncount_cancelled(self):
+        with self._lock:
+            self._waiting -= 1
+
+    def queue_depth(self) -> int:
+        # Work submitted to the executor that no thread has picked up yet
+        with self._lock:
+            return self._waiting
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+class StageExecutor:
+    """
+    Runs blocking pipeline stages off the event loop.
+    Each stage is bound to a pool and has its own concurrency limit, so a burst of slow
+    yfinance calls cannot starve model inference and vice versa.
+    """
+    def __init__(self, pool_sizes: Dict[str, int], stage_limits: Dict[str, Tuple[str, int]]):
+        self.pools = {name: StagePool(name, size) for name, size in pool_sizes.items()}
+        self.stages = {}
+        for stage, (pool_name, limit) in stage_limits.items():
+            if pool_name not in self.pools:
+                raise ValueError(f"Unknown pool '{pool_name}' for stage '{stage}'.")
+            self.stages[stage] = {
+                "pool": pool_name,
+                "limit": limit,
+                "semaphore": asyncio.Semaphore(limit),
+                "queued": 0,
+                "running": 0,
+                "max_queued": 0,
+                "completed": 0,
+                "failed": 0,
+            }
+
+    async def run(self, stage: str, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run fn(*args, **kwargs) on the stage's pool once a stage slot is free.
+        """
+        state = self.stages[stage]
+        pool = self.pools[state["pool"]]
+        loop = asyncio.get_running_loop()
+
+        state["queued"] += 1
+        state["max_queued"] = max(state["max_queued"], state["queued"])
+        queued_at = time.perf_counter()
+        try:
+            await state["semaphore"].acquire()
+        finally:
+            state["queued"] -= 1
+        EXECUTOR_WAIT_SECONDS.observe(time.perf_counter() - queued_at, stage=stage)
+
+        state["running"] += 1
+        try:
+            future = pool.submit(functools.partial(fn, *args, **kwargs))
+        except BaseException:
+            state["running"] -= 1
+            state["semaphore"].release()
+            raise
+        # The slot is freed when the work itself finishes, not when this caller stops waiting for it:
+        # a cancelled caller (timeout, client disconnect) must not let more calls run than the stage limit
+        future.add_done_callback(lambda f: _call_soon(loop, self._finished, state, f))
+        return await asyncio.wrap_future(future, loop=loop)
+
+    def _finished(self, state: Dict[str, Any], future: Future):
+        # On the event loop thread
+        state["running"] -= 1
+        if not future.cancelled():
+            state["completed" if future.exception() is None else "failed"] += 1
+        state["semaphore"].release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pools": {
+                name: {"max_workers": pool.max_workers, "queue_depth": pool.queue_depth()}
+                for name, pool in self.pools.items()
+            },
+            "stages": {
+                stage: {k: v for k, v in state.items() if k != "semaphore"}
+                for stage, state in self.stages.items()
+            },
+        }
+
+    def shutdown(self):
+        for pool in self.pools.values():
+            pool.shutdown()
+
+def _call_soon(loop: asyncio.AbstractEventLoop, callback: Callable, *args):
+    try:
+        loop.call_soon_threadsafe(callback, *args)
+    except RuntimeError:
+        pass  # the loop has closed; nothing is waiting on its semaphores any more
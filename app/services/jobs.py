@@ -0,0 +1,307 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+ACTIVE_STATUSES = ("queued", "running")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    ticker TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    owner INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_ticker ON jobs (kind, ticker, created_at);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created_at);
+"""
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class JobStore:
+    """
+    Persistent job table in SQLite. Shared by every worker process serving the same database,
+    so deduplication and claiming use immediate transactions rather than in-process locks.
+    """
+    def __init__(self, path: str, max_attempts: int = 3):
+        """
+        :param max_attempts: Claims after which a job that keeps taking its worker down is failed instead of rerun.
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.executescript(_SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _transaction(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    result = fn(conn)
+                    conn.execute("COMMIT")
+                    return result
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+            finally:
+                conn.close()
+
+    def _query(self, sql: str, params: Tuple = ()) -> List[Dict[str, Any]]:
+        with self._lock:
+            conn = self._connect()
+            try:
+                return [self._row(r) for r in conn.execute(sql, params).fetchall()]
+            finally:
+                conn.close()
+
+    @staticmethod
+    def _row(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def submit(self, kind: str, ticker: str) -> Tuple[Dict[str, Any], bool]:
+        """
+        Queue a job unless one is already queued or running for the same kind and ticker.
+        Returns (job, created).
+        """
+        def txn(conn):
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE kind = ? AND ticker = ? AND status IN (?, ?) ORDER BY created_at LIMIT 1",
+                (kind, ticker, *ACTIVE_STATUSES)
+            ).fetchone()
+            if row is not None:
+                return self._row(row), False
+            now = time.time()
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (id, kind, ticker, status, stage, created_at, updated_at) VALUES (?, ?, ?, 'queued', 'queued', ?, ?)",
+                (job_id, kind, ticker, now, now)
+            )
+            return self._row(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()), True
+        return self._transaction(txn)
+
+    def claim(self, kinds: List[str], owner: int) -> Optional[Dict[str, Any]]:
+        """
+        Atomically move the oldest queued job of one of these kinds to running, owned by this process.
+        Jobs already claimed max_attempts times (requeued after their worker died) are marked failed instead.
+        """
+        def txn(conn):
+            marks = ",".join("?" * len(kinds))
+            while True:
+                row = conn.execute(
+                    f"SELECT id, attempts FROM jobs WHERE status = 'queued' AND kind IN ({marks}) ORDER BY created_at LIMIT 1",
+                    tuple(kinds)
+                ).fetchone()
+                if row is None:
+                    return None
+                if not self.max_attempts or row["attempts"] < self.max_attempts:
+                    break
+                now = time.time()
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', stage = 'failed', owner = NULL, error = ?, "
+                    "finished_at = ?, updated_at = ? WHERE id = ?",
+                    (f"Gave up after {row['attempts']} attempts: the worker running it exited before it finished",
+                     now, now, row["id"])
+                )
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = 'running', owner = ?, attempts = attempts + 1, stage = 'started', "
+                "started_at = ?, updated_at = ? WHERE id = ?",
+                (owner, now, now, row["id"])
+            )
+            return self._row(conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+        return self._transaction(txn)
+
+    def update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"], default=str)
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._transaction(lambda conn: conn.execute(
+            f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id)
+        ))
+
+    def recover(self) -> int:
+        """
+        Requeue running jobs whose owning process is gone (crash or restart). Returns how many were requeued.
+        """
+        def txn(conn):
+            rows = conn.execute("SELECT id, owner FROM jobs WHERE status = 'running'").fetchall()
+            orphaned = [r["id"] for r in rows if not r["owner"] or not _pid_alive(r["owner"])]
+            for job_id in orphaned:
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', stage = 'requeued', owner = NULL, updated_at = ? WHERE id = ?",
+                    (time.time(), job_id)
+                )
+            return len(orphaned)
+        return self._transaction(txn)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._query("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return rows[0] if rows else None
+
+    def latest(self, kind: str, ticker: str) -> Optional[Dict[str, Any]]:
+        rows = self._query(
+            "SELECT * FROM jobs WHERE kind = ? AND ticker = ? ORDER BY created_at DESC LIMIT 1", (kind, ticker)
+        )
+        return rows[0] if rows else None
+
+    def list(self, ticker: str = None, status: str = None, limit: int = 50) -> List[Dict[str, Any]]:
+        clauses, params = [], []
+        if ticker:
+            clauses.append("ticker = ?")
+            params.append(ticker)
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query(f"SELECT * FROM jobs {where} ORDER BY created_at DESC LIMIT ?", (*params, limit))
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            conn = self._connect()
+            try:
+                return {r["status"]: r["n"] for r in conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")}
+            finally:
+                conn.close()
+
+JobHandler = Callable[[Dict[str, Any], Callable[[str, float], Awaitable[None]]], Awaitable[Any]]
+
+class JobRunner:
+    """
+    Bounded pool of background workers draining the job table.
+    Handlers are registered per job kind and receive (job, progress), where
+    await progress(stage, fraction) records how far along the job is.
+    Workers are bound to the event loop and process that started them, so a runner
+    created before a fork (or before a short-lived warm-up loop) restarts itself where it is used.
+    """
+    def __init__(self, store: JobStore, workers: int = 2, poll_seconds: float = 2.0):
+        self.store = store
+        self.num_workers = workers
+        self.poll_seconds = poll_seconds
+        self.handlers = {}
+        self._tasks = []
+        self._loop = None
+        self._pid = None
+        self._wakeup = None
+        self.completed = 0
+        self.failed = 0
+
+    def register(self, kind: str, handler: JobHandler):
+        self.handlers[kind] = handler
+
+    def ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._pid == os.getpid() and not all(t.done() for t in self._tasks):
+            return
+        self._loop = loop
+        self._pid = os.getpid()
+        self._wakeup = asyncio.Event()
+        requeued = self.store.recover()
+        if requeued:
+            print(f"Requeued {requeued} interrupted background jobs.")
+        self._tasks = [asyncio.ensure_future(self._work()) for _ in range(self.num_workers)]
+
+    async def submit(self, kind: str, ticker: str) -> Tuple[Dict[str, Any], bool]:
+        self.ensure_started()
+        job, created = await asyncio.to_thread(self.store.submit, kind, ticker)
+        if created:
+            self._wakeup.set()
+        return job, created
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def latest(self, kind: str, ticker: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.store.latest, kind, ticker)
+
+    async def list(self, ticker: str = None, status: str = None, limit: int = 50) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self.store.list, ticker, status, limit)
+
+    async def _work(self):
+        while True:
+            job = await asyncio.to_thread(self.store.claim, list(self.handlers), os.getpid())
+            if job is None:
+                # Jobs queued by other processes, or requeued ones, are picked up on the next poll
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Dict[str, Any]):
+        async def progress(stage: str, fraction: float):
+            await asyncio.to_thread(self.store.update, job["id"], stage=stage, progress=round(fraction, 3))
+
+        try:
+            result = await self.handlers[job["kind"]](job, progress)
+        except asyncio.CancelledError:
+            # Shutting down mid-job: hand it back so the next process to start picks it up, without using up an attempt
+            await asyncio.shield(asyncio.to_thread(
+                self.store.update, job["id"], status="queued", stage="requeued", owner=None, attempts=job["attempts"] - 1
+            ))
+            raise
+        except Exception as e:
+            self.failed += 1
+            print(f"Background job {job['kind']} for {job['ticker']} failed: {e}")
+            await asyncio.to_thread(
+                self.store.update, job["id"], status="failed", stage="failed", error=str(e), finished_at=time.time()
+            )
+        else:
+            self.completed += 1
+            await asyncio.to_thread(
+                self.store.update, job["id"], status="succeeded", stage="done", progress=1.0,
+                result=result, finished_at=time.time()
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.num_workers,
+            "active_workers": sum(1 for t in self._tasks if not t.done()),
+            "completed": self.completed,
+            "failed": self.failed,
+            "jobs": self.store.counts(),
+        }
+
+    async def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -1,61 +1,395 @@
 import pandas as pd
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator, Callable, List, Set, Tuple
 import asyncio
+import functools
+import os
+import time
 from data.finance_loader import FinanceLoader
+from nlp.doc_store import content_hash
+from nlp.inference import configure_threads
 from nlp.retriever import Retriever
 from model.features import FeatureEngineer
 from model.train import RiskModel
 from model.explainers import Explainer
 from data.sec_loader import SECLoader
 from data.ingest import ingest_filings
+from app.core.config import settings
+from app.services.executors import StageExecutor
+from app.services.singleflight import SingleFlight
+from app.services.cache import TTLCache
+from app.services.components import ComponentLoader
+from app.services.jobs import JobRunner, JobStore
+from app.core.metrics import metrics, time_stage, gauge_lines, EVENTS
 
 class RiskService:
-    def __init__(self):
-        self.finance_loader = FinanceLoader()
+    def __init__(self, finance_loader: FinanceLoader = None, sec_loader_factory: Callable[..., SECLoader] = None,
+                 index_path: str = None, jobs_db_path: str = None):
+        """
+        :param finance_loader: Market data source (defaults to yfinance).
+        :param sec_loader_factory: Builds the EDGAR loader for on-demand downloads (defaults to SECLoader).
+        :param index_path: FAISS index file for the retriever (defaults to settings.index_path).
+        :param jobs_db_path: SQLite job table for background ingests (defaults to settings.jobs_db_path).
+        """
+        self.finance_loader = finance_loader or FinanceLoader()
+        self.sec_loader_factory = sec_loader_factory or SECLoader
+        self.index_path = index_path or settings.index_path
         self.retriever = None
         self.risk_model = RiskModel()
         self.feature_engineer = FeatureEngineer()
         self.explainer = None
+        self.components = ComponentLoader()
+        self._init_task = None
+        self.executor = StageExecutor(
+            pool_sizes={"io": settings.io_workers, "cpu": settings.cpu_workers},
+            stage_limits=settings.stage_limits
+        )
+        # Coalesce concurrent requests for the same ticker into one computation
+        self.analysis_flight = SingleFlight("analysis")
+        self.ingest_flight = SingleFlight("on_demand_ingest")
+        # Versioned caches: market data and filing evidence expire independently,
+        # full responses live no longer than either of their inputs
+        cache_bounds = {"max_entries": settings.cache_max_entries, "max_bytes": settings.cache_max_bytes}
+        self.market_cache = TTLCache("market_data", settings.cache_market_ttl, **cache_bounds)
+        self.evidence_cache = TTLCache("evidence", settings.cache_evidence_ttl, **cache_bounds)
+        self.result_cache = TTLCache("analysis", min(settings.cache_market_ttl, settings.cache_evidence_ttl), **cache_bounds)
+        # Retriever caches: the evidence query per ticker is a fixed template, so its embedding and
+        # ranked chunks (versioned by the ticker's index generation) are reused across requests
+        self.query_embedding_cache = TTLCache("query_embedding", settings.cache_evidence_ttl, **cache_bounds)
+        self.retrieval_cache = TTLCache("retrieval", settings.cache_evidence_ttl, **cache_bounds)
+        # Cross-encoder scores per (query, chunk) pair never change, so they outlive index generations
+        self.rerank_cache = TTLCache("rerank", settings.cache_evidence_ttl, **cache_bounds)
+        # FinBERT scores of chunks indexed without one (ingested before scores were stored), by content hash
+        self.chunk_sentiment_cache = TTLCache("chunk_sentiment", settings.cache_evidence_ttl, **cache_bounds)
+        # Filings for uncovered tickers are downloaded and ingested by background jobs. The job table is
+        # opened on first use, so importing the service (scripts, benchmarks) does not create the database
+        self.jobs_db_path = jobs_db_path or settings.jobs_db_path
+        self._jobs = None
+        metrics.add_collector(self._collect_metrics)
         self.initialized = False
 
     async def initialize(self):
+        """
+        Load components concurrently. Returns once the critical ones (retriever, risk model,
+        FinBERT) are warm; the SHAP explainer and cross-encoder keep loading in the background.
+        """
         if self.initialized:
             return
         
-        print("Initializing Risk Service Components...")
-        
-        # Initialize Retriever (loads FAISS)
+        if self._init_task is None:
+            print("Initializing Risk Service Components...")
+            self._init_task = asyncio.ensure_future(self._start_components())
+
+        await asyncio.shield(self._init_task)
+        self.initialized = True
+
+    async def _start_components(self):
+        # PyTorch's thread count is process-wide, so it is set once, before any model loads, rather than by each
         try:
-            self.retriever = Retriever()
+            await asyncio.to_thread(configure_threads, settings.inference_threads)
         except Exception as e:
-            print(f"Warning: Could not load Retriever ({e}). RAG features may be limited.")
-        
-        # Load Risk Model
+            print(f"Warning: Could not set inference threads ({e}).")
+        self.components.start("retriever", self._load_retriever)
+        self.components.start("risk_model", self._load_risk_model)
+        self.components.start("sentiment", self._load_sentiment)
+        self.components.start("explainer", self._load_explainer, critical=False)
+        self.components.start("cross_encoder", self._load_cross_encoder, critical=False)
+        if settings.backfill_sentiment:
+            self.components.start("sentiment_backfill", self._backfill_sentiment, critical=False)
+        await self.components.wait_all(["retriever", "risk_model", "sentiment"])
+
+    @property
+    def jobs(self) -> JobRunner:
+        if self._jobs is None:
+            self._jobs = JobRunner(JobStore(self.jobs_db_path, settings.job_max_attempts),
+                                   workers=settings.job_workers)
+            self._jobs.register("ingest", self._run_ingest_job)
+        return self._jobs
+
+    def start_background_jobs(self):
+        """
+        Start the background job workers on the running event loop (once per process).
+        """
+        self.jobs.ensure_started()
+
+    async def warm_up(self):
+        """
+        Initialize and also wait for the background components, e.g. before forking workers that should share them.
+        """
+        await self.initialize()
+        await self.components.wait_all(list(self.components.components))
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "ready": self.components.is_ready(),
+            "components": self.components.status()
+        }
+
+    async def _load_retriever(self) -> Retriever:
+        # Initialize Retriever (loads FAISS and builds BM25)
+        retriever = await asyncio.to_thread(functools.partial(
+            Retriever, self.index_path, stage_timer=time_stage, mmap=settings.index_mmap,
+            index_type=settings.index_type, index_params=settings.index_params,
+            compact_segments=settings.compact_segments, compact_deleted=settings.compact_deleted,
+            query_cache=self.query_embedding_cache, result_cache=self.retrieval_cache, rerank_cache=self.rerank_cache,
+            rerank_top_n=settings.rerank_top_n, rerank_budget_ms=settings.rerank_budget_ms,
+            inference_backend=settings.inference_backend, inference_threads=settings.inference_threads
+        ))
+        retriever.add_ingest_listener(self._on_documents_ingested)
+        self.retriever = retriever
+        return retriever
+
+    async def _load_risk_model(self) -> RiskModel:
         try:
-            self.risk_model.load_model()
-        except:
+            await asyncio.to_thread(self.risk_model.load_model)
+        except Exception:
             print("Warning: Model not found. Creating synthetic model for demo.")
+            EVENTS.inc(event="fallback_synthetic_model")
             X, y = self.risk_model.create_synthetic_data()
-            self.risk_model.train(X, y)
-            
-        # Initialize Explainer
-        try:
-            self.explainer = Explainer(self.risk_model)
-        except Exception as e:
-            print(f"Warning: Could not initialize Explainer ({e}).")
-            
-        # Initialize Feature Engineer (loads FinBERT)
-        self.feature_engineer.load_model()
-            
-        self.initialized = True
+            await asyncio.to_thread(self.risk_model.train, X, y)
+        return self.risk_model
+
+    async def _load_sentiment(self) -> FeatureEngineer:
+        # Loads FinBERT; the feature engineer falls back to keyword scoring if it is unavailable
+        await asyncio.to_thread(self.feature_engineer.load_model, settings.inference_backend, settings.inference_threads)
+        analyzer = self.feature_engineer.sentiment_analyzer
+        if analyzer is None or not analyzer.loaded:
+            raise RuntimeError("FinBERT unavailable, using keyword scoring")
+        return self.feature_engineer
 
-    async def analyze(self, ticker: str, use_live_data: bool = True) -> Dict[str, Any]:
+    async def _load_explainer(self) -> Explainer:
+        # SHAP only needs the trained model, so it warms up behind it without blocking readiness
+        await self.components.wait("risk_model")
+        self.explainer = await asyncio.to_thread(Explainer, self.risk_model)
+        return self.explainer
+
+    async def _load_cross_encoder(self):
+        retriever = await self.components.wait("retriever")
+        if retriever is None:
+            raise RuntimeError("retriever unavailable")
+        await asyncio.to_thread(retriever.warm_cross_encoder)
+        if retriever.cross_encoder is None:
+            raise RuntimeError("re-ranking disabled")
+        return retriever.cross_encoder
+
+    async def _backfill_sentiment(self) -> int:
+        # Chunks indexed without a FinBERT score would otherwise be scored at query time, on every cache miss
+        retriever = await self.components.wait("retriever")
+        feature_engineer = await self.components.wait("sentiment")
+        if retriever is None or feature_engineer is None:
+            raise RuntimeError("retriever or FinBERT unavailable")
+        return await asyncio.to_thread(retriever.backfill_sentiment, feature_engineer.sentiment_analyzer.analyze_batch)
+
+    async def analyze(self, ticker: str, use_live_data: bool = True, bypass_cache: bool = False) -> Dict[str, Any]:
+        await self.initialize()
         ticker = ticker.upper()
+        with time_stage("analyze"):
+            if not bypass_cache:
+                cached = self.result_cache.get(self._result_key(ticker, use_live_data))
+                if cached is not None:
+                    return cached
+
+            return await self.analysis_flight.do(
+                (ticker, use_live_data, bypass_cache),
+                lambda: self._analyze(ticker, use_live_data, bypass_cache)
+            )
+
+    async def _analyze(self, ticker: str, use_live_data: bool, bypass_cache: bool) -> Dict[str, Any]:
+        fin_data, evidences, risk_score, evidence_meta = await self._gather_inputs(ticker, use_live_data, bypass_cache)
+
+        # 3. Feature Engineering
+        features_df = self.feature_engineer.build_feature_matrix([fin_data], [risk_score])
         
+        # 4-5. Predict Risk and Explainability
+        await self.components.wait("explainer")
+        pd_probs, shap_rows = await self.executor.run("scoring", self._score, features_df)
+
+        # 6. Construct Response
+        response = self._build_response(ticker, pd_probs[0], fin_data, evidences, shap_rows[0], evidence_meta)
+        self._cache_result(ticker, use_live_data, response)
+        return response
+
+    async def analyze_many(self, tickers: List[str], use_live_data: bool = True, bypass_cache: bool = False) -> List[Dict[str, Any]]:
+        """
+        Score a portfolio in one pass: inputs are fetched concurrently, then a single
+        N-row feature matrix goes through one predict and one SHAP call.
+        Returns one {"ticker", "result", "error"} entry per unique ticker, in request order.
+        """
+        await self.initialize()
+        tickers = list(dict.fromkeys(t.upper() for t in tickers))
+        items = {t: {"ticker": t, "result": None, "error": None} for t in tickers}
+
+        # Only tickers without a fresh cached result go through the pipeline
+        pending = []
+        for ticker in tickers:
+            cached = None if bypass_cache else self.result_cache.get(self._result_key(ticker, use_live_data))
+            if cached is not None:
+                items[ticker]["result"] = cached
+            else:
+                pending.append(ticker)
+
+        # 1-2. Fetch financials and evidences for every ticker concurrently,
+        # retrieving the evidences of all uncached tickers in one batched search
+        prefetched = await self._prefetch_evidences(pending, use_live_data, bypass_cache)
+        gathered = await asyncio.gather(
+            *(self._gather_inputs(t, use_live_data, bypass_cache, prefetched.get(t)) for t in pending),
+            return_exceptions=True
+        )
+
+        scored = []
+        for ticker, outcome in zip(pending, gathered):
+            if isinstance(outcome, Exception):
+                items[ticker]["error"] = str(outcome)
+            else:
+                scored.append((ticker, outcome))
+
+        if scored:
+            try:
+                # 3. One feature row per ticker
+                features_df = self.feature_engineer.build_feature_matrix(
+                    [fin_data for _, (fin_data, _, _, _) in scored],
+                    [risk_score for _, (_, _, risk_score, _) in scored]
+                )
+
+                # 4-5. Vectorized predict and SHAP over the whole matrix
+                await self.components.wait("explainer")
+                pd_probs, shap_rows = await self.executor.run("scoring", self._score, features_df)
+
+                for (ticker, (fin_data, evidences, _, evidence_meta)), pd_prob, shap_values in zip(scored, pd_probs, shap_rows):
+                    items[ticker]["result"] = self._build_response(ticker, pd_prob, fin_data, evidences, shap_values, evidence_meta)
+                    self._cache_result(ticker, use_live_data, items[ticker]["result"])
+            except Exception as e:
+                for ticker, _ in scored:
+                    items[ticker]["error"] = f"Error scoring portfolio: {str(e)}"
+
+        return [items[t] for t in tickers]
+
+    async def analyze_stream(self, ticker: str, use_live_data: bool = True, bypass_cache: bool = False) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Run the analysis pipeline and yield (event, payload) pairs as each stage completes:
+        financial_metrics, rag_evidences, probability_of_default, risk_factors, then done
+        with the full response. Market data and evidence retrieval race each other, so
+        whichever finishes first is sent first.
+        """
+        await self.initialize()
+        ticker = ticker.upper()
+        cached = None if bypass_cache else self.result_cache.get(self._result_key(ticker, use_live_data))
+        if cached is not None:
+            for event, payload in self._response_events(cached):
+                yield event, payload
+            return
+
+        fin_task = asyncio.ensure_future(self._fetch_financial_data(ticker, use_live_data, bypass_cache))
+        evidence_task = asyncio.ensure_future(self._stream_evidences(ticker, use_live_data, bypass_cache))
+        tasks = [fin_task, evidence_task]
+        try:
+            fin_data, evidences, risk_score = None, None, None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task is fin_task:
+                        fin_data = task.result()
+                        yield "financial_metrics", {"ticker": ticker, "financial_metrics": fin_data}
+                    elif task is evidence_task:
+                        evidences, combined_text, risk_score, evidence_meta = task.result()
+                        yield "rag_evidences", {"ticker": ticker, "rag_evidences": evidences, **evidence_meta}
+                        if risk_score is None:
+                            # FinBERT runs only after the evidences are already on the wire
+                            sentiment_task = asyncio.ensure_future(
+                                self._sentiment_score(ticker, use_live_data, evidences, combined_text, evidence_meta)
+                            )
+                            tasks.append(sentiment_task)
+                            pending.add(sentiment_task)
+                    else:
+                        risk_score = task.result()
+
+            features_df = self.feature_engineer.build_feature_matrix([fin_data], [risk_score])
+            pd_prob = (await self.executor.run("scoring", self._predict, features_df))[0]
+            yield "probability_of_default", {
+                "ticker": ticker,
+                "probability_of_default": float(pd_prob),
+                "risk_level": self._risk_level(pd_prob)
+            }
+
+            await self.components.wait("explainer")
+            shap_values = (await self.executor.run("scoring", self._explain, features_df))[0]
+            response = self._build_response(ticker, pd_prob, fin_data, evidences, shap_values, evidence_meta)
+            yield "risk_factors", {"ticker": ticker, "risk_factors": response["risk_factors"]}
+
+            self._cache_result(ticker, use_live_data, response)
+            yield "done", response
+        finally:
+            # Client went away or a stage failed: do not leave orphaned stage work behind
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def executor_stats(self) -> Dict[str, Any]:
+        return self.executor.stats()
+
+    def inflight_stats(self) -> Dict[str, Any]:
+        return {
+            flight.name: flight.stats()
+            for flight in (self.analysis_flight, self.ingest_flight)
+        }
+
+    def job_stats(self) -> Dict[str, Any]:
+        return self.jobs.stats()
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return {
+            "model_version": self.risk_model.version,
+            "index_generation": self.retriever.index_generation() if self.retriever else 0,
+            "caches": {
+                cache.name: cache.stats()
+                for cache in (self.result_cache, self.market_cache, self.evidence_cache,
+                              self.retrieval_cache, self.query_embedding_cache, self.rerank_cache,
+                              self.chunk_sentiment_cache)
+            },
+            "rerank": dict(self.retriever.rerank_counts) if self.retriever else {}
+        }
+
+    async def shutdown(self):
+        if self._jobs is not None:
+            await self._jobs.shutdown()
+        self.executor.shutdown()
+
+    async def _gather_inputs(self, ticker: str, use_live_data: bool, bypass_cache: bool = False,
+                             prefetched: List[str] = None) -> Tuple[Dict[str, Any], List[str], float, Dict[str, Any]]:
+        # Market data and evidence retrieval are independent, so run them side by side
+        fin_data, (evidences, risk_score, evidence_meta) = await asyncio.gather(
+            self._fetch_financial_data(ticker, use_live_data, bypass_cache),
+            self._score_evidences(ticker, use_live_data, bypass_cache, prefetched)
+        )
+        return fin_data, evidences, risk_score, evidence_meta
+
+    async def _prefetch_evidences(self, tickers: List[str], use_live_data: bool, bypass_cache: bool) -> Dict[str, List[str]]:
+        """
+        Retrieve evidences for every ticker without cached ones in a single Retriever.retrieve_batch call.
+        Tickers missing from the result (or coming back empty) fall back to the per-ticker path.
+        """
+        if not bypass_cache:
+            tickers = [t for t in tickers if self._evidence_key(t, use_live_data) not in self.evidence_cache]
+        if not self.retriever or len(tickers) < 2:
+            return {}
+        try:
+            results = await self.executor.run(
+                "retrieval", self.retriever.retrieve_batch, [self._evidence_query(t) for t in tickers],
+                top_k=3, filters=[{"ticker": t} for t in tickers]
+            )
+        except Exception as e:
+            print(f"RAG Error: {e}")
+            return {}
+        return {ticker: evidences for ticker, evidences in zip(tickers, results) if evidences}
+
+    async def _fetch_financial_data(self, ticker: str, use_live_data: bool, bypass_cache: bool = False) -> Dict[str, Any]:
         # 1. Fetch Financial Data
         try:
             if use_live_data:
-                fin_data = self.finance_loader.get_fundamental_data(ticker)
+                fin_data = None if bypass_cache else self.market_cache.get(ticker)
+                if fin_data is None:
+                    fin_data = await self.executor.run("market_data", self._get_fundamental_data, ticker)
+                    self.market_cache.put(ticker, fin_data, tags=[f"ticker:{ticker}"])
             else:
                 # Dummy data for default/offline testing
                 fin_data = {
@@ -68,63 +402,296 @@ class RiskService:
                 }
         except Exception as e:
             raise Exception(f"Error fetching financial data: {str(e)}")
+        return fin_data
+
+    async def _stream_evidences(self, ticker: str, use_live_data: bool, bypass_cache: bool) -> Tuple[List[str], str, Any, Dict[str, Any]]:
+        # Returns (evidences, combined_text, risk_score, evidence_meta); risk_score is None unless it came from the cache
+        if not bypass_cache:
+            cached = self.evidence_cache.get(self._evidence_key(ticker, use_live_data))
+            if cached is not None:
+                evidences, risk_score = cached
+                return evidences, " ".join(evidences), risk_score, self._evidence_meta("available")
+
+        evidences, combined_text, evidence_meta = await self._retrieve_evidences(ticker, use_live_data)
+        return evidences, combined_text, None, evidence_meta
 
+    async def _score_evidences(self, ticker: str, use_live_data: bool, bypass_cache: bool = False,
+                               prefetched: List[str] = None) -> Tuple[List[str], float, Dict[str, Any]]:
+        """
+        Retrieve evidences and their FinBERT risk score, cached per index generation of the ticker.
+        """
+        if not bypass_cache:
+            cached = self.evidence_cache.get(self._evidence_key(ticker, use_live_data))
+            if cached is not None:
+                evidences, risk_score = cached
+                return evidences, risk_score, self._evidence_meta("available")
+
+        evidences, combined_text, evidence_meta = await self._retrieve_evidences(ticker, use_live_data, prefetched)
+        risk_score = await self._sentiment_score(ticker, use_live_data, evidences, combined_text, evidence_meta)
+        return evidences, risk_score, evidence_meta
+
+    async def _sentiment_score(self, ticker: str, use_live_data: bool, evidences: List[str], combined_text: str,
+                               evidence_meta: Dict[str, Any]) -> float:
+        # Chunk scores are computed at ingest (or backfilled), so no model runs here: only placeholder
+        # evidence and, as a fallback, chunks indexed without a score are scored (and remembered) now
+        scores = [None] * len(evidences)
+        if self.retriever and evidences:
+            scores = await self.executor.run("retrieval", self.retriever.chunk_sentiments, evidences)
+        keys = [content_hash(text.encode("utf-8")) for text in evidences]
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing and evidence_meta["evidence_status"] == "available":
+            print(f"Warning: {len(missing)} chunks for {ticker} have no stored sentiment score; scoring them now "
+                  f"(run python data/ingest.py --backfill-sentiment).")
+            EVENTS.inc(event="fallback_unscored_chunks")
+        for i in missing:
+            scores[i] = self.chunk_sentiment_cache.get(keys[i])
+        if any(score is None for score in scores):
+            risk_score = await self.executor.run("sentiment", self._aggregate_sentiment, evidences, scores)
+            for i in missing:
+                self.chunk_sentiment_cache.put(keys[i], scores[i])
+        else:
+            risk_score = self.feature_engineer.aggregate_sentiment(evidences, scores)
+
+        # Only pin real filing evidence: a failed retrieval or a placeholder awaiting ingest must be retried
+        if evidences and evidence_meta["evidence_status"] == "available":
+            self.evidence_cache.put(self._evidence_key(ticker, use_live_data), (evidences, risk_score), tags=[f"ticker:{ticker}"])
+        return risk_score
+
+    def _evidence_query(self, ticker: str) -> str:
+        # Query for general risk
+        return f"Risk factors and default warnings for {ticker}"
+
+    async def _retrieve_evidences(self, ticker: str, use_live_data: bool, prefetched: List[str] = None) -> Tuple[List[str], str, Dict[str, Any]]:
         # 2. Retrieve Text Evidences (RAG)
+        evidence_meta = self._evidence_meta("available")
         try:
-            # Query for general risk
-            query = f"Risk factors and default warnings for {ticker}"
+            query = self._evidence_query(ticker)
             # Filter by ticker to ensure we don't get references for other companies
             filter_criteria = {"ticker": ticker}
-            evidences = self.retriever.retrieve(query, top_k=3, filter=filter_criteria) if self.retriever else []
+            evidences = []
+            if prefetched:
+                evidences = prefetched
+            elif self.retriever:
+                evidences = await self.executor.run("retrieval", self.retriever.retrieve, query, top_k=3, filter=filter_criteria)
             
             # Check if we have valid evidences, if not attempt to download
             if not evidences and self.retriever and use_live_data:
-                print(f"No documents found for {ticker}. Attempting on-demand retrieval...")
-                try:
-                    loader = SECLoader()
-                    downloaded_files = loader.fetch_company_filings(ticker, count=1)
-                    if downloaded_files:
-                        # Run ingestion in a separate thread to avoid blocking the event loop
-                        await asyncio.to_thread(ingest_filings, specific_files=downloaded_files, retriever_instance=self.retriever)
+                if settings.background_ingest:
+                    # Answer now with a provisional score; the filing is fetched by a background job
+                    evidence_meta = await self._request_ingest(ticker)
+                else:
+                    # Concurrent requests for the same uncovered ticker share one download and ingest
+                    ingested = await self.ingest_flight.do(ticker, lambda: self._ingest_on_demand(ticker, query, filter_criteria))
+                    if ingested:
                         # Retry retrieval
-                        evidences = self.retriever.retrieve(query, top_k=3, filter=filter_criteria)
-                except Exception as e:
-                    print(f"On-demand retrieval failed: {e}")
+                        evidences = await self.executor.run("retrieval", self.retriever.retrieve, query, top_k=3, filter=filter_criteria)
 
             # If no evidences found (empty vector store or download failed), use placeholder
             if not evidences:
+                EVENTS.inc(event="fallback_no_evidence")
                 evidences = [f"No specific documents found for {ticker}. Using general market risk assessment."]
+                if evidence_meta["evidence_status"] == "available":
+                    evidence_meta = self._evidence_meta("unavailable")
                 
             combined_text = " ".join(evidences)
         except Exception as e:
             print(f"RAG Error: {e}")
+            EVENTS.inc(event="fallback_rag_error")
             evidences = []
             combined_text = ""
+            evidence_meta = self._evidence_meta("unavailable")
+        return evidences, combined_text, evidence_meta
 
-        # 3. Feature Engineering
-        features_df = self.feature_engineer.combine_features(fin_data, combined_text)
-        
-        # 4. Predict Risk
-        pd_prob = self.risk_model.predict(features_df)
-        
-        # 5. Explainability
-        shap_values = {}
-        if self.explainer:
-            shap_values = self.explainer.explain_prediction(features_df)
-            # Convert float32 to float for JSON serialization
-            shap_values = {k: float(v) for k, v in shap_values.items()}
+    async def _request_ingest(self, ticker: str) -> Dict[str, Any]:
+        """
+        Make sure a background ingest is queued or running for the ticker, unless one failed recently.
+        """
+        latest = await self.jobs.latest("ingest", ticker)
+        if latest and latest["status"] == "failed" and time.time() - latest["finished_at"] < settings.job_retry_seconds:
+            return self._evidence_meta("unavailable", latest["id"])
+        job, created = await self.jobs.submit("ingest", ticker)
+        if created:
+            EVENTS.inc(event="ingest_job_queued")
+        return self._evidence_meta("pending", job["id"])
+
+    def _evidence_meta(self, status: str, job_id: str = None) -> Dict[str, Any]:
+        # available: filing excerpts; pending: a background ingest will provide them; unavailable: placeholder only
+        return {"evidence_status": status, "ingest_job_id": job_id}
+
+    async def ingest_ticker(self, ticker: str) -> Tuple[Dict[str, Any], bool]:
+        """
+        Queue a background download and ingest of the latest 10-K for a ticker. Returns (job, created).
+        """
+        return await self.jobs.submit("ingest", ticker.upper())
+
+    async def _run_ingest_job(self, job: Dict[str, Any], progress) -> Dict[str, Any]:
+        await self.initialize()
+        ticker = job["ticker"]
+        query = self._evidence_query(ticker)
+        await progress("checking_index", 0.05)
+        if await self.executor.run("retrieval", self.retriever.retrieve, query, top_k=1, filter={"ticker": ticker}):
+            return {"files": [], "already_indexed": True}
+
+        files = await self._download_and_ingest(ticker, progress)
+        if not files:
+            raise RuntimeError(f"No 10-K filings found for {ticker}")
+        return {"files": [os.path.basename(f) for f in files], "already_indexed": False}
+
+    async def _ingest_on_demand(self, ticker: str, query: str, filter_criteria: dict) -> bool:
+        """
+        Download and ingest the latest filing for a ticker. Returns True if documents are now available.
+        """
+        # A flight that finished just before this one may already have ingested the ticker
+        if await self.executor.run("retrieval", self.retriever.retrieve, query, top_k=1, filter=filter_criteria):
+            return True
+
+        print(f"No documents found for {ticker}. Attempting on-demand retrieval...")
+        try:
+            return bool(await self._download_and_ingest(ticker))
+        except Exception as e:
+            print(f"On-demand retrieval failed: {e}")
+        return False
+
+    async def _download_and_ingest(self, ticker: str, progress=None) -> List[str]:
+        # Latest 10-K from EDGAR into the index; returns the downloaded files (empty if there were none)
+        EVENTS.inc(event="on_demand_ingest")
+        if progress:
+            await progress("downloading", 0.1)
+        loader = self.sec_loader_factory(stage_timer=time_stage)
+        files = await self.executor.run("sec_download", loader.fetch_company_filings, ticker, count=1)
+        if files:
+            if progress:
+                await progress("ingesting", 0.5)
+            await self.executor.run("ingest", self._ingest_files, files)
+        return files or []
+
+    def _index_generation(self, ticker: str) -> int:
+        return self.retriever.index_generation(ticker) if self.retriever else 0
+
+    def _evidence_key(self, ticker: str, use_live_data: bool) -> Tuple:
+        return (ticker, use_live_data, self._index_generation(ticker))
+
+    def _result_key(self, ticker: str, use_live_data: bool) -> Tuple:
+        return (ticker, use_live_data, self.risk_model.version, self._index_generation(ticker))
+
+    def _cache_result(self, ticker: str, use_live_data: bool, response: Dict[str, Any]):
+        # Only scores built on real filing evidence are kept: a provisional one is replaced as soon as its ingest
+        # lands, and one built on placeholder evidence (retrieval or download failed) must be retried, not pinned
+        if use_live_data and response.get("evidence_status", "available") != "available":
+            return
+        self.result_cache.put(self._result_key(ticker, use_live_data), response, tags=[f"ticker:{ticker}"])
+
+    def _on_documents_ingested(self, tickers: Set[str]):
+        # New filings change the evidence (and therefore the score) for these tickers
+        for ticker in tickers:
+            self.evidence_cache.invalidate_tag(f"ticker:{ticker}")
+            self.result_cache.invalidate_tag(f"ticker:{ticker}")
+
+    def _score(self, features_df: pd.DataFrame) -> Tuple[List[float], List[Dict[str, float]]]:
+        return self._predict(features_df), self._explain(features_df)
+
+    def _predict(self, features_df: pd.DataFrame) -> List[float]:
+        with time_stage("predict"):
+            return list(self.risk_model.predict_many(features_df))
+
+    def _explain(self, features_df: pd.DataFrame) -> List[Dict[str, float]]:
+        if not self.explainer:
+            return [{} for _ in range(len(features_df))]
+        with time_stage("shap"):
+            return self.explainer.explain_many(features_df)
+
+    # Blocking stage bodies, run on the executor pools and timed individually
+
+    def _get_fundamental_data(self, ticker: str) -> Dict[str, Any]:
+        with time_stage("yfinance"):
+            return self.finance_loader.get_fundamental_data(ticker)
+
+    def _aggregate_sentiment(self, evidences: List[str], scores: List[float]) -> float:
+        # Scores the chunks whose score is None in place
+        if self.feature_engineer.sentiment_analyzer is None:
+            EVENTS.inc(event="fallback_keyword_sentiment")
+            with time_stage("keyword_sentiment"):
+                return self.feature_engineer.aggregate_sentiment(evidences, scores)
+        with time_stage("finbert"):
+            return self.feature_engineer.aggregate_sentiment(evidences, scores)
+
+    def _ingest_files(self, files: List[str]):
+        # New chunks get their FinBERT score at ingest, once the model is loaded (later ones are backfilled at query time)
+        analyzer = self.feature_engineer.sentiment_analyzer
+        scorer = analyzer.analyze_batch if analyzer is not None and analyzer.loaded else None
+        with time_stage("ingest"):
+            ingest_filings(specific_files=files, retriever_instance=self.retriever, scorer=scorer)
+
+    def _collect_metrics(self) -> List[str]:
+        # Counters owned by the caches and executor, read at scrape time
+        caches = [self.result_cache, self.market_cache, self.evidence_cache, self.retrieval_cache, self.query_embedding_cache,
+                  self.rerank_cache, self.chunk_sentiment_cache]
+        executor = self.executor.stats()
+        lines = []
+        lines += gauge_lines("risk_cache_hits_total", "Analysis cache hits.",
+                             [({"cache": c.name}, c.hits) for c in caches], "counter")
+        lines += gauge_lines("risk_cache_misses_total", "Analysis cache misses.",
+                             [({"cache": c.name}, c.misses) for c in caches], "counter")
+        lines += gauge_lines("risk_cache_evictions_total", "Analysis cache removals by reason.",
+                             [({"cache": c.name, "reason": reason}, getattr(c, reason))
+                              for c in caches for reason in ("expired", "evicted", "invalidated")], "counter")
+        lines += gauge_lines("risk_cache_entries", "Entries currently held per cache.",
+                             [({"cache": c.name}, c.stats()["entries"]) for c in caches])
+        lines += gauge_lines("risk_executor_queued", "Stage calls waiting for a concurrency slot.",
+                             [({"stage": name}, st["queued"]) for name, st in executor["stages"].items()])
+        lines += gauge_lines("risk_executor_running", "Stage calls currently running.",
+                             [({"stage": name}, st["running"]) for name, st in executor["stages"].items()])
+        lines += gauge_lines("risk_executor_pool_queue_depth", "Work submitted to a pool and not yet picked up.",
+                             [({"pool": name}, pool["queue_depth"]) for name, pool in executor["pools"].items()])
+        if self._jobs is not None:
+            lines += gauge_lines("risk_jobs", "Background jobs in the job table by status.",
+                                 [({"status": status}, n) for status, n in sorted(self._jobs.store.counts().items())])
+        lines += gauge_lines("risk_inflight_coalesced_total", "Callers that joined an in-flight computation.",
+                             [({"flight": name}, st["coalesced"]) for name, st in self.inflight_stats().items()], "counter")
+        if self.retriever:
+            lines += gauge_lines("risk_rerank_total", "Cross-encoder re-ranking outcomes (queries) and pair scores by source.",
+                                 [({"outcome": name}, n) for name, n in self.retriever.rerank_counts.items()], "counter")
+        return lines
+
+    def _build_response(self, ticker: str, pd_prob: float, fin_data: Dict[str, Any],
+                        evidences: List[str], shap_values: Dict[str, float], evidence_meta: Dict[str, Any]) -> Dict[str, Any]:
+        # Convert float32 to float for JSON serialization
+        shap_values = {k: float(v) for k, v in shap_values.items()}
+        pd_prob = float(pd_prob)
 
-        # 6. Construct Response
         response = {
             "ticker": ticker,
-            "probability_of_default": float(pd_prob),
-            "risk_level": "High" if pd_prob > 0.10 else "Low",
+            "probability_of_default": pd_prob,
+            "risk_level": self._risk_level(pd_prob),
             "financial_metrics": fin_data,
             "rag_evidences": evidences,
-            "risk_factors": shap_values
+            "risk_factors": shap_values,
+            **evidence_meta
         }
         
         return response
 
+    def _response_events(self, response: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+        ticker = response["ticker"]
+        return [
+            ("financial_metrics", {"ticker": ticker, "financial_metrics": response["financial_metrics"]}),
+            ("rag_evidences", {
+                "ticker": ticker,
+                "rag_evidences": response["rag_evidences"],
+                "evidence_status": response.get("evidence_status", "available"),
+                "ingest_job_id": response.get("ingest_job_id")
+            }),
+            ("probability_of_default", {
+                "ticker": ticker,
+                "probability_of_default": response["probability_of_default"],
+                "risk_level": response["risk_level"]
+            }),
+            ("risk_factors", {"ticker": ticker, "risk_factors": response["risk_factors"]}),
+            ("done", response),
+        ]
+
+    def _risk_level(self, pd_prob: float) -> str:
+        return "High" if pd_prob > 0.10 else "Low"
+
 # Singleton instance
 risk_service = RiskService()
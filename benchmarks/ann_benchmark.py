@@ -0,0 +1,160 @@
+"""
+Recall/latency benchmark for the VectorStore index types.
+
+Builds each index type at several corpus sizes and reports, per search setting, recall@k against
+exact (flat) search, batch QPS, single-query latency through VectorStore.search, build time and
+index size. Compressed types (sq_fp16, sq_int8, pq, ivf_pq) are also swept with and without the exact
+re-rank over their full vectors; store_recall is recall through VectorStore.search, re-rank included,
+and full_mb the full-precision vectors they keep on disk (memory-mapped, not resident). Vectors are synthetic clustered unit vectors shaped like MiniLM embeddings, or real
+vectors from an existing index (tiled with noise up to the requested size) with --from-index.
+
+Usage (from the project root):
+    python -m benchmarks.ann_benchmark --sizes 10000,100000 --output ann_bench.json
+    python -m benchmarks.ann_benchmark --from-index data/faiss_index.bin --sizes 5000,50000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import faiss
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nlp.vector_store import COMPRESSED_TYPES, INDEX_TYPES, VectorStore
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype("float32")
+
+def synthetic_vectors(n: int, dim: int, rng: np.random.RandomState, clusters: int = 200) -> np.ndarray:
+    # Filing chunks cluster by company and topic, which is what IVF and HNSW exploit
+    centers = rng.randn(clusters, dim)
+    assignment = rng.randint(0, clusters, size=n)
+    return _normalize(centers[assignment] + 0.35 * rng.randn(n, dim))
+
+def vectors_from_index(path: str, n: int, rng: np.random.RandomState) -> np.ndarray:
+    store = VectorStore(index_file=path)
+    store.load()
+    base = store.vectors()
+    if len(base) == 0:
+        raise ValueError(f"No vectors in {path}")
+    picks = base[rng.randint(0, len(base), size=n)]
+    return _normalize(picks + 0.02 * rng.randn(*picks.shape))
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / (k * len(truth))
+
+def sweep_for(index_type: str, args) -> List[Dict[str, int]]:
+    if index_type in ("ivf_flat", "ivf_pq"):
+        sweep = [{"nprobe": p} for p in args.nprobe]
+    elif index_type == "hnsw":
+        sweep = [{"ef_search": ef} for ef in args.ef_search]
+    else:
+        sweep = [{}]
+    if index_type in COMPRESSED_TYPES:
+        sweep = [{**params, "rerank": r} for params in sweep for r in args.rerank]
+    return sweep
+
+def bench_type(index_type: str, base: np.ndarray, queries: np.ndarray, truth: np.ndarray, args) -> List[Dict[str, Any]]:
+    store = VectorStore(dimension=base.shape[1], index_file=os.path.join(tempfile.gettempdir(), "ann_bench.bin"),
+                        index_type=index_type, index_params={"nlist": args.nlist, "hnsw_m": args.hnsw_m, "pq_m": args.pq_m})
+    start = time.perf_counter()
+    store.add_documents(base, [str(i) for i in range(len(base))])
+    # Added vectors sit in the flat tail until the base is (re)built
+    store.rebuild()
+    build_seconds = time.perf_counter() - start
+    size_mb = faiss.serialize_index(store.index).nbytes / (1024 * 1024)
+    full_mb = base.nbytes / (1024 * 1024) if index_type in COMPRESSED_TYPES else 0.0
+
+    rows = []
+    for params in sweep_for(index_type, args):
+        store.set_search_params(**params)
+        start = time.perf_counter()
+        _, found = store.index.search(queries, args.k)
+        batch_seconds = time.perf_counter() - start
+
+        # The service issues one query per request, through VectorStore.search
+        latencies, store_found = [], []
+        for q in queries[:args.single_queries]:
+            start = time.perf_counter()
+            hits = store.search(q, k=args.k)
+            latencies.append(time.perf_counter() - start)
+            store_found.append([int(text) for text, _ in hits] + [-1] * (args.k - len(hits)))
+
+        rows.append({
+            "type": index_type,
+            "params": params,
+            "recall_at_k": round(recall_at_k(found, truth), 4),
+            "store_recall": round(recall_at_k(np.array(store_found), truth[:len(store_found)]), 4),
+            "qps_batch": round(len(queries) / batch_seconds, 1),
+            "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+            "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 3),
+            "build_s": round(build_seconds, 2),
+            "index_mb": round(size_mb, 1),
+            "full_mb": round(full_mb, 1),
+        })
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall/latency benchmark for the VectorStore index types.")
+    parser.add_argument("--sizes", default="10000,50000,100000", help="Comma-separated corpus sizes")
+    parser.add_argument("--types", default=",".join(INDEX_TYPES))
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--from-index", help="Sample real vectors from this FAISS index instead of synthetic ones")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--single-queries", type=int, default=200, help="Queries timed one at a time")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=256)
+    parser.add_argument("--pq-m", type=int, default=48)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--nprobe", type=lambda v: [int(x) for x in v.split(",")], default=[1, 4, 16, 64])
+    parser.add_argument("--ef-search", type=lambda v: [int(x) for x in v.split(",")], default=[16, 64, 256])
+    parser.add_argument("--rerank", type=lambda v: [int(x) for x in v.split(",")], default=[0, 4],
+                        help="Re-rank factors swept for compressed types")
+    parser.add_argument("--threads", type=int, help="FAISS OpenMP threads (default: all cores)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+
+    if args.threads:
+        faiss.omp_set_num_threads(args.threads)
+    rng = np.random.RandomState(args.seed)
+    types = [t for t in args.types.split(",") if t]
+
+    report = {"k": args.k, "queries": args.queries, "source": args.from_index or "synthetic", "results": []}
+    print(f"{'size':>8} {'type':<9} {'params':<20} {'recall@k':>9} {'store':>6} {'qps':>10} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'build s':>8} {'MB':>8} {'full MB':>8}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        if args.from_index:
+            data = vectors_from_index(args.from_index, size + args.queries, rng)
+        else:
+            data = synthetic_vectors(size + args.queries, args.dim, rng)
+        base, queries = data[:size], data[size:]
+
+        exact = faiss.IndexFlatL2(base.shape[1])
+        exact.add(base)
+        _, truth = exact.search(queries, args.k)
+
+        for index_type in types:
+            for row in bench_type(index_type, base, queries, truth, args):
+                row["size"] = size
+                report["results"].append(row)
+                params = ",".join(f"{k}={v}" for k, v in row["params"].items()) or "-"
+                print(f"{size:>8} {index_type:<9} {params:<20} {row['recall_at_k']:>9.3f} {row['store_recall']:>6.3f} "
+                      f"{row['qps_batch']:>10.0f} {row['p50_ms']:>8.3f} {row['p99_ms']:>8.3f} {row['build_s']:>8.2f} "
+                      f"{row['index_mb']:>8.1f} {row['full_mb']:>8.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Report written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Latency/throughput benchmark for the CPU inference backends (see nlp.inference).
+
+Loads each model (the MiniLM embedder, the ms-marco cross-encoder and FinBERT) under each backend and reports
+single-input latency, batched throughput and load time, plus fidelity to the PyTorch backend's outputs on the
+same inputs: absolute score differences, the lowest embedding cosine similarity and the rank correlation of
+cross-encoder scores. Inputs are chunk texts sampled from an existing index (--from-index), or synthetic
+filing-like text when there is none.
+
+Usage (from the project root):
+    python -m benchmarks.inference_benchmark --threads 4 --output inference_bench.json
+    python -m benchmarks.inference_benchmark --models finbert --backends torch,int8 --samples 32
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nlp.inference import (INFERENCE_BACKENDS, compare_outputs, configure_threads, load_cross_encoder,
+                           load_sentence_transformer, load_sequence_classifier)
+
+MODELS = ("embedder", "cross_encoder", "finbert")
+MODEL_NAMES = {
+    "embedder": "all-MiniLM-L6-v2",
+    "cross_encoder": "cross-encoder/ms-marco-MiniLM-L-6-v2",
+    "finbert": "ProsusAI/finbert",
+}
+QUERY = "Risk factors and default warnings for ACME"
+
+def sample_texts(path: str, n: int, rng: np.random.RandomState) -> List[str]:
+    if path and os.path.exists(path):
+        from nlp.vector_store import VectorStore
+        store = VectorStore(index_file=path)
+        store.load()
+        if len(store.documents):
+            return [store.documents[int(i)] for i in rng.randint(0, len(store.documents), size=n)]
+    words = ("revenue liquidity covenant default litigation impairment going concern credit facility supply chain "
+             "customers margin debt maturity refinancing material weakness regulatory competition").split()
+    return [" ".join(rng.choice(words, 400)) for _ in range(n)]
+
+def loader_for(model: str, backend: str, threads: int) -> Callable[[], Callable[[List[str], int], np.ndarray]]:
+    """
+    A loader returning score(texts, batch_size): embeddings, cross-encoder scores or FinBERT risk scores.
+    """
+    name = MODEL_NAMES[model]
+    if model == "embedder":
+        def load():
+            encoder = load_sentence_transformer(name, backend, threads)
+            return lambda texts, batch_size: encoder.encode(texts, batch_size=batch_size)
+    elif model == "cross_encoder":
+        def load():
+            encoder = load_cross_encoder(name, backend, threads)
+            return lambda texts, batch_size: encoder.predict([[QUERY, t] for t in texts], batch_size=batch_size)
+    else:
+        def load():
+            from transformers import pipeline
+            tokenizer, classifier = load_sequence_classifier(name, backend, threads)
+            pipe = pipeline("text-classification", model=classifier, tokenizer=tokenizer, top_k=None)
+            def score(texts, batch_size):
+                # Same risk score as SentimentAnalyzer: P(negative) + 0.1 * P(neutral)
+                results = pipe(texts, batch_size=batch_size, truncation=True, max_length=512)
+                return np.array([sum(r["score"] * {"negative": 1.0, "neutral": 0.1}.get(r["label"], 0.0) for r in rows)
+                                 for rows in results])
+            return score
+    return load
+
+def bench(model: str, backend: str, texts: List[str], args) -> Dict[str, Any]:
+    start = time.perf_counter()
+    score = loader_for(model, backend, args.threads)()
+    load_seconds = time.perf_counter() - start
+    score(texts[:2], 2)  # warm up
+
+    latencies = []
+    for text in texts[:args.single]:
+        start = time.perf_counter()
+        score([text], 1)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    outputs = np.asarray(score(texts, args.batch_size))
+    batch_seconds = time.perf_counter() - start
+    return {
+        "model": model,
+        "backend": backend,
+        "load_s": round(load_seconds, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 2),
+        "items_per_s": round(len(texts) / batch_seconds, 1),
+        "outputs": outputs,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency/throughput benchmark for the CPU inference backends.")
+    parser.add_argument("--models", default=",".join(MODELS))
+    parser.add_argument("--backends", default=",".join(INFERENCE_BACKENDS))
+    parser.add_argument("--from-index", default="data/faiss_index.bin", help="Sample chunk texts from this index")
+    parser.add_argument("--samples", type=int, default=64, help="Texts scored in batches for throughput and fidelity")
+    parser.add_argument("--single", type=int, default=16, help="Texts timed one at a time")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads (default: one per core)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+    configure_threads(args.threads)
+
+    texts = sample_texts(args.from_index, args.samples, np.random.RandomState(args.seed))
+    backends = [b for b in args.backends.split(",") if b]
+    # Fidelity is measured against PyTorch, so it always runs first
+    backends = ["torch"] + [b for b in backends if b != "torch"]
+
+    report = {"threads": args.threads or os.cpu_count(), "samples": len(texts), "batch_size": args.batch_size,
+              "results": []}
+    print(f"{'model':<14} {'backend':<8} {'load s':>7} {'p50 ms':>8} {'p99 ms':>8} {'items/s':>9} {'max diff':>9} "
+          f"{'cosine':>7} {'spearman':>9}")
+    for model in (m for m in args.models.split(",") if m):
+        reference = None
+        for backend in backends:
+            try:
+                row = bench(model, backend, texts, args)
+            except Exception as e:
+                print(f"{model:<14} {backend:<8} unavailable: {e}")
+                continue
+            outputs = row.pop("outputs")
+            if backend == "torch":
+                reference = outputs
+            row["fidelity"] = compare_outputs(reference, outputs) if reference is not None else {}
+            report["results"].append(row)
+            fidelity = row["fidelity"]
+            print(f"{model:<14} {backend:<8} {row['load_s']:>7.2f} {row['p50_ms']:>8.2f} {row['p99_ms']:>8.2f} "
+                  f"{row['items_per_s']:>9.1f} {fidelity.get('max_abs_diff', float('nan')):>9.4f} {fidelity.get('min_cosine', float('nan')):>7.4f} "
+                  f"{fidelity.get('spearman', float('nan')):>9.4f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Report written to {args.output}")
+
+if __name__ == "__main__":
+    main()
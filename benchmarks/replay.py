@@ -0,0 +1,420 @@
+"""
+Offline replay benchmark for RiskService.
+
+Replays a JSONL request log against the service, either in-process or over HTTP, with yfinance
+and SEC EDGAR replaced by local stubs that inject configurable latency. Reports throughput,
+p50/p95/p99 latency overall, per endpoint and per pipeline stage, peak RSS, and the scores each
+ticker received, as a JSON document that can be diffed between commits.
+
+Log format, one JSON object per line (lines without a ticker are skipped):
+    {"ticker": "AAPL", "use_live_data": true}
+    {"ticker": "NVDA", "endpoint": "stream"}
+    {"tickers": ["AAPL", "MSFT"]}
+An optional "at" field (seconds from start) replays the log open-loop when --paced is given.
+
+Usage (from the project root):
+    python -m benchmarks.replay benchmarks/sample_requests.jsonl --concurrency 8 --output bench_output.txt
+    python -m benchmarks.replay benchmarks/sample_requests.jsonl --compare baseline.json
+    python -m benchmarks.replay benchmarks/sample_requests.jsonl --mode http --url http://127.0.0.1:8000 --server-pid 1234
+For HTTP mode, start the server with stubbed sources: uvicorn benchmarks.stub_app:app
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stubs import StubFinanceLoader, StubSECLoader
+
+STAGE_METRIC = "risk_stage_duration_seconds"
+_SAMPLE_RE = re.compile(r'^(\w+)(?:\{(.*)\})?\s+(\S+)$')
+_LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+def load_requests(path: str) -> List[Dict[str, Any]]:
+    """
+    Normalize log lines into {"endpoint", "payload", "at"} records.
+    """
+    requests_ = []
+    skipped = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            common = {
+                "use_live_data": entry.get("use_live_data", True),
+                "bypass_cache": entry.get("bypass_cache", False),
+            }
+            if entry.get("tickers"):
+                record = {"endpoint": "batch", "payload": {"tickers": entry["tickers"], **common}}
+            elif entry.get("ticker"):
+                endpoint = entry.get("endpoint", "analyze")
+                record = {"endpoint": endpoint, "payload": {"ticker": entry["ticker"], **common}}
+            else:
+                skipped += 1
+                continue
+            record["at"] = float(entry.get("at", 0.0))
+            requests_.append(record)
+
+    if skipped:
+        print(f"Skipped {skipped} log lines without a ticker.")
+    return requests_
+
+def prepare_index(index_path: str, workdir: str) -> str:
+    """
+    Copy the index and its sidecar files into workdir so on-demand ingests never touch the real store.
+    """
+    target = os.path.join(workdir, os.path.basename(index_path))
+    source_dir = os.path.dirname(index_path) or "."
+    base = os.path.basename(index_path)
+    if os.path.isdir(source_dir):
+        for name in os.listdir(source_dir):
+            if name.startswith(base):
+                source = os.path.join(source_dir, name)
+                if os.path.isdir(source):
+                    shutil.copytree(source, os.path.join(workdir, name))
+                else:
+                    shutil.copy2(source, os.path.join(workdir, name))
+    return target
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    arr = np.asarray(values)
+    return {
+        "count": len(values),
+        "mean_ms": round(float(arr.mean()) * 1000, 3),
+        "p50_ms": round(float(np.percentile(arr, 50)) * 1000, 3),
+        "p95_ms": round(float(np.percentile(arr, 95)) * 1000, 3),
+        "p99_ms": round(float(np.percentile(arr, 99)) * 1000, 3),
+        "max_ms": round(float(arr.max()) * 1000, 3),
+    }
+
+def parse_stage_histograms(text: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Extract per-stage bucket counts, sum, count and errors from Prometheus exposition text.
+    Outcomes are merged per stage; error observations are counted separately.
+    """
+    stages = {}
+    for line in text.splitlines():
+        match = _SAMPLE_RE.match(line)
+        if not match or not match.group(1).startswith(STAGE_METRIC):
+            continue
+        name, raw_labels, value = match.groups()
+        labels = dict(_LABEL_RE.findall(raw_labels or ""))
+        stage = stages.setdefault(labels.get("stage", ""), {"buckets": {}, "sum": 0.0, "count": 0.0, "errors": 0.0})
+        value = float(value)
+        if name == STAGE_METRIC + "_bucket":
+            bound = float("inf") if labels["le"] == "+Inf" else float(labels["le"])
+            stage["buckets"][bound] = stage["buckets"].get(bound, 0.0) + value
+        elif name == STAGE_METRIC + "_sum":
+            stage["sum"] += value
+        elif name == STAGE_METRIC + "_count":
+            stage["count"] += value
+            if labels.get("outcome") == "error":
+                stage["errors"] += value
+    return stages
+
+def histogram_quantile(q: float, buckets: List[Tuple[float, float]]) -> float:
+    """
+    Estimate a quantile from cumulative (upper_bound, count) buckets, interpolating linearly within a bucket.
+    """
+    total = buckets[-1][1] if buckets else 0
+    if total <= 0:
+        return 0.0
+    rank = q * total
+    lower_bound, lower_count = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == float("inf"):
+                return lower_bound
+            if count == lower_count:
+                return bound
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / (count - lower_count)
+        lower_bound, lower_count = bound, count
+    return lower_bound
+
+def stage_report(before: str, after: str) -> Dict[str, Dict[str, float]]:
+    """
+    Per-stage latency over the replay window, from the difference of two metric scrapes.
+    """
+    start, end = parse_stage_histograms(before), parse_stage_histograms(after)
+    report = {}
+    for stage, data in sorted(end.items()):
+        base = start.get(stage, {"buckets": {}, "sum": 0.0, "count": 0.0, "errors": 0.0})
+        count = data["count"] - base["count"]
+        if count <= 0:
+            continue
+        buckets = sorted((bound, c - base["buckets"].get(bound, 0.0)) for bound, c in data["buckets"].items())
+        report[stage] = {
+            "count": int(count),
+            "errors": int(data["errors"] - base["errors"]),
+            "mean_ms": round((data["sum"] - base["sum"]) / count * 1000, 3),
+            "p50_ms": round(histogram_quantile(0.50, buckets) * 1000, 3),
+            "p95_ms": round(histogram_quantile(0.95, buckets) * 1000, 3),
+            "p99_ms": round(histogram_quantile(0.99, buckets) * 1000, 3),
+        }
+    return report
+
+def peak_rss_mb(pid: int = None) -> float:
+    if pid:
+        # VmHWM is the resident set high-water mark of another process (Linux only)
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+        return 0.0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def _scores(endpoint: str, body: Dict[str, Any]) -> Dict[str, float]:
+    if endpoint == "batch":
+        return {
+            item["ticker"]: round(item["result"]["probability_of_default"], 6)
+            for item in body.get("results", []) if item.get("result")
+        }
+    if "probability_of_default" in body:
+        return {body["ticker"]: round(body["probability_of_default"], 6)}
+    return {}
+
+async def _replay(requests_: List[Dict[str, Any]], send, concurrency: int, paced: bool) -> List[Dict[str, Any]]:
+    semaphore = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+
+    async def one(record):
+        if paced:
+            await asyncio.sleep(max(0.0, record["at"] - (time.perf_counter() - start)))
+        async with semaphore:
+            sent = time.perf_counter()
+            outcome = {"endpoint": record["endpoint"], "ok": True, "error": None, "scores": {}, "first_byte": None}
+            try:
+                body, first_byte = await send(record["endpoint"], record["payload"])
+                outcome["scores"] = _scores(record["endpoint"], body)
+                outcome["first_byte"] = first_byte - sent if first_byte else None
+            except Exception as e:
+                outcome["ok"] = False
+                outcome["error"] = str(e)
+            outcome["latency"] = time.perf_counter() - sent
+            return outcome
+
+    return await asyncio.gather(*(one(r) for r in requests_))
+
+def _inprocess_sender(service):
+    async def send(endpoint: str, payload: Dict[str, Any]):
+        if endpoint == "batch":
+            results = await service.analyze_many(payload["tickers"], payload["use_live_data"], payload["bypass_cache"])
+            return {"results": results}, None
+        if endpoint == "stream":
+            first_byte, body = None, {}
+            async for event, data in service.analyze_stream(payload["ticker"], payload["use_live_data"], payload["bypass_cache"]):
+                first_byte = first_byte or time.perf_counter()
+                if event == "done":
+                    body = data
+            return body, first_byte
+        return await service.analyze(payload["ticker"], payload["use_live_data"], payload["bypass_cache"]), None
+    return send
+
+def _http_sender(url: str, timeout: float):
+    import requests
+    session = requests.Session()
+    paths = {"analyze": "/analyze", "batch": "/analyze/batch", "stream": "/analyze/stream"}
+
+    def post(endpoint: str, payload: Dict[str, Any]):
+        response = session.post(url + paths[endpoint], json=payload, timeout=timeout, stream=endpoint == "stream")
+        response.raise_for_status()
+        if endpoint != "stream":
+            return response.json(), None
+
+        first_byte, body, event = None, {}, None
+        for line in response.iter_lines(decode_unicode=True):
+            first_byte = first_byte or time.perf_counter()
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: ") and event == "error":
+                raise RuntimeError(json.loads(line[6:]).get("detail"))
+            elif line.startswith("data: ") and event == "done":
+                body = json.loads(line[6:])
+        return body, first_byte
+
+    async def send(endpoint: str, payload: Dict[str, Any]):
+        return await asyncio.to_thread(post, endpoint, payload)
+    return send
+
+def summarize(outcomes: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    ok = [o for o in outcomes if o["ok"]]
+    summary = {
+        "requests": len(outcomes),
+        "errors": len(outcomes) - len(ok),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(outcomes) / elapsed, 3) if elapsed else 0.0,
+        "overall": percentiles([o["latency"] for o in ok]),
+        "endpoints": {},
+    }
+    for endpoint in sorted({o["endpoint"] for o in outcomes}):
+        summary["endpoints"][endpoint] = percentiles([o["latency"] for o in ok if o["endpoint"] == endpoint])
+        first_bytes = [o["first_byte"] for o in ok if o["endpoint"] == endpoint and o["first_byte"] is not None]
+        if first_bytes:
+            summary["endpoints"][endpoint]["ttfb"] = percentiles(first_bytes)
+
+    # Last score seen per ticker: a change here between commits is a behaviour change, not noise
+    scores = {}
+    for o in ok:
+        scores.update(o["scores"])
+    summary["scores"] = dict(sorted(scores.items()))
+    summary["error_samples"] = sorted({o["error"] for o in outcomes if o["error"]})[:10]
+    return summary
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]):
+    """
+    Print latency deltas against a previous run and list tickers whose score changed.
+    """
+    def row(name, cur, base):
+        if not cur or not base or not base.get("p50_ms"):
+            return
+        deltas = []
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            change = (cur.get(key, 0) - base.get(key, 0)) / base[key] * 100 if base.get(key) else 0.0
+            deltas.append(f"{cur.get(key, 0):>10.1f} ({change:+6.1f}%)")
+        print(f"{name:<24} " + " ".join(deltas))
+
+    print(f"\n{'vs baseline':<24} {'p50 ms':>19} {'p95 ms':>19} {'p99 ms':>19}")
+    row("overall", current["overall"], baseline.get("overall"))
+    for endpoint, stats in current["endpoints"].items():
+        row(f"endpoint:{endpoint}", stats, baseline.get("endpoints", {}).get(endpoint))
+    for stage, stats in current["stages"].items():
+        row(f"stage:{stage}", stats, baseline.get("stages", {}).get(stage))
+
+    base_tp = baseline.get("throughput_rps") or 0
+    if base_tp:
+        print(f"throughput_rps {current['throughput_rps']:.2f} ({(current['throughput_rps'] - base_tp) / base_tp * 100:+.1f}%)")
+    changed = {
+        t: (baseline.get("scores", {}).get(t), s)
+        for t, s in current["scores"].items() if baseline.get("scores", {}).get(t) not in (None, s)
+    }
+    if changed:
+        print(f"Scores changed for {len(changed)} tickers: {changed}")
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return "unknown"
+
+async def run_inprocess(args, requests_: List[Dict[str, Any]]) -> Dict[str, Any]:
+    from app.services.risk_service import RiskService
+    from app.core.metrics import metrics
+    from app.core.config import settings
+
+    settings.background_ingest = not args.inline_ingest
+
+    workdir = tempfile.mkdtemp(prefix="risk-bench-")
+    try:
+        filings_dir = os.path.join(workdir, "filings")
+        service = RiskService(
+            finance_loader=StubFinanceLoader(args.market_latency_ms, args.market_jitter_ms, args.seed),
+            sec_loader_factory=functools.partial(
+                StubSECLoader, filings_dir, args.sec_latency_ms, args.sec_jitter_ms, args.filing_words, args.seed
+            ),
+            index_path=prepare_index(args.index_path, workdir),
+            jobs_db_path=os.path.join(workdir, "jobs.db"),
+        )
+
+        init_start = time.perf_counter()
+        await service.initialize()
+        init_seconds = time.perf_counter() - init_start
+
+        before = metrics.render()
+        start = time.perf_counter()
+        outcomes = await _replay(requests_, _inprocess_sender(service), args.concurrency, args.paced)
+        elapsed = time.perf_counter() - start
+        after = metrics.render()
+        await service.shutdown()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = summarize(outcomes, elapsed)
+    summary["initialize_s"] = round(init_seconds, 3)
+    summary["stages"] = stage_report(before, after)
+    summary["peak_rss_mb"] = peak_rss_mb()
+    return summary
+
+async def run_http(args, requests_: List[Dict[str, Any]]) -> Dict[str, Any]:
+    import requests
+    url = args.url.rstrip("/")
+    before = requests.get(url + "/metrics", timeout=args.timeout).text
+
+    start = time.perf_counter()
+    outcomes = await _replay(requests_, _http_sender(url, args.timeout), args.concurrency, args.paced)
+    elapsed = time.perf_counter() - start
+
+    after = requests.get(url + "/metrics", timeout=args.timeout).text
+    summary = summarize(outcomes, elapsed)
+    summary["stages"] = stage_report(before, after)
+    summary["peak_rss_mb"] = peak_rss_mb(args.server_pid) if args.server_pid else None
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a request log against RiskService with stubbed network sources.")
+    parser.add_argument("log", help="JSONL request log")
+    parser.add_argument("--mode", choices=["inprocess", "http"], default="inprocess")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Server URL for --mode http")
+    parser.add_argument("--server-pid", type=int, help="Server PID, to report its peak RSS in --mode http")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=1, help="Replay the log this many times")
+    parser.add_argument("--paced", action="store_true", help="Honour per-line 'at' offsets (open-loop replay)")
+    parser.add_argument("--bypass-cache", action="store_true", help="Force bypass_cache on every request")
+    parser.add_argument("--inline-ingest", action="store_true",
+                        help="Download and ingest uncovered tickers inside the request instead of as background jobs")
+    parser.add_argument("--index-path", default="data/faiss_index.bin", help="Index to copy into the scratch workspace")
+    parser.add_argument("--market-latency-ms", type=float, default=150.0)
+    parser.add_argument("--market-jitter-ms", type=float, default=50.0)
+    parser.add_argument("--sec-latency-ms", type=float, default=300.0)
+    parser.add_argument("--sec-jitter-ms", type=float, default=100.0)
+    parser.add_argument("--filing-words", type=int, default=20000, help="Size of each synthetic 10-K")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--compare", help="Previous JSON report to diff against")
+    args = parser.parse_args()
+
+    requests_ = load_requests(args.log) * args.repeat
+    if args.bypass_cache:
+        for record in requests_:
+            record["payload"]["bypass_cache"] = True
+    print(f"Replaying {len(requests_)} requests ({args.mode}, concurrency {args.concurrency})...")
+
+    runner = run_http if args.mode == "http" else run_inprocess
+    summary = asyncio.run(runner(args, requests_))
+    summary["config"] = {
+        "commit": _git_commit(),
+        "log": os.path.basename(args.log),
+        **{k: v for k, v in vars(args).items() if k not in ("log", "output", "compare", "url", "server_pid")},
+    }
+
+    report = json.dumps(summary, indent=2, sort_keys=True)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+        print(f"Report written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(summary, json.load(f))
+
+if __name__ == "__main__":
+    main()
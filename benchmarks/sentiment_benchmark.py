@@ -0,0 +1,123 @@
+"""
+FinBERT scoring benchmark over long 10-K sections: SentimentAnalyzer.analyze / analyze_batch against the
+previous per-chunk pipeline path (tokenize, decode each window back to text, one pipeline call per window).
+
+Sections are cut from the filings in --data-dir (HTML, cleaned as at ingest) or, with none there, from
+chunk texts of an existing index joined end to end. Reports seconds per section and windows per second
+for each batch size, and the largest difference from the previous path's scores, which re-tokenizes the
+decoded windows and truncates them to 2000 characters.
+
+Usage (from the project root):
+    python -m benchmarks.sentiment_benchmark --sections 20 --section-words 4000 --batch-sizes 1,8,16
+    python -m benchmarks.sentiment_benchmark --backend int8 --threads 4 --output sentiment_bench.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import List
+
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nlp.inference import configure_threads
+from nlp.sentiment import SentimentAnalyzer
+
+def load_sections(data_dir: str, index_path: str, n: int, words: int) -> List[str]:
+    texts = []
+    if os.path.isdir(data_dir):
+        from data.ingest import clean_text
+        for filename in sorted(os.listdir(data_dir)):
+            if filename.endswith((".htm", ".html")):
+                with open(os.path.join(data_dir, filename), "rb") as f:
+                    texts.append(clean_text(f.read().decode("utf-8")))
+    elif os.path.exists(index_path):
+        from nlp.vector_store import VectorStore
+        store = VectorStore(index_file=index_path)
+        store.load()
+        # Chunks carry a "Source: <file> | " label and overlap by 50 words; both are fine for timing
+        texts.append(" ".join(text.split(" | ", 1)[-1] for text in store.documents))
+    tokens = " ".join(texts).split()
+    if not tokens:
+        raise SystemExit(f"No filings in {data_dir} and no index at {index_path}")
+    return [" ".join(tokens[i:i + words]) for i in range(0, len(tokens), words)][:n]
+
+def legacy_analyze(analyzer: SentimentAnalyzer, pipe, text: str) -> float:
+    # SentimentAnalyzer.analyze before windows were scored as token batches, through a text-classification pipeline
+    def predict(chunk):
+        results = pipe([chunk[:2000]])[0]
+        scores = {r["label"]: r["score"] for r in results}
+        return scores.get("negative", 0.0) + 0.1 * scores.get("neutral", 0.0)
+
+    input_ids = analyzer.tokenizer(text, return_tensors="pt", truncation=False, padding=False)["input_ids"][0]
+    if len(input_ids) <= analyzer.max_len:
+        return predict(text)
+    chunks = []
+    for i in range(0, len(input_ids), 256):
+        chunk_ids = input_ids[i:i + 510]
+        if len(chunk_ids) < 10:
+            break
+        chunks.append(analyzer.tokenizer.decode(chunk_ids, skip_special_tokens=True))
+    return float(np.mean([predict(chunk) for chunk in chunks])) if chunks else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description="FinBERT scoring benchmark over long 10-K sections.")
+    parser.add_argument("--data-dir", default="data/filings")
+    parser.add_argument("--from-index", default="data/faiss_index.bin")
+    parser.add_argument("--sections", type=int, default=10)
+    parser.add_argument("--section-words", type=int, default=3000)
+    parser.add_argument("--batch-sizes", type=lambda v: [int(x) for x in v.split(",")], default=[1, 8, 16])
+    parser.add_argument("--backend", default="torch", help="Inference backend (see nlp.inference)")
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads (default: one per core)")
+    parser.add_argument("--skip-legacy", action="store_true", help="Do not time the previous per-chunk path")
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+    configure_threads(args.threads)
+
+    sections = load_sections(args.data_dir, args.from_index, args.sections, args.section_words)
+    analyzer = SentimentAnalyzer(backend=args.backend, threads=args.threads)
+    if not analyzer.loaded:
+        raise SystemExit("FinBERT unavailable")
+    token_ids = analyzer.tokenizer(sections, add_special_tokens=False)["input_ids"]
+    windows = sum(len(analyzer._windows(ids)) for ids in token_ids)
+    analyzer.analyze(sections[0][:2000])  # warm up
+
+    report = {"backend": args.backend, "threads": args.threads or os.cpu_count(), "sections": len(sections),
+              "tokens": sum(len(ids) for ids in token_ids), "windows": windows, "results": []}
+    print(f"{len(sections)} sections, {report['tokens']} tokens, {windows} windows")
+    print(f"{'path':<16} {'s/section':>10} {'windows/s':>10} {'max diff':>9}")
+
+    reference = None
+    if not args.skip_legacy:
+        from transformers import pipeline
+        pipe = pipeline("text-classification", model=analyzer.model, tokenizer=analyzer.tokenizer, top_k=None)
+        start = time.perf_counter()
+        reference = np.array([legacy_analyze(analyzer, pipe, text) for text in sections])
+        seconds = time.perf_counter() - start
+        report["results"].append({"path": "legacy", "s_per_section": seconds / len(sections),
+                                  "windows_per_s": windows / seconds})
+        print(f"{'legacy':<16} {seconds / len(sections):>10.3f} {windows / seconds:>10.1f} {'-':>9}")
+
+    for batch_size in args.batch_sizes:
+        analyzer.batch_size = batch_size
+        for path, score in (("analyze", lambda: [analyzer.analyze(text) for text in sections]),
+                            ("analyze_batch", lambda: analyzer.analyze_batch(sections))):
+            start = time.perf_counter()
+            scores = np.array(score())
+            seconds = time.perf_counter() - start
+            diff = float(np.abs(scores - reference).max()) if reference is not None else None
+            report["results"].append({"path": path, "batch_size": batch_size, "s_per_section": seconds / len(sections),
+                                      "windows_per_s": windows / seconds, "max_diff_vs_legacy": diff})
+            print(f"{f'{path} b={batch_size}':<16} {seconds / len(sections):>10.3f} {windows / seconds:>10.1f} "
+                  f"{diff if diff is not None else float('nan'):>9.4f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Report written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+The production FastAPI app with yfinance and SEC EDGAR swapped for latency-injecting stubs,
+for replaying request logs over HTTP without touching the network:
+
+    BENCH_MARKET_LATENCY_MS=150 BENCH_SEC_LATENCY_MS=300 uvicorn benchmarks.stub_app:app
+    python -m benchmarks.replay benchmarks/sample_requests.jsonl --mode http --server-pid <pid>
+
+Filings downloaded on demand go to a scratch directory, but they are still ingested into the
+configured index (RISK_INDEX_PATH), so point it at a copy of the index.
+"""
+import functools
+import os
+import sys
+import tempfile
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.main import app
+from app.services.risk_service import risk_service
+from benchmarks.stubs import StubFinanceLoader, StubSECLoader
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+_seed = int(os.getenv("BENCH_SEED", "0"))
+risk_service.finance_loader = StubFinanceLoader(
+    _env_float("BENCH_MARKET_LATENCY_MS", 150.0), _env_float("BENCH_MARKET_JITTER_MS", 50.0), _seed
+)
+risk_service.sec_loader_factory = functools.partial(
+    StubSECLoader,
+    tempfile.mkdtemp(prefix="risk-bench-filings-"),
+    _env_float("BENCH_SEC_LATENCY_MS", 300.0),
+    _env_float("BENCH_SEC_JITTER_MS", 100.0),
+    int(os.getenv("BENCH_FILING_WORDS", "20000")),
+    _seed,
+)
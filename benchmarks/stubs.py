@@ -0,0 +1,110 @@
+import hashlib
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from data.sec_loader import SECLoader
+
+# Sentences used to synthesize 10-K style text; mixes boilerplate with the distress language the models react to
+_RISK_SENTENCES = [
+    "Our business is subject to risks arising from global economic conditions.",
+    "We may be unable to refinance our indebtedness on acceptable terms.",
+    "A material weakness in internal control over financial reporting could adversely affect us.",
+    "We are party to litigation and regulatory investigations that could result in substantial costs.",
+    "Substantial doubt exists about our ability to continue as a going concern.",
+    "Fluctuations in foreign currency exchange rates may reduce our reported revenue.",
+    "Our credit facility contains covenants that restrict our operating flexibility.",
+    "Competition in our markets is intense and may reduce our margins.",
+    "Supply chain disruptions could delay shipments and increase our costs.",
+    "We may be required to record impairment charges on goodwill and intangible assets.",
+    "Cybersecurity incidents could disrupt operations and damage our reputation.",
+    "Changes in tax law could adversely affect our effective tax rate.",
+]
+
+def _seed(ticker: str) -> int:
+    return int(hashlib.md5(ticker.encode()).hexdigest()[:8], 16)
+
+class _Latency:
+    """
+    Injected latency: fixed base plus uniform jitter, drawn from a seeded RNG so runs are repeatable.
+    """
+    def __init__(self, latency_ms: float, jitter_ms: float, seed: int):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sleep(self):
+        with self._lock:
+            jitter = self._rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0
+        time.sleep((self.latency_ms + jitter) / 1000.0)
+
+class StubFinanceLoader:
+    """
+    Stand-in for FinanceLoader: deterministic fundamentals per ticker, no network.
+    """
+    def __init__(self, latency_ms: float = 150.0, jitter_ms: float = 50.0, seed: int = 0):
+        self.latency = _Latency(latency_ms, jitter_ms, seed)
+        self.calls = 0
+
+    def get_fundamental_data(self, ticker: str) -> Dict[str, Any]:
+        self.calls += 1
+        self.latency.sleep()
+        rng = random.Random(_seed(ticker))
+        return {
+            "ticker": ticker,
+            "current_price": round(rng.uniform(5, 500), 2),
+            "debt_to_equity": round(rng.lognormvariate(0, 0.6), 3),
+            "quick_ratio": round(rng.lognormvariate(0, 0.4), 3),
+            "current_ratio": round(rng.lognormvariate(0.2, 0.4), 3),
+            "return_on_equity": round(rng.gauss(0.08, 0.12), 3),
+            "free_cashflow": round(rng.gauss(1e8, 2e8), 0),
+            "market_cap": round(rng.uniform(1e8, 3e12), 0),
+            "sector": "Synthetic",
+            "beta": round(rng.lognormvariate(0, 0.3), 3),
+        }
+
+class StubSECLoader(SECLoader):
+    """
+    Stand-in for SEC EDGAR: every EDGAR call sleeps for the injected latency and
+    "downloads" a synthetic 10-K written to download_dir.
+    """
+    def __init__(self, download_dir: str, latency_ms: float = 300.0, jitter_ms: float = 100.0,
+                 words_per_filing: int = 20000, seed: int = 0, stage_timer=None):
+        super().__init__(download_dir=download_dir, stage_timer=stage_timer)
+        self.latency = _Latency(latency_ms, jitter_ms, seed)
+        self.words_per_filing = words_per_filing
+
+    def get_cik(self, ticker: str) -> Optional[str]:
+        with self.stage_timer("cik_lookup"):
+            self.latency.sleep()
+        return str(_seed(ticker.upper()) % 10**10).zfill(10)
+
+    def list_filings(self, cik: str, filing_type: str = "10-K", limit: int = 5) -> List[dict]:
+        with self.stage_timer("filing_list"):
+            self.latency.sleep()
+        return [{
+            "accessionNumber": f"0000000000-26-{i:06d}",
+            "filingDate": f"2026-0{i + 1}-15",
+            "reportDate": "2025-12-31",
+            "form": filing_type,
+            "primaryDocument": f"stub-{cik}-{i}.htm",
+        } for i in range(limit)]
+
+    def download_filing(self, cik: str, accession_number: str, primary_document: str, save_name: str):
+        with self.stage_timer("filing_download"):
+            self.latency.sleep()
+            rng = random.Random(_seed(save_name))
+            ticker = save_name.split("_")[0]
+            words = []
+            while len(words) < self.words_per_filing:
+                words.extend(f"{ticker} {rng.choice(_RISK_SENTENCES)}".split())
+            paragraphs = [" ".join(words[i:i + 120]) for i in range(0, len(words), 120)]
+            html = "<html><body>" + "".join(f"<p>{p}</p>" for p in paragraphs) + "</body></html>"
+
+            file_path = os.path.join(self.download_dir, save_name)
+            with open(file_path, "w", encoding="utf-8") as f:
+                f.write(html)
+        return file_path
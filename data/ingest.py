@@ -1,3 +1,6 @@
+import argparse
+import hashlib
+import json
 import os
 import sys
 from bs4 import BeautifulSoup
@@ -35,36 +38,120 @@ def chunk_text(text, chunk_size=500, overlap=50):
             chunks.append(chunk)
     return chunks
 
-def ingest_filings(data_dir="data/filings", specific_files=None, retriever_instance=None):
-    if retriever_instance:
-        retriever = retriever_instance
-    else:
-        retriever = Retriever()
+def parse_filing_name(filename):
+    """
+    (ticker, form, filing date) from a filing name like AAPL_10-K_2025-10-31.htm, or None for other names.
+    Amendments (10-K-A, saved from form 10-K/A) report the form they amend, so that they supersede it.
+    """
+    parts = os.path.splitext(os.path.basename(filename))[0].split("_")
+    if len(parts) < 3:
+        return None
+    return parts[0], re.sub(r"[-/]A$", "", "_".join(parts[1:-1])), parts[-1]
+
+def superseded_by(filename, others):
+    """
+    The newest of others that is a later filing of the same company and form as filename, or None.
+    """
+    parsed = parse_filing_name(filename)
+    newer = [(p[2], other) for other, p in ((o, parse_filing_name(o)) for o in others)
+             if parsed and p and p[:2] == parsed[:2] and p[2] > parsed[2]]
+    return max(newer)[1] if newer else None
+
+def load_file_state(path):
+    """
+    Filings already ingested into an index: {filename: {"size", "mtime_ns", "sha256", "chunks"}}.
+    """
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_file_state(path, state):
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def finbert_scorer():
+    """
+    Chunk scorer for ingest_filings that loads FinBERT on first use, so runs with nothing new to ingest
+    never load it. Returns None for the scores if the model is unavailable.
+    """
+    analyzer = None
+    def score(texts):
+        nonlocal analyzer
+        if analyzer is None:
+            from nlp.sentiment import SentimentAnalyzer
+            analyzer = SentimentAnalyzer()
+        return analyzer.analyze_batch(texts) if analyzer.loaded else None
+    return score
+
+def ingest_filings(data_dir="data/filings", specific_files=None, retriever_instance=None, force=False,
+                   index_path=os.getenv("RISK_INDEX_PATH", "data/faiss_index.bin"), replace=True, scorer=None):
+    """
+    Chunk and index filings. Files whose size and mtime match the last ingest are skipped without
+    being read, and touched-but-identical files (same SHA-256) without being parsed; chunks already
+    in the index are dropped before embedding. Pass force=True to re-read and re-chunk every file.
+    With replace, a filing supersedes the indexed chunks of earlier filings of the same company and form
+    (amendments included), and filings older than one already indexed or in the same batch are skipped;
+    pass replace=False to keep every filing. scorer(texts), e.g. finbert_scorer(), gives new chunks their
+    sentiment risk score at ingest (see Retriever.ingest_documents). Returns the number of chunks added.
+    """
+    # The retriever (and its models) is only loaded once there is something to ingest
+    retriever = retriever_instance
+    if retriever:
+        index_path = retriever.index_path
+
+    # File state lives next to the index it describes
+    state_path = index_path + ".files.json"
+    file_state = load_file_state(state_path)
+    state_updates = {}
+    skipped = 0
     
     docs_to_ingest = []
     all_metadatas = []
+    sources = []
     
-    if not os.path.exists(data_dir):
-        print(f"Directory {data_dir} does not exist.")
-        return
-
     # Determine files to process
     files_to_process = []
     if specific_files:
         files_to_process = specific_files # These should be full paths
         print(f"Ingesting {len(files_to_process)} specific files...")
     else:
+        if not os.path.exists(data_dir):
+            print(f"Directory {data_dir} does not exist.")
+            return 0
+
         print(f"Scanning {data_dir} for filings...")
         for filename in os.listdir(data_dir):
              if filename.endswith(".htm") or filename.endswith(".html"):
                 files_to_process.append(os.path.join(data_dir, filename))
 
+    batch = [os.path.basename(f) for f in files_to_process]
     for file_path in files_to_process:
         filename = os.path.basename(file_path)
+        newer = superseded_by(filename, batch + list(file_state)) if replace else None
+        if newer:
+            print(f"Skipping {filename}: superseded by {newer}.")
+            continue
+        stat = os.stat(file_path)
+        known = file_state.get(filename)
+        if known and not force and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+            skipped += 1
+            continue
+
+        with open(file_path, "rb") as f:
+            raw = f.read()
+        digest = hashlib.sha256(raw).hexdigest()
+        entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+        if known and not force and known["sha256"] == digest:
+            # Touched or re-downloaded but identical
+            state_updates[filename] = {**known, **entry}
+            skipped += 1
+            continue
+
         print(f"Processing {filename}...")
-            
-        with open(file_path, "r", encoding="utf-8") as f:
-            content = f.read()
+        content = raw.decode("utf-8")
             
         clean_content = clean_text(content)
         chunks = chunk_text(clean_content)
@@ -75,21 +162,66 @@ def ingest_filings(data_dir="data/filings", specific_files=None, retriever_insta
         labeled_chunks = [f"Source: {filename} | {chunk}" for chunk in chunks]
         metadatas = [{"ticker": ticker, "source": filename} for _ in chunks]
         
+        sources.append(filename)
         docs_to_ingest.extend(labeled_chunks)
         # We need to pass metadatas aligned with docs_to_ingest, but ingest_documents takes one list.
         # So we better collect them and pass them all at once.
         # However, the current structure collects all docs then ingests.
         # We need to collect metadatas too.
         all_metadatas.extend(metadatas)
+        state_updates[filename] = {**entry, "chunks": len(labeled_chunks)}
         
         print(f"Extracted {len(labeled_chunks)} chunks for {ticker}.")
 
+    if skipped:
+        print(f"Skipped {skipped} unchanged files.")
+    added = 0
     if docs_to_ingest:
         print(f"Ingesting {len(docs_to_ingest)} total chunks into Vector Store...")
-        retriever.ingest_documents(docs_to_ingest, metadatas=all_metadatas)
-        print("Ingestion complete.")
+        retriever = retriever or Retriever(index_path)
+        replaced = []
+        if replace:
+            indexed = retriever.vector_store.metadata_values("source")
+            # Indexed before file state was kept, a later filing may only be known to the index
+            outdated = {source for source in sources if superseded_by(source, indexed)}
+            if outdated:
+                print(f"Skipping {len(outdated)} filings superseded by ones already indexed.")
+                kept = [i for i, meta in enumerate(all_metadatas) if meta["source"] not in outdated]
+                docs_to_ingest, all_metadatas = [docs_to_ingest[i] for i in kept], [all_metadatas[i] for i in kept]
+            # Earlier (or re-ingested) filings of the same company and form already in the index
+            replaced = [{"source": old} for old in sorted(indexed)
+                        if any(old == new or superseded_by(old, [new]) for new in sources if new not in outdated)]
+        added = retriever.ingest_documents(docs_to_ingest, metadatas=all_metadatas, replace=replaced, scorer=scorer)
+        print(f"Ingestion complete ({added} new chunks).")
     else:
         print("No documents found to ingest.")
 
+    if state_updates:
+        # Re-read so files recorded by other processes since we started are kept
+        save_file_state(state_path, {**load_file_state(state_path), **state_updates})
+    return added
+
 if __name__ == "__main__":
-    ingest_filings()
+    parser = argparse.ArgumentParser(description="Chunk, embed and index 10-K filings.")
+    parser.add_argument("files", nargs="*", help="Filing files to ingest (default: scan --data-dir)")
+    parser.add_argument("--data-dir", default="data/filings")
+    parser.add_argument("--rescan", action="store_true",
+                        help="Scan --data-dir for new or changed filings; unchanged ones are only stat'ed")
+    parser.add_argument("--force", action="store_true", help="Re-read and re-chunk every file, even unchanged ones")
+    parser.add_argument("--keep-history", action="store_true",
+                        help="Keep earlier filings of the same company and form instead of replacing them")
+    parser.add_argument("--no-sentiment", action="store_true",
+                        help="Do not score new chunks with FinBERT at ingest (backfill them later)")
+    parser.add_argument("--backfill-sentiment", action="store_true",
+                        help="Score the indexed chunks that have no sentiment score yet and publish them, then exit")
+    args = parser.parse_args()
+
+    if args.files and args.rescan:
+        parser.error("--rescan scans --data-dir; do not also pass files")
+    if args.backfill_sentiment:
+        if args.files or args.rescan or args.no_sentiment:
+            parser.error("--backfill-sentiment only scores the existing index")
+        Retriever(os.getenv("RISK_INDEX_PATH", "data/faiss_index.bin")).backfill_sentiment(finbert_scorer())
+    else:
+        ingest_filings(data_dir=args.data_dir, specific_files=args.files or None, force=args.force,
+                       replace=not args.keep_history, scorer=None if args.no_sentiment else finbert_scorer())
@@ -1,17 +1,21 @@
 import requests
 import os
 import time
+from contextlib import nullcontext
 from bs4 import BeautifulSoup
 import pandas as pd
-from typing import List, Optional
+from typing import Callable, ContextManager, List, Optional
 
 class SECLoader:
-    def __init__(self, download_dir: str = "data/filings", user_agent: str = "MyOpenSourceProject/1.0 (contact@example.com)"):
+    def __init__(self, download_dir: str = "data/filings", user_agent: str = "MyOpenSourceProject/1.0 (contact@example.com)",
+                 stage_timer: Callable[[str], ContextManager] = None):
         """
         Initialize the SEC Loader.
         :param download_dir: Directory to save downloaded filings.
         :param user_agent: User-Agent string required by SEC EDGAR (Company Name/Email).
+        :param stage_timer: Optional stage_timer(name) context manager used to time each EDGAR call.
         """
+        self.stage_timer = stage_timer or nullcontext
         self.download_dir = download_dir
         self.user_agent = user_agent
         self.base_url = "https://www.sec.gov"
@@ -28,9 +32,10 @@ class SECLoader:
         url = "https://www.sec.gov/files/company_tickers.json"
         
         try:
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-            data = response.json()
+            with self.stage_timer("cik_lookup"):
+                response = requests.get(url, headers=self.headers)
+                response.raise_for_status()
+                data = response.json()
             
             for key, entry in data.items():
                 if entry['ticker'] == ticker:
@@ -49,9 +54,10 @@ class SECLoader:
         api_url = f"https://data.sec.gov/submissions/CIK{cik}.json"
         
         try:
-            response = requests.get(api_url, headers=self.headers)
-            response.raise_for_status()
-            data = response.json()
+            with self.stage_timer("filing_list"):
+                response = requests.get(api_url, headers=self.headers)
+                response.raise_for_status()
+                data = response.json()
             
             recent = data['filings']['recent']
             filings = []
@@ -83,8 +89,9 @@ class SECLoader:
         
         try:
             print(f"Downloading {url}...")
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
+            with self.stage_timer("filing_download"):
+                response = requests.get(url, headers=self.headers)
+                response.raise_for_status()
             
             file_path = os.path.join(self.download_dir, save_name)
             with open(file_path, "wb") as f:
@@ -112,7 +119,8 @@ class SECLoader:
         downloaded_files = []
         for filing in filings:
             date = filing['filingDate']
-            fname = f"{ticker}_{filing_type}_{date}.htm" # Usually text/html
+            # Amendments (10-K/A) are saved as 10-K-A
+            fname = f"{ticker}_{filing_type.replace('/', '-')}_{date}.htm" # Usually text/html
             path = self.download_filing(cik, filing['accessionNumber'], filing['primaryDocument'], fname)
             if path:
                 downloaded_files.append(path)
@@ -1,37 +1,42 @@
 import asyncio
 from app.services.risk_service import RiskService
-import time
+from app.core.metrics import STAGE_SECONDS, time_stage
 import traceback
 
+def print_stage_breakdown():
+    print(f"\n{'Stage':<20} | {'Outcome':<8} | {'Calls':<6} | {'Total (s)':<10} | {'Mean (s)':<10}")
+    print("-" * 66)
+    summary = sorted(STAGE_SECONDS.summary().items(), key=lambda item: item[1]["sum"], reverse=True)
+    for (stage, outcome), stats in summary:
+        print(f"{stage:<20} | {outcome:<8} | {stats['count']:<6} | {stats['sum']:<10.3f} | {stats['mean']:<10.3f}")
+
 async def main():
     print("--- Initializing RiskService ---")
-    start_init = time.time()
     service = RiskService()
-    await service.initialize()
-    print(f"Initialization took: {time.time() - start_init:.2f}s")
-    
+    with time_stage("initialize"):
+        await service.initialize()
+
     ticker = "GOOGL"
     print(f"\n--- Analyzing {ticker} (Expect Auto-Download) ---")
-    start_time = time.time()
-    
+
     try:
-        # Measure time for analysis
-        result = await service.analyze(ticker, use_live_data=True)
-        end_time = time.time()
-        
-        duration = end_time - start_time
+        # analyze() records its own total under the "analyze" stage
+        result = await service.analyze(ticker, use_live_data=True, bypass_cache=True)
+
         print(f"\nAnalysis Successful!")
-        print(f"Total Duration: {duration:.2f}s")
         print(f"Risk Level: {result.get('risk_level')}")
-        
+
         # Check evidences
         evidences = result.get('rag_evidences', [])
         print(f"Evidences found: {len(evidences)}")
-        
+
     except Exception as e:
-        print(f"\n[ERROR] Analysis Failed after {time.time() - start_time:.2f}s")
+        print(f"\n[ERROR] Analysis Failed")
         print(str(e))
         traceback.print_exc()
 
+    # Same histograms that GET /metrics exposes in production
+    print_stage_breakdown()
+
 if __name__ == "__main__":
     asyncio.run(main())
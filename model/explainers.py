@@ -1,7 +1,7 @@
 import shap
 import pandas as pd
 import matplotlib.pyplot as plt
-from typing import Dict
+from typing import Dict, List
 
 class Explainer:
     def __init__(self, model_wrapper):
@@ -34,6 +34,19 @@ class Explainer:
         explanation = dict(zip(self.feature_names, vals))
         return explanation
 
+    def explain_many(self, X: pd.DataFrame) -> List[Dict[str, float]]:
+        """
+        Generate SHAP values for every row with a single TreeExplainer call.
+        :return: One {feature: shap_value} dictionary per row, in input order.
+        """
+        X = X[self.feature_names]
+        shap_values = self.explainer.shap_values(X)
+        if isinstance(shap_values, list):
+             shap_values = shap_values[1]
+        shap_values = shap_values.reshape(len(X), -1)
+
+        return [dict(zip(self.feature_names, row)) for row in shap_values]
+
     def plot_summary(self, X_sample: pd.DataFrame):
         """
         Save a summary plot for a batch of data.
@@ -1,16 +1,16 @@
 import pandas as pd
 import numpy as np
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 class FeatureEngineer:
     def __init__(self):
         self.risk_keywords = ["default", "bankruptcy", "litigation", "investigation", "fraud", "material weakness", "restatement", "unsustainable", "going concern"]
         self.sentiment_analyzer = None
 
-    def load_model(self):
+    def load_model(self, backend: str = "torch", threads: int = 0):
         try:
             from nlp.sentiment import SentimentAnalyzer
-            self.sentiment_analyzer = SentimentAnalyzer()
+            self.sentiment_analyzer = SentimentAnalyzer(backend=backend, threads=threads)
         except ImportError:
             print("Warning: nlp.sentiment module not found.")
         except Exception as e:
@@ -31,12 +31,56 @@ class FeatureEngineer:
         match_count = sum(1 for word in self.risk_keywords if word in text)
         return min(match_count / 10.0, 1.0) # Cap at 1.0 for high keyword density
 
+    def compute_sentiment_scores(self, texts: List[str]) -> List[float]:
+        """
+        compute_sentiment_score for many texts, with FinBERT scoring all their windows in shared batches.
+        """
+        if self.sentiment_analyzer:
+            return self.sentiment_analyzer.analyze_batch(texts)
+        return [self.compute_sentiment_score(text) for text in texts]
+
+    def aggregate_sentiment(self, texts: List[str], scores: List[Optional[float]]) -> float:
+        """
+        Risk score of a set of chunks from their per-chunk scores (precomputed at ingest), weighted by chunk
+        length so it tracks FinBERT on their concatenation (a mean over its token windows).
+        Chunks without a score (None) are scored now; scores is filled in place so callers can keep them.
+        """
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            for i, score in zip(missing, self.compute_sentiment_scores([texts[i] for i in missing])):
+                scores[i] = score
+        weights = [len(text.split()) for text in texts]
+        if not sum(weights):
+            return 0.0
+        return float(np.average(scores, weights=weights))
+
     def combine_features(self, financial_data: Dict[str, float], text_data: str) -> pd.DataFrame:
         """
         Combine quantitative financial metrics with qualitative text signals.
         """
-        risk_score = self.compute_sentiment_score(text_data)
-        
+        return self.combine_features_many([financial_data], [text_data])
+
+    def combine_features_many(self, financial_data: List[Dict[str, float]], text_data: List[str]) -> pd.DataFrame:
+        """
+        Build one feature row per company so the whole set can be scored in a single model call.
+        """
+        if len(financial_data) != len(text_data):
+            raise ValueError("Number of financial records and texts must match.")
+
+        risk_scores = self.compute_sentiment_scores(text_data)
+        return self.build_feature_matrix(financial_data, risk_scores)
+
+    def build_feature_matrix(self, financial_data: List[Dict[str, float]], risk_scores: List[float]) -> pd.DataFrame:
+        """
+        Assemble the feature matrix from financial metrics and precomputed sentiment risk scores.
+        """
+        if len(financial_data) != len(risk_scores):
+            raise ValueError("Number of financial records and risk scores must match.")
+
+        rows = [self._feature_row(fin, score) for fin, score in zip(financial_data, risk_scores)]
+        return pd.DataFrame(rows)
+
+    def _feature_row(self, financial_data: Dict[str, float], risk_score: float) -> Dict[str, float]:
         features = {
             "debt_to_equity": financial_data.get("debt_to_equity", 0),
             "quick_ratio": financial_data.get("quick_ratio", 0),
@@ -62,7 +106,7 @@ class FeatureEngineer:
             if v is None:
                 features[k] = defaults.get(k, 0.0)
                 
-        return pd.DataFrame([features])
+        return features
 
 if __name__ == "__main__":
     fe = FeatureEngineer()
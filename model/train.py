@@ -2,6 +2,7 @@ from sklearn.ensemble import GradientBoostingRegressor
 import pandas as pd
 import numpy as np
 import pickle
+import hashlib
 import os
 from sklearn.model_selection import train_test_split
 
@@ -14,6 +15,8 @@ class RiskModel:
             max_depth=4,
             random_state=42
         )
+        # Content hash of the fitted model, used to version cached predictions
+        self.version = None
         self.features = ["debt_to_equity", "quick_ratio", "current_ratio", "return_on_equity", "free_cashflow", "volatility", "sentiment_risk_score"]
 
     def train(self, X: pd.DataFrame, y: pd.Series):
@@ -30,24 +33,34 @@ class RiskModel:
         """
         Predict Probability of Default (PD).
         """
+        return float(self.predict_many(X)[0])
+
+    def predict_many(self, X: pd.DataFrame) -> np.ndarray:
+        """
+        Predict Probability of Default (PD) for every row in a single model call.
+        """
         # Ensure feature order
         X = X[self.features]
         # Predict continuous probability
-        proba = self.model.predict(X)[0]
+        proba = self.model.predict(X)
         # Clip to [0, 1] range just in case
-        return float(max(0.0, min(1.0, proba)))
+        return np.clip(proba, 0.0, 1.0)
 
     def save_model(self):
         """Save model to pickle"""
+        payload = pickle.dumps(self.model)
         with open(self.model_path, "wb") as f:
-            pickle.dump(self.model, f)
+            f.write(payload)
+        self.version = hashlib.sha1(payload).hexdigest()[:12]
         print(f"Model saved to {self.model_path}")
 
     def load_model(self):
         """Load model from pickle"""
         if os.path.exists(self.model_path):
             with open(self.model_path, "rb") as f:
-                self.model = pickle.load(f)
+                payload = f.read()
+            self.model = pickle.loads(payload)
+            self.version = hashlib.sha1(payload).hexdigest()[:12]
             print("Model loaded.")
         else:
             # Raise exception so main.py knows to train a new one
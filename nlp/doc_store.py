@@ -0,0 +1,230 @@
+import hashlib
+import json
+import os
+from array import array
+from typing import Iterable, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+# On-disk layout of a document column set, as suffixes of a common prefix:
+#   .text         UTF-8 chunk texts, concatenated
+#   .offsets.npy  int64 byte offsets into .text, one more than there are documents
+#   .meta.npy     int32 dictionary codes, one row per document and one column per key (-1: key absent)
+#   .meta.json    {"count": n, "keys": [...], "values": {key: [value for each code]}}
+#   .hashes.npy   uint64 content hash of each text, for deduplicating ingests
+#   .ids.npy      int64 stable chunk id of each document, ascending (positions shift when deleted chunks are purged)
+#   .sentiment.npy  float32 FinBERT risk score of each document (NaN: not scored); kept out of the metadata
+#                 columns, whose dictionary codes and postings suit repeated categorical values, not scores
+DOCUMENT_FILES = (".text", ".offsets.npy", ".meta.npy", ".meta.json", ".hashes.npy", ".ids.npy", ".sentiment.npy")
+
+def content_hash(data: bytes) -> int:
+    # 64-bit BLAKE2b of the UTF-8 text: collisions are negligible well past billions of chunks
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+def content_hashes(texts: Sequence[str]) -> np.ndarray:
+    return np.fromiter((content_hash(t.encode("utf-8")) for t in texts), dtype=np.uint64, count=len(texts))
+
+class TextColumn(Sequence):
+    """
+    Read-only chunk texts backed by a memory-mapped blob and offsets array. Only the texts
+    that are indexed are decoded; the rest stay in the page cache, shared between processes.
+    """
+    def __init__(self, prefix: str):
+        self.offsets = np.load(prefix + ".offsets.npy", mmap_mode="r")
+        if os.path.getsize(prefix + ".text"):
+            self.blob = np.memmap(prefix + ".text", dtype=np.uint8, mode="r")
+        else:
+            self.blob = np.zeros(0, dtype=np.uint8)  # an empty file cannot be mapped
+        if os.path.exists(prefix + ".hashes.npy"):
+            self.hashes = np.load(prefix + ".hashes.npy", mmap_mode="r")
+        else:
+            self.hashes = content_hashes(self)  # written before hashes were stored
+        # Written before chunks had stable ids (when ids were positions): None, the store numbers them
+        self.ids = np.load(prefix + ".ids.npy", mmap_mode="r") if os.path.exists(prefix + ".ids.npy") else None
+        # Written before scores had their own column: None, every document is unscored
+        if os.path.exists(prefix + ".sentiment.npy"):
+            self.sentiments = np.load(prefix + ".sentiment.npy", mmap_mode="r")
+        else:
+            self.sentiments = None
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+class MetadataColumns(Sequence):
+    """
+    Read-only per-document metadata stored column-wise: each key is a column of dictionary codes,
+    so a ticker repeated across thousands of chunks costs four bytes per chunk.
+    """
+    def __init__(self, prefix: str):
+        with open(prefix + ".meta.json", "r") as f:
+            header = json.load(f)
+        self.keys = header["keys"]
+        self.values = header["values"]
+        self.codes = np.load(prefix + ".meta.npy", mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, i: int) -> dict:
+        row = self.codes[i]
+        return {key: self.values[key][code] for key, code in zip(self.keys, row.tolist()) if code >= 0}
+
+    def postings(self) -> Iterator[Tuple[Tuple[str, object], np.ndarray]]:
+        """
+        ((key, value), sorted row ids) for every value present, computed from the code columns.
+        """
+        for column, key in enumerate(self.keys):
+            codes = np.asarray(self.codes[:, column])
+            order = np.argsort(codes, kind="stable")
+            sorted_codes = codes[order]
+            bounds = np.flatnonzero(np.diff(sorted_codes)) + 1
+            for ids, code in zip(np.split(order, bounds), sorted_codes[np.r_[0, bounds]] if len(codes) else []):
+                if code >= 0:
+                    yield (key, self.values[key][code]), ids
+
+class DocumentList(Sequence):
+    """
+    One sequence over read-only column parts (the compacted base, then each segment)
+    followed by documents added in memory since, addressed by global document id.
+    """
+    def __init__(self, parts: List[Sequence] = None, items: List = None):
+        self.parts = list(parts or [])
+        self.items = list(items or [])
+        self._starts = np.cumsum([0] + [len(p) for p in self.parts])
+
+    def add_part(self, part: Sequence):
+        if self.items:
+            raise ValueError("Cannot add a column part after in-memory documents.")
+        self.parts.append(part)
+        self._starts = np.append(self._starts, self._starts[-1] + len(part))
+
+    def extend(self, items: Iterable):
+        self.items.extend(items)
+
+    def persist(self, part: Sequence):
+        """
+        Swap the first len(part) in-memory documents for part, their persisted (memory-mapped) copy.
+        """
+        if len(part) > len(self.items):
+            raise ValueError("Part is longer than the in-memory documents it replaces.")
+        self.items = self.items[len(part):]
+        self.parts.append(part)
+        self._starts = np.append(self._starts, self._starts[-1] + len(part))
+
+    def rebase(self, part: Sequence, count: int = None) -> "DocumentList":
+        """
+        A list whose first count documents (len(part) by default) are replaced by part, e.g. a new
+        compacted base that left out deleted documents, and the rest come from here.
+        """
+        count = len(part) if count is None else count
+        if count == len(self):
+            return DocumentList([part])
+        if count not in self._starts:
+            raise ValueError("The new base must end on a part boundary.")
+        first = int(np.searchsorted(self._starts, count))
+        return DocumentList([part] + self.parts[first:], self.items)
+
+    def spans(self) -> Iterator[Tuple[int, Sequence]]:
+        """
+        (first document id, part) for each part, the in-memory documents last.
+        """
+        yield from zip(self._starts.tolist(), self.parts + [self.items])
+
+    def __len__(self) -> int:
+        return int(self._starts[-1]) + len(self.items)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        persisted = int(self._starts[-1])
+        if i >= persisted:
+            return self.items[i - persisted]
+        if i < 0:
+            raise IndexError(i)
+        part = int(np.searchsorted(self._starts, i, side="right")) - 1
+        return self.parts[part][i - int(self._starts[part])]
+
+    def __iter__(self) -> Iterator:
+        for part in self.parts:
+            yield from part
+        yield from self.items
+
+def write_documents(prefix: str, documents: Iterable[str], metadatas: Iterable[dict], suffix: str = "",
+                    ids: np.ndarray = None, sentiments: np.ndarray = None):
+    """
+    Write documents and their metadata as a column set (see DOCUMENT_FILES), streaming the texts
+    so a corpus never has to be held in memory at once. Files get suffix appended to their names.
+    ids are the documents' stable ids (their positions if not given); sentiments their risk scores (NaN if not given).
+    """
+    offsets, hashes = array("q", [0]), array("Q")
+    with open(prefix + ".text" + suffix, "wb") as f:
+        for text in documents:
+            data = text.encode("utf-8")
+            f.write(data)
+            offsets.append(offsets[-1] + len(data))
+            hashes.append(content_hash(data))
+    with open(prefix + ".offsets.npy" + suffix, "wb") as f:
+        np.save(f, np.frombuffer(offsets, dtype=np.int64))
+    with open(prefix + ".hashes.npy" + suffix, "wb") as f:
+        np.save(f, np.frombuffer(hashes, dtype=np.uint64))
+    count = len(offsets) - 1
+    ids = np.arange(count, dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+    if len(ids) != count:
+        raise ValueError("Number of ids must match number of documents.")
+    with open(prefix + ".ids.npy" + suffix, "wb") as f:
+        np.save(f, ids)
+    if sentiments is None:
+        sentiments = np.full(count, np.nan, dtype=np.float32)
+    sentiments = np.asarray(sentiments, dtype=np.float32)
+    if len(sentiments) != count:
+        raise ValueError("Number of sentiments must match number of documents.")
+    with open(prefix + ".sentiment.npy" + suffix, "wb") as f:
+        np.save(f, sentiments)
+
+    keys, values, lookup, rows = [], {}, {}, []
+    for meta in metadatas:
+        row = {}
+        for key, value in meta.items():
+            if key not in lookup:
+                keys.append(key)
+                values[key], lookup[key] = [], {}
+            # Dictionary-encode by JSON form, so unhashable values encode too
+            encoded = json.dumps(value, sort_keys=True, default=str)
+            if encoded not in lookup[key]:
+                lookup[key][encoded] = len(values[key])
+                values[key].append(value)
+            row[key] = lookup[key][encoded]
+        rows.append(row)
+    codes = np.full((len(rows), len(keys)), -1, dtype=np.int32)
+    for i, row in enumerate(rows):
+        for column, key in enumerate(keys):
+            codes[i, column] = row.get(key, -1)
+    with open(prefix + ".meta.npy" + suffix, "wb") as f:
+        np.save(f, codes)
+    with open(prefix + ".meta.json" + suffix, "w") as f:
+        json.dump({"count": len(rows), "keys": keys, "values": values}, f, default=str)
+
+def read_documents(prefix: str) -> Tuple[TextColumn, MetadataColumns]:
+    return TextColumn(prefix), MetadataColumns(prefix)
+
+def install_documents(prefix: str, suffix: str):
+    # Rename a column set written with suffix into place
+    for ext in DOCUMENT_FILES:
+        os.replace(prefix + ext + suffix, prefix + ext)
+
+def remove_documents(prefix: str, suffix: str = ""):
+    for ext in DOCUMENT_FILES:
+        try:
+            os.remove(prefix + ext + suffix)
+        except FileNotFoundError:
+            pass
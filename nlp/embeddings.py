@@ -1,14 +1,17 @@
-from sentence_transformers import SentenceTransformer
 from typing import List, Union
 import numpy as np
 
+from .inference import load_sentence_transformer
+
 class EmbeddingGenerator:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", backend: str = "torch", threads: int = 0):
         """
         Initialize the embedding model.
+        :param backend: Inference backend, torch, int8 or onnx (see nlp.inference).
+        :param threads: ONNX Runtime intra-op threads (0: one per core); see nlp.inference.configure_threads.
         """
-        print(f"Loading embedding model: {model_name}...")
-        self.model = SentenceTransformer(model_name)
+        print(f"Loading embedding model: {model_name} ({backend})...")
+        self.model = load_sentence_transformer(model_name, backend, threads)
 
     def generate(self, texts: Union[str, List[str]]) -> np.ndarray:
         """
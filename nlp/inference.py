@@ -0,0 +1,123 @@
+"""
+CPU inference backends for the transformer models: the MiniLM embedder, the ms-marco cross-encoder and FinBERT.
+
+    torch  eager PyTorch (the default)
+    int8   PyTorch with the Linear layers dynamically quantized to int8 (no extra dependencies)
+    onnx   ONNX Runtime; the model is exported to ONNX on first load (pip install -r requirements-onnx.txt)
+
+PyTorch's intra-op thread count is process-wide, so it is set once at startup with configure_threads; the
+loaders' threads only sizes ONNX Runtime sessions (0 keeps the library default, one per core). Check a backend's
+scores against the PyTorch ones with compare_outputs, or benchmarks/inference_benchmark.py for all three models.
+"""
+import importlib.util
+from typing import Dict, Tuple
+
+import numpy as np
+
+INFERENCE_BACKENDS = ("torch", "int8", "onnx")
+# Optional dependencies of the onnx backend: (module, package to install)
+ONNX_REQUIREMENTS = (("onnxruntime", "onnxruntime"), ("optimum.onnxruntime", "optimum[onnxruntime]"))
+
+def check_backend(backend: str):
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r} (expected one of {', '.join(INFERENCE_BACKENDS)})")
+    if backend == "onnx":
+        missing = [package for module, package in ONNX_REQUIREMENTS if not _installed(module)]
+        if missing:
+            raise ImportError(f"The onnx inference backend needs {' and '.join(missing)} "
+                              f"(pip install -r requirements-onnx.txt)")
+
+def _installed(module: str) -> bool:
+    try:
+        return importlib.util.find_spec(module) is not None
+    except ImportError:
+        # find_spec imports the parent package of a dotted name, which may itself be missing
+        return False
+
+def configure_threads(threads: int):
+    """
+    Set PyTorch's intra-op thread count for the whole process (0 keeps the default). Call once at startup;
+    ONNX Runtime sessions take theirs from session_options().
+    """
+    if not threads:
+        return
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(threads)
+
+def session_options(threads: int):
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if threads:
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+    return options
+
+def _onnx_kwargs(threads: int) -> Dict:
+    return {"provider": "CPUExecutionProvider", "session_options": session_options(threads)}
+
+def quantize_int8(module):
+    """
+    Quantize module's Linear layers to int8 in place (weights ahead of time, activations per batch).
+    """
+    import torch
+    return torch.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+def load_sentence_transformer(model_name: str, backend: str = "torch", threads: int = 0):
+    from sentence_transformers import SentenceTransformer
+    check_backend(backend)
+    if backend == "onnx":
+        return SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=_onnx_kwargs(threads))
+    model = SentenceTransformer(model_name, device="cpu")
+    if backend == "int8":
+        quantize_int8(model)
+    return model
+
+def load_cross_encoder(model_name: str, backend: str = "torch", threads: int = 0):
+    from sentence_transformers import CrossEncoder
+    check_backend(backend)
+    if backend == "onnx":
+        return CrossEncoder(model_name, device="cpu", backend="onnx", model_kwargs=_onnx_kwargs(threads))
+    model = CrossEncoder(model_name, device="cpu")
+    if backend == "int8":
+        quantize_int8(model.model)
+    return model
+
+def load_sequence_classifier(model_name: str, backend: str = "torch", threads: int = 0) -> Tuple:
+    """
+    (tokenizer, model) for a Hugging Face sequence classifier such as FinBERT; either model works with pipeline().
+    """
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+    check_backend(backend)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    if backend == "onnx":
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+        return tokenizer, ORTModelForSequenceClassification.from_pretrained(model_name, export=True, **_onnx_kwargs(threads))
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    model.eval()
+    if backend == "int8":
+        quantize_int8(model)
+    return tokenizer, model
+
+def compare_outputs(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    """
+    Fidelity of a backend's outputs to the PyTorch reference for the same inputs: absolute differences,
+    plus the lowest cosine similarity for embeddings (one row each) or the rank correlation for scores.
+    """
+    reference = np.asarray(reference, dtype=np.float64)
+    candidate = np.asarray(candidate, dtype=np.float64)
+    if reference.shape != candidate.shape:
+        raise ValueError(f"Output shapes differ: {reference.shape} vs {candidate.shape}")
+    diff = np.abs(reference - candidate)
+    report = {"max_abs_diff": float(diff.max()) if diff.size else 0.0,
+              "mean_abs_diff": float(diff.mean()) if diff.size else 0.0}
+    if reference.ndim == 2:
+        norms = np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+        report["min_cosine"] = float(np.min(np.sum(reference * candidate, axis=1) / np.maximum(norms, 1e-12)))
+    elif len(reference) > 1:
+        ranks = [np.argsort(np.argsort(x)) for x in (reference, candidate)]
+        report["spearman"] = float(np.corrcoef(*ranks)[0, 1])
+    return report
@@ -0,0 +1,48 @@
+"""
+Retrain the FAISS index on the vectors it already holds, optionally switching its type.
+
+    python nlp/rebuild_index.py --type hnsw --ef-construction 120
+    python nlp/rebuild_index.py --type ivf_pq --nlist 1024 --pq-m 48
+    python nlp/rebuild_index.py --type sq_int8
+
+The result is published as a new index generation, so a running pre-forked server picks it up.
+"""
+import argparse
+import os
+import sys
+import time
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nlp.retriever import Retriever
+from nlp.vector_store import INDEX_TYPES
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the FAISS index from its stored vectors.")
+    parser.add_argument("--index-path", default=os.getenv("RISK_INDEX_PATH", "data/faiss_index.bin"))
+    parser.add_argument("--type", choices=INDEX_TYPES, help="New index type (default: keep the current one)")
+    parser.add_argument("--nlist", type=int)
+    parser.add_argument("--nprobe", type=int)
+    parser.add_argument("--pq-m", type=int)
+    parser.add_argument("--pq-nbits", type=int)
+    parser.add_argument("--hnsw-m", type=int)
+    parser.add_argument("--ef-construction", type=int)
+    parser.add_argument("--ef-search", type=int)
+    parser.add_argument("--rerank", type=int, help="Compressed types: candidates per hit re-ranked on full vectors (0: off)")
+    args = parser.parse_args()
+
+    params = {
+        name: getattr(args, name)
+        for name in ("nlist", "nprobe", "pq_m", "pq_nbits", "hnsw_m", "ef_construction", "ef_search", "rerank")
+        if getattr(args, name) is not None
+    }
+    retriever = Retriever(args.index_path)
+    before = retriever.vector_store.index_type
+    start = time.perf_counter()
+    retriever.rebuild_index(args.type, params)
+    print(f"Rebuilt {retriever.vector_store.index.ntotal} vectors: {before} -> {retriever.vector_store.index_type} "
+          f"in {time.perf_counter() - start:.1f}s (generation {retriever.generation})")
+
+if __name__ == "__main__":
+    main()
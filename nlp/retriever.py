@@ -1,54 +1,463 @@
+from .doc_store import content_hash
 from .embeddings import EmbeddingGenerator
+from .inference import load_cross_encoder
+from .sparse_index import SparseIndex, read_sparse_index, write_sparse_index
 from .vector_store import VectorStore
-from typing import List
+from typing import Callable, ContextManager, Dict, List, Optional, Set, Tuple
+from contextlib import contextmanager, nullcontext
+import json
+import os
+import threading
+import time
 import numpy as np
 
+try:
+    import fcntl
+except ImportError:  # Windows: single-process serving only
+    fcntl = None
+
 class Retriever:
-    def __init__(self, index_path: str = "data/faiss_index.bin"):
+    def __init__(self, index_path: str = "data/faiss_index.bin", stage_timer: Callable[[str], ContextManager] = None,
+                 mmap: bool = False, index_type: str = "flat", index_params: Dict = None, compact_segments: int = 8,
+                 compact_deleted: float = 0.2, query_cache=None, result_cache=None, rerank_cache=None,
+                 rerank_top_n: int = 0, rerank_budget_ms: float = 0, inference_backend: str = "torch",
+                 inference_threads: int = 0):
+        """
+        :param stage_timer: Optional stage_timer(name) context manager used to time each retrieval stage.
+        :param mmap: Memory-map the FAISS vectors so processes serving the same index share them.
+        :param index_type: ANN index type for a new store (see nlp.vector_store.INDEX_TYPES).
+        :param index_params: Index build and search parameters (nlist, nprobe, ef_search, ...).
+        :param compact_segments: Fold the per-ingest segments back into the base index in the background
+                                 once there are this many of them (0 disables background compaction).
+        :param compact_deleted: Also compact once this share of the stored chunks is deleted (replaced filings),
+                                purging them so index size and search time track the live chunks only (0 disables).
+        :param query_cache: Optional cache (get/put, e.g. app.services.cache.TTLCache) of query embeddings by query text.
+        :param result_cache: Optional cache (get/put/invalidate_tag) of ranked results by (query, filter, top_k, index
+                             generation); entries for a ticker are dropped when its documents change.
+        :param rerank_cache: Optional cache (get/put) of cross-encoder scores by (query hash, chunk hash).
+        :param rerank_top_n: Cascade: only the first rerank_top_n fused candidates go to the cross-encoder (0: all).
+        :param rerank_budget_ms: Stop scoring once a call has spent this long in the cross-encoder (0: no limit);
+                                 queries left without all their scores keep the fused order.
+        :param inference_backend: Backend for the embedder and cross-encoder: torch, int8 or onnx (see nlp.inference).
+        :param inference_threads: ONNX Runtime intra-op threads (0: one per core); PyTorch's are process-wide
+                                  and set once at startup (nlp.inference.configure_threads).
+        """
         print("Initializing Advanced Retriever...")
-        self.embedder = EmbeddingGenerator()
-        self.vector_store = VectorStore(index_file=index_path)
-        self.vector_store.load()
+        self.stage_timer = stage_timer or nullcontext
+        self.index_path = index_path
+        self.mmap = mmap
+        self.index_type = index_type
+        self.index_params = index_params
+        self.compact_segments = compact_segments
+        self.compact_deleted = compact_deleted
+        self.query_cache = query_cache
+        self.result_cache = result_cache
+        self.rerank_cache = rerank_cache
+        self.rerank_top_n = rerank_top_n
+        self.rerank_budget_ms = rerank_budget_ms
+        # Per query: re-ranked, skipped (too few candidates to change the result set) or over budget;
+        # per pair: scored by the model or taken from rerank_cache
+        self.rerank_counts = {"reranked": 0, "skipped": 0, "over_budget": 0, "pairs_scored": 0, "pairs_cached": 0}
+        self._counts_lock = threading.Lock()  # _rerank runs on several executor threads at once
+        self._compacting = threading.Lock()
+        self.inference_backend = inference_backend
+        self.inference_threads = inference_threads
+        self.embedder = EmbeddingGenerator(backend=inference_backend, threads=inference_threads)
+        # Guards the index, documents and BM25 while ingest mutates them from a worker thread
+        self._lock = threading.RLock()
+        self._cross_encoder_lock = threading.Lock()
+        # Index generations: bumped on every ingest, globally and per ticker, so callers can version cached results.
+        # They are persisted in a manifest next to the index, so every process serving it agrees on them.
+        self.generation = 0
+        self.ticker_generations = {}
+        self._ingest_listeners = []
+        with self._file_lock(exclusive=False):
+            self._load_index()
         
-        # Initialize Sparse Retriever (BM25)
-        self.bm25 = None
-        if self.vector_store.documents:
-            self._build_bm25()
-            
         # Initialize Cross-Encoder for Re-ranking (Lazy load)
         self.cross_encoder = None
 
-    def _build_bm25(self):
+    def _load_index(self):
+        manifest = self.read_manifest()
+        self.vector_store = VectorStore(index_file=self.index_path, mmap=self.mmap,
+                                        index_type=self.index_type, index_params=self.index_params)
+        self.vector_store.load()
+        self.generation = manifest["generation"]
+        self.ticker_generations = manifest["tickers"]
+
+        # Initialize Sparse Retriever (BM25)
+        self._load_sparse_index()
+
+    def _sync_from_disk(self):
+        """
+        Catch up with what other processes have published: just their new segments when the base is
+        unchanged, a full reload when it was compacted or rebuilt. Callers hold self._lock and the file lock.
+        """
+        manifest = self.read_manifest()
+        first_id = self.vector_store.sync()
+        if first_id is None:
+            self._load_index()
+            return
+        if first_id < len(self.vector_store.documents):
+            self._update_sparse_index()
+        self.generation = manifest["generation"]
+        self.ticker_generations = manifest["tickers"]
+
+    def read_manifest(self) -> Dict:
+        """
+        Generation manifest of the index on disk: {"generation": int, "tickers": {ticker: generation}}.
+        """
         try:
-            from rank_bm25 import BM25Okapi
-            print("Building BM25 Index...")
-            tokenized_corpus = [doc.lower().split() for doc in self.vector_store.documents]
-            self.bm25 = BM25Okapi(tokenized_corpus)
-        except ImportError:
-            print("Warning: rank_bm25 not installed. Sparse retrieval disabled.")
-        except Exception as e:
-            print(f"Error building BM25: {e}")
+            with open(self.index_path + ".manifest.json", "r") as f:
+                manifest = json.load(f)
+            return {"generation": int(manifest.get("generation", 0)), "tickers": dict(manifest.get("tickers", {}))}
+        except FileNotFoundError:
+            return {"generation": 0, "tickers": {}}
+
+    def _write_manifest(self):
+        path = self.index_path + ".manifest.json"
+        with open(path + ".tmp", "w") as f:
+            json.dump({"generation": self.generation, "tickers": self.ticker_generations}, f, sort_keys=True)
+        os.replace(path + ".tmp", path)
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool = True):
+        """
+        Cross-process lock on the index files: exclusive while publishing a generation, shared while loading one.
+        """
+        if fcntl is None:
+            yield
+            return
+        with open(self.index_path + ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def refresh(self) -> bool:
+        """
+        Reload the index if another process has published a newer generation. Returns True if it reloaded.
+        """
+        with self._lock:
+            if self.read_manifest()["generation"] <= self.generation:
+                return False
+            stale = dict(self.ticker_generations)
+            with self._file_lock(exclusive=False):
+                self._sync_from_disk()
+            tickers = {t for t, gen in self.ticker_generations.items() if stale.get(t) != gen}
+        print(f"Index reloaded at generation {self.generation}.")
+        self._notify_ingest_listeners(tickers)
+        return True
+
+    def _build_sparse_index(self):
+        print("Building BM25 Index...")
+        self.sparse_index = SparseIndex()
+        self.sparse_index.add(self.vector_store.documents)
+
+    def _load_sparse_index(self):
+        """
+        Map the BM25 index persisted next to the FAISS index and index only the chunks added since it was
+        written; it is rebuilt (and persisted) only when chunks it covers were purged or it is missing.
+        """
+        loaded = read_sparse_index(self.index_path + ".sparse")
+        if loaded is not None:
+            index, version = loaded
+            count = version["count"]
+            if count == 0 or (count <= len(self.vector_store.documents)
+                              and int(self.vector_store.stable_ids(count - 1, count)[0]) == version["last_id"]):
+                self.sparse_index = index
+                self._update_sparse_index()
+                return
+        self._build_sparse_index()
+        self._save_sparse_index()
+
+    def _save_sparse_index(self):
+        # Versioned by the stable id of the last chunk covered: it moves if any chunk before it is purged
+        count = len(self.sparse_index)
+        last_id = int(self.vector_store.stable_ids(count - 1, count)[0]) if count else -1
+        write_sparse_index(self.index_path + ".sparse", self.sparse_index, {"count": count, "last_id": last_id})
+
+    def _update_sparse_index(self):
+        # Index only the documents added since; positions are unchanged unless deleted chunks were purged
+        self.sparse_index.add(self.vector_store.documents[len(self.sparse_index):])
+
+    def warm_cross_encoder(self):
+        """
+        Load the cross-encoder ahead of the first query (e.g. from a background startup task).
+        """
+        self._load_cross_encoder()
 
     def _load_cross_encoder(self):
         if self.cross_encoder: return
+        with self._cross_encoder_lock:
+            if self.cross_encoder: return
+            self._create_cross_encoder()
+
+    def _create_cross_encoder(self):
         try:
-            from sentence_transformers import CrossEncoder
-            print("Loading Cross-Encoder for Re-ranking...")
+            print(f"Loading Cross-Encoder for Re-ranking ({self.inference_backend})...")
             # 'cross-encoder/ms-marco-MiniLM-L-6-v2' is fast and effective
-            self.cross_encoder = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2') 
+            self.cross_encoder = load_cross_encoder('cross-encoder/ms-marco-MiniLM-L-6-v2', self.inference_backend,
+                                                    self.inference_threads)
         except Exception as e:
             print(f"Warning: Could not load Cross-Encoder ({e}). Re-ranking disabled.")
 
-    def ingest_documents(self, documents: List[str], metadatas: List[dict] = None):
+    def index_generation(self, ticker: str = None) -> int:
+        """
+        Generation of the index as seen by one ticker (or the whole index if ticker is None).
+        """
+        if ticker is None:
+            return self.generation
+        return self.ticker_generations.get(ticker, 0)
+
+    def add_ingest_listener(self, callback: Callable[[Set[str]], None]):
+        """
+        Register callback(tickers) to be called after documents for those tickers are ingested.
+        """
+        self._ingest_listeners.append(callback)
+
+    def ingest_documents(self, documents: List[str], metadatas: List[dict] = None, replace: List[dict] = None,
+                         scorer: Callable[[List[str]], List[float]] = None) -> int:
         """
         Embed and index a list of documents with optional metadata.
+        Documents already in the index (same content hash), or repeated in the list, are skipped
+        before embedding, so re-ingesting a filing is close to free. Returns how many were added.
+        :param replace: Metadata filters (e.g. {"source": <older filing>}) whose chunks these documents supersede:
+                        matching chunks not among documents are deleted in the same generation (an upsert).
+        :param scorer: Optional scorer(texts) -> risk scores (e.g. SentimentAnalyzer.analyze_batch), run on the new
+                       chunks only and stored in the index's sentiment column; None if it is unavailable.
         """
-        print("Generating embeddings for ingestion...")
-        embeddings = self.embedder.generate(documents)
-        self.vector_store.add_documents(embeddings, documents, metadatas)
-        self.vector_store.save()
-        # Rebuild BM25
-        self._build_bm25()
+        texts = list(documents)
+        metadatas = metadatas or [{} for _ in documents]
+        with self._lock:
+            keep = self.vector_store.new_positions(documents)
+        if len(keep) < len(documents):
+            print(f"Skipping {len(documents) - len(keep)} chunks already in the index.")
+            documents, metadatas = [documents[i] for i in keep], [metadatas[i] for i in keep]
+        if not documents and not replace:
+            return 0
+
+        embeddings = np.zeros((0, self.vector_store.dimension), dtype="float32")
+        sentiments = scorer(documents) if documents and scorer else None
+        if sentiments is not None:
+            sentiments = np.asarray(sentiments, dtype=np.float32)
+        if documents:
+            print("Generating embeddings for ingestion...")
+            embeddings = self.embedder.generate(documents)
+        with self._lock, self._file_lock():
+            # Another process may have published documents since we loaded; build on top of them, not over them
+            stale = dict(self.ticker_generations)
+            if self.read_manifest()["generation"] > self.generation:
+                self._sync_from_disk()
+                # ... possibly some of these very chunks
+                keep = self.vector_store.new_positions(documents)
+                documents, metadatas = [documents[i] for i in keep], [metadatas[i] for i in keep]
+                embeddings = np.asarray(embeddings)[keep]
+                sentiments = sentiments[keep] if sentiments is not None else None
+            deleted = self.vector_store.delete(ids=self.vector_store.replaced_ids(replace, texts)) if replace else []
+            if len(deleted):
+                print(f"Deleted {len(deleted)} superseded chunks.")
+            if documents:
+                self.vector_store.add_documents(embeddings, documents, metadatas, sentiments)
+                self._update_sparse_index()
+            if documents or len(deleted):
+                # Persist only the new chunks and tombstones; the base index is left alone until compaction
+                self.vector_store.append_segment()
+                self._publish(metadatas, deleted)
+            tickers = {t for t, gen in self.ticker_generations.items() if stale.get(t) != gen}
+            compact = self._needs_compaction()
+
+        self._notify_ingest_listeners(tickers)
+        if compact:
+            self._start_compaction()
+        return len(documents)
+
+    def chunk_sentiments(self, texts: List[str]) -> List[Optional[float]]:
+        """
+        Risk score stored at ingest for each chunk text, or None for chunks ingested without one (or not in the index).
+        """
+        with self._lock:
+            positions = self.vector_store.positions_of(texts)
+            stored = [p for p in positions if p is not None]
+            scores = dict(zip(stored, self.vector_store.sentiments(stored).tolist()))
+        return [None if p is None or np.isnan(scores[p]) else scores[p] for p in positions]
+
+    def delete_documents(self, filter: dict) -> int:
+        """
+        Delete the chunks matching a metadata filter (e.g. {"source": filename}) and publish a new generation.
+        They stop being retrieved at once and are purged from the index files by the next compaction.
+        Returns how many were deleted.
+        """
+        with self._lock, self._file_lock():
+            stale = dict(self.ticker_generations)
+            if self.read_manifest()["generation"] > self.generation:
+                self._sync_from_disk()
+            deleted = self.vector_store.delete(filter)
+            if len(deleted):
+                self.vector_store.append_segment()
+                self._publish([], deleted)
+            tickers = {t for t, gen in self.ticker_generations.items() if stale.get(t) != gen}
+            compact = self._needs_compaction()
+
+        self._notify_ingest_listeners(tickers)
+        if compact:
+            self._start_compaction()
+        return len(deleted)
+
+    def _publish(self, metadatas: List[dict], deleted: np.ndarray):
+        # New generation for the tickers of the chunks added and deleted. Callers hold self._lock and the file lock.
+        self.generation += 1
+        changed = list(metadatas) + [self.vector_store.metadatas[int(i)] for i in deleted]
+        for ticker in {meta.get("ticker") for meta in changed if meta.get("ticker")}:
+            self.ticker_generations[ticker] = self.generation
+        self._write_manifest()
+
+    def _needs_compaction(self) -> bool:
+        store = self.vector_store
+        if self.compact_segments and len(store.segments) >= self.compact_segments:
+            return True
+        return bool(self.compact_deleted and len(store.deleted) and len(store.deleted) >= self.compact_deleted * len(store.documents))
+
+    def _start_compaction(self):
+        if self._compacting.acquire(blocking=False):
+            threading.Thread(target=self._compact_in_background, name="index-compaction", daemon=True).start()
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        except Exception as e:
+            print(f"Warning: index compaction failed ({e}).")
+        finally:
+            self._compacting.release()
+
+    def compact(self) -> bool:
+        """
+        Fold the index segments into a new base, purging deleted chunks, and publish it as a new generation.
+        The new base is trained and written without holding the retriever lock, so searches and
+        ingests carry on meanwhile. Returns False if there was nothing to compact or another process got there first.
+        """
+        compaction = self.vector_store.prepare_compaction(self._lock)
+        if compaction is None:
+            return False
+        with self._lock, self._file_lock():
+            if self.read_manifest()["generation"] > self.generation:
+                self._sync_from_disk()
+            if not self.vector_store.install_compaction(compaction):
+                return False
+            if len(compaction["purged"]):
+                # Positions shifted; BM25 addresses documents by position
+                self._build_sparse_index()
+            # Persisted with each new base, so loading only has to index the segments added after it
+            self._save_sparse_index()
+            self.generation += 1
+            tickers = set()
+            if self.vector_store.index_type != "flat":
+                # Documents moved from the exact tail into the ANN base, so approximate search may now rank them differently
+                tickers = self.vector_store.metadata_values("ticker", compaction["count"])
+                for ticker in tickers:
+                    self.ticker_generations[ticker] = self.generation
+            self._write_manifest()
+        print(f"Compacted {len(compaction['segments'])} index segments ({len(compaction['purged'])} deleted chunks purged) "
+              f"at generation {self.generation}.")
+        self._notify_ingest_listeners(tickers)
+        return True
+
+    def rebuild_index(self, index_type: str = None, index_params: Dict = None):
+        """
+        Retrain the ANN index on every stored vector (optionally as a new type) and publish it as a new generation.
+        Every ticker's generation moves, since approximate search may now return different evidence for any of them.
+        """
+        with self._lock, self._file_lock():
+            if self.read_manifest()["generation"] > self.generation:
+                self._sync_from_disk()
+            purged = len(self.vector_store.deleted)
+            self.vector_store.rebuild(index_type, index_params)
+            self.vector_store.save()
+            if purged:
+                self._build_sparse_index()
+            self._save_sparse_index()
+            self.generation += 1
+            tickers = self.vector_store.metadata_values("ticker")
+            for ticker in tickers:
+                self.ticker_generations[ticker] = self.generation
+            self._write_manifest()
+        self._notify_ingest_listeners(tickers)
+
+    def backfill_sentiment(self, scorer: Callable[[List[str]], List[float]], batch_size: int = 256) -> int:
+        """
+        Score the chunks indexed without a sentiment score (ingested before scores were stored, or with
+        scoring off), write the scores into a new base and publish it as a new generation. Scoring runs in
+        batches without holding the locks; chunks deleted meanwhile are skipped. Returns how many were scored.
+        """
+        with self._lock:
+            ids = self.vector_store.unscored_ids()
+        if not len(ids):
+            return 0
+        scores = np.full(len(ids), np.nan, dtype=np.float32)
+        for start in range(0, len(ids), batch_size):
+            with self._lock:
+                texts = self.vector_store.texts_of(ids[start:start + batch_size])
+            present = [i for i, text in enumerate(texts) if text is not None]
+            batch_scores = scorer([texts[i] for i in present]) if present else []
+            if batch_scores is None:
+                print("Warning: sentiment scorer unavailable, nothing backfilled.")
+                return 0
+            scores[start + np.asarray(present, dtype=np.int64)] = batch_scores
+            print(f"Scored {min(start + batch_size, len(ids))}/{len(ids)} chunks...")
+
+        scored = ~np.isnan(scores)
+        with self._lock, self._file_lock():
+            stale = dict(self.ticker_generations)
+            if self.read_manifest()["generation"] > self.generation:
+                self._sync_from_disk()
+            positions = self.vector_store.set_sentiments(ids[scored], scores[scored])
+            if len(positions):
+                # Read before save(), which purges deleted chunks and so shifts positions
+                metadatas = [self.vector_store.metadatas[int(p)] for p in positions]
+                purged = len(self.vector_store.deleted)
+                self.vector_store.save()
+                if purged:
+                    self._build_sparse_index()
+                self._save_sparse_index()
+                self._publish(metadatas, [])
+            tickers = {t for t, gen in self.ticker_generations.items() if stale.get(t) != gen}
+        print(f"Backfilled sentiment scores for {len(positions)} chunks at generation {self.generation}.")
+        self._notify_ingest_listeners(tickers)
+        return len(positions)
+
+    def _notify_ingest_listeners(self, tickers: Set[str]):
+        if self.result_cache is not None:
+            # Cached results are keyed by generation, so these can no longer be hit; free them now
+            self.result_cache.invalidate_tag("index")
+            for ticker in tickers:
+                self.result_cache.invalidate_tag(f"ticker:{ticker}")
+        for callback in self._ingest_listeners:
+            try:
+                callback(tickers)
+            except Exception as e:
+                print(f"Warning: ingest listener failed ({e}).")
+
+    def _search_candidates(self, queries: List[str], query_embs: np.ndarray, top_k: int, filters: List[dict]):
+        """
+        Dense and sparse candidate search for a batch of queries.
+        Callers hold self._lock so ingest cannot mutate the index mid-search.
+        """
+        # Pass filters to vector store
+        with self.stage_timer("dense_search"):
+            dense_results = self.vector_store.search_batch(query_embs, k=top_k, filters=filters) # List[List[(text, score)]]
+        
+        # 2. Sparse Retrieval
+        with self.stage_timer("bm25"):
+            sparse_texts = self._sparse_search(queries, top_k, filters)
+
+        return dense_results, sparse_texts
+
+    def _sparse_search(self, queries: List[str], top_k: int, filters: List[dict]) -> List[List[str]]:
+        # Filters resolve through the metadata index; filtered ids already exclude deleted chunks
+        doc_ids = [self.vector_store.matching_ids(filter) if filter else None for filter in filters]
+        hits = self.sparse_index.search_batch(queries, top_k, doc_ids, exclude=self.vector_store.deleted)
+        return [[self.vector_store.documents[int(i)] for i in docs] for docs, _ in hits]
 
     def retrieve(self, query: str, top_k: int = 5, filter: dict = None) -> List[str]:
         """
@@ -58,60 +467,147 @@ class Retriever:
         3. RRF Fusion (Optional) or Union
         4. Re-ranking (Cross-Encoder)
         """
+        return self.retrieve_batch([query], top_k, [filter])[0]
+
+    def retrieve_batch(self, queries: List[str], top_k: int = 5, filters: List[dict] = None) -> List[List[str]]:
+        """
+        retrieve() for many (query, filter) pairs at once: one embedding call, one FAISS search per
+        distinct filter, BM25 term scores shared across queries and one cross-encoder pass over all pairs.
+        """
+        filters = filters or [None] * len(queries)
+        if len(filters) != len(queries):
+            raise ValueError("Number of filters must match number of queries.")
+        if not queries:
+            return []
+        if self.result_cache is None:
+            return self._retrieve_batch(queries, top_k, filters)[0]
+
+        # Read generations before searching: a result computed across an ingest is stored under the older one
+        keys = [self._result_key(query, top_k, filter) for query, filter in zip(queries, filters)]
+        results = [self.result_cache.get(key) for key in keys]
+        misses = [i for i, result in enumerate(results) if result is None]
+        if misses:
+            fresh, final = self._retrieve_batch([queries[i] for i in misses], top_k, [filters[i] for i in misses])
+            for i, result, cacheable in zip(misses, fresh, final):
+                ticker = (filters[i] or {}).get("ticker")
+                if cacheable:  # not a fused-order fallback for a blown re-ranking budget
+                    self.result_cache.put(keys[i], result, tags=[f"ticker:{ticker}" if ticker is not None else "index"])
+                results[i] = result
+        return [list(result) for result in results]
+
+    def _result_key(self, query: str, top_k: int, filter: dict = None) -> tuple:
+        # A ticker filter only sees that ticker's documents, so only its generation has to match
+        ticker = (filter or {}).get("ticker")
+        generation = self.index_generation(ticker) if isinstance(ticker, str) else self.generation
+        return query, json.dumps(filter, sort_keys=True, default=str), top_k, generation
+
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        if self.query_cache is None:
+            return np.atleast_2d(self.embedder.generate(list(queries)))
+        embeddings = {query: self.query_cache.get(query) for query in dict.fromkeys(queries)}
+        missing = [query for query, embedding in embeddings.items() if embedding is None]
+        if missing:
+            for query, embedding in zip(missing, np.atleast_2d(self.embedder.generate(missing))):
+                embeddings[query] = embedding = embedding.copy()  # not a view pinning the whole batch
+                self.query_cache.put(query, embedding)
+        return np.stack([embeddings[query] for query in queries])
+
+    def _retrieve_batch(self, queries: List[str], top_k: int, filters: List[dict]) -> Tuple[List[List[str]], List[bool]]:
+        # Results, and for each whether it is final (False: re-ranking ran out of budget)
         # 1. Dense Retrieval
-        query_emb = self.embedder.generate([query])[0]
-        # Pass filter to vector store
-        dense_results = self.vector_store.search(query_emb, k=top_k, filter=filter) # List[(text, score)]
-        
-        # 2. Sparse Retrieval
-        sparse_texts = []
-        if self.bm25:
-            tokenized_query = query.lower().split()
-            # Get all scores
-            doc_scores = self.bm25.get_scores(tokenized_query)
-            
-            # Filter scores
-            if filter:
-                # We need to zero out scores for docs that don't match filter
-                # Iterate over all docs? Optimization: iterate over only non-zero scores if possible, 
-                # but get_scores returns dense array.
-                for idx, score in enumerate(doc_scores):
-                    if score > 0:
-                        doc_meta = self.vector_store.metadatas[idx] if idx < len(self.vector_store.metadatas) else {}
-                        for key, val in filter.items():
-                            if doc_meta.get(key) != val:
-                                doc_scores[idx] = 0.0
-                                break
-            
-            # Get top k indices
-            top_n = np.argsort(doc_scores)[::-1][:top_k]
-            sparse_texts = [self.vector_store.documents[i] for i in top_n if doc_scores[i] > 0]
+        with self.stage_timer("embed_query"):
+            query_embs = self._embed_queries(queries)
+        with self._lock:
+            dense_results, sparse_results = self._search_candidates(queries, query_embs, top_k, filters)
         
         # 3. Combine Candidates (Union)
         # Use a dict to avoid duplicates
-        candidates = {text: 0.0 for text, score in dense_results}
-        for text in sparse_texts:
-            if text not in candidates:
-                candidates[text] = 0.0 # Score placeholder
-                
-        unique_candidates = list(candidates.keys())
+        unique_candidates = []
+        for dense, sparse in zip(dense_results, sparse_results):
+            candidates = {text: 0.0 for text, score in dense}
+            for text in sparse:
+                if text not in candidates:
+                    candidates[text] = 0.0 # Score placeholder
+            unique_candidates.append(list(candidates.keys()))
         
         # 4. Re-Ranking (Cross-Encoder)
         self._load_cross_encoder()
         
-        if self.cross_encoder and unique_candidates:
-            pairs = [[query, doc] for doc in unique_candidates]
-            scores = self.cross_encoder.predict(pairs)
-            
-            # Sort by score descending
-            ranked_results = sorted(zip(unique_candidates, scores), key=lambda x: x[1], reverse=True)
-            return [doc for doc, score in ranked_results[:top_k]]
+        if self.cross_encoder and any(unique_candidates):
+            return self._rerank(queries, unique_candidates, top_k)
             
         else:
             # Fallback if no cross-encoder: just return dense results first, then sparse
             # Or better, just return the dense ones if we have them, or whatever we have
             # Since dense usually has scores, let's prioritize dense.
-             return [text for text, score in dense_results] if dense_results else sparse_texts[:top_k]
+            return [
+                [text for text, score in dense] if dense else sparse[:top_k]
+                for dense, sparse in zip(dense_results, sparse_results)
+            ], [True] * len(queries)
+
+    def _rerank(self, queries: List[str], candidates: List[List[str]], top_k: int) -> Tuple[List[List[str]], List[bool]]:
+        """
+        Cross-encoder ranking of each query's fused candidates. In cascade mode only the first rerank_top_n are
+        scored, and the rest follow them in fused order, so a query still gets top_k results when there are that many.
+        Queries with no more candidates than top_k keep the fused order, as re-ranking cannot change which
+        come back; cached pair scores are reused, and the rest are scored in batches until the budget is spent.
+        """
+        heads = [docs[:self.rerank_top_n] if self.rerank_top_n else docs for docs in candidates]
+        scores = [{} for _ in queries]
+        pending = []  # (query index, doc, cache key) still to score
+        for q, (query, docs, head) in enumerate(zip(queries, candidates, heads)):
+            if len(docs) <= top_k:
+                self._count("skipped")
+                continue
+            query_hash = content_hash(query.encode("utf-8"))
+            for doc in head:
+                key = (query_hash, content_hash(doc.encode("utf-8")))
+                score = self.rerank_cache.get(key) if self.rerank_cache is not None else None
+                if score is None:
+                    pending.append((q, doc, key))
+                else:
+                    scores[q][doc] = score
+                    self._count("pairs_cached")
+
+        # Query-major batches, so running out of budget leaves whole queries ranked rather than every one partly
+        # Under a budget, a small first batch times the model and later ones take what the rest of the budget fits
+        budget = self.rerank_budget_ms / 1000
+        batch_size = 8 if budget else len(pending)
+        start, done = time.perf_counter(), 0
+        with self.stage_timer("cross_encoder"):
+            while done < len(pending) and batch_size > 0:
+                batch = pending[done:done + batch_size]
+                batch_scores = self.cross_encoder.predict([[queries[q], doc] for q, doc, _ in batch])
+                for (q, doc, key), score in zip(batch, batch_scores):
+                    scores[q][doc] = float(score)
+                    if self.rerank_cache is not None:
+                        self.rerank_cache.put(key, float(score))
+                done += len(batch)
+                self._count("pairs_scored", len(batch))
+                if budget:
+                    spent = time.perf_counter() - start
+                    batch_size = min(32, int((budget - spent) / max(spent / done, 1e-9)))
+
+        results, final = [], []
+        for docs, head, doc_scores in zip(candidates, heads, scores):
+            if len(docs) <= top_k:
+                results.append(list(docs))
+                final.append(True)
+            elif len(doc_scores) < len(head):
+                self._count("over_budget")
+                results.append(docs[:top_k])
+                final.append(False)
+            else:
+                self._count("reranked")
+                # Sort by score descending; candidates past the cascade keep their fused order behind them
+                ranked = sorted(head, key=doc_scores.get, reverse=True)
+                results.append((ranked + docs[len(head):])[:top_k])
+                final.append(True)
+        return results, final
+
+    def _count(self, outcome: str, n: int = 1):
+        with self._counts_lock:
+            self.rerank_counts[outcome] += n
 
 if __name__ == "__main__":
     retriever = Retriever()
@@ -1,20 +1,38 @@
-from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
 import torch
 import numpy as np
 from typing import List, Dict
 
+from .inference import load_sequence_classifier
+
 class SentimentAnalyzer:
-    def __init__(self, model_name: str = "ProsusAI/finbert"):
-        print(f"Loading Sentiment Model: {model_name}...")
+    def __init__(self, model_name: str = "ProsusAI/finbert", backend: str = "torch", threads: int = 0,
+                 batch_size: int = 8):
+        """
+        :param backend: Inference backend, torch, int8 or onnx (see nlp.inference).
+        :param threads: ONNX Runtime intra-op threads (0: one per core); see nlp.inference.configure_threads.
+        :param batch_size: Token windows scored per forward pass.
+        """
+        print(f"Loading Sentiment Model: {model_name} ({backend})...")
+        self.batch_size = batch_size
+        # Sliding window over the text's tokens: 510 leaves room for the special tokens
+        self.max_len = 512
+        self.window = 510
+        self.stride = 256
+        self.tokenizer = self.model = None
         try:
-            self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-            self.model = AutoModelForSequenceClassification.from_pretrained(model_name)
-            # using return_all_scores=True to get probas for all classes
-            self.pipe = pipeline("text-classification", model=self.model, tokenizer=self.tokenizer, return_all_scores=True)
-            self.max_len = 512
+            tokenizer, model = load_sequence_classifier(model_name, backend, threads)
+            labels = {label.lower(): int(i) for i, label in model.config.id2label.items()}
+            self.negative, self.neutral = labels["negative"], labels["neutral"]
+            self.tokenizer, self.model = tokenizer, model
         except Exception as e:
             print(f"Error loading FinBERT: {e}")
-            self.pipe = None
+
+    @property
+    def loaded(self) -> bool:
+        """
+        Whether FinBERT loaded; if not, every score is 0.0 and callers fall back to keyword scoring.
+        """
+        return self.model is not None
 
     def analyze(self, text: str) -> float:
         """
@@ -22,53 +40,72 @@ class SentimentAnalyzer:
         Handles long text by chunking.
         Returns a 'risk score' based on negative sentiment probability.
         """
-        if not text or not self.pipe:
-            return 0.0
+        return self.analyze_batch([text])[0]
 
-        # Simple chunking by sliding window of tokens would be best, 
-        # but for simplicity/speed we'll chunk by characters approx or split lines.
-        # Let's do a reliable token-based chunking.
-        
-        inputs = self.tokenizer(text, return_tensors="pt", truncation=False, padding=False)
-        input_ids = inputs['input_ids'][0]
-        
-        # If short enough, just run
-        if len(input_ids) <= self.max_len:
-            return self._predict_risk(text)
-            
-        # Sliding window
-        stride = 256
-        window = 510 # leave room for special tokens
-        
-        chunks = []
-        for i in range(0, len(input_ids), stride):
-            chunk_ids = input_ids[i : i + window]
-            if len(chunk_ids) < 10: break # skip tiny chunks
-            chunks.append(self.tokenizer.decode(chunk_ids, skip_special_tokens=True))
-            
-        if not chunks:
-            return 0.0
-            
-        # Get scores for each chunk
-        scores = []
-        for chunk in chunks:
-            scores.append(self._predict_risk(chunk))
-            
-        # Aggregate: Use mean to smooth out outlier negative chunks from standard disclosures.
-        return float(np.mean(scores))
+    def analyze_batch(self, texts: List[str]) -> List[float]:
+        """
+        analyze() for many texts: each is tokenized once and cut into token windows, and the windows
+        of all texts are scored together in mini-batches of batch_size.
+        """
+        scores = [0.0] * len(texts)
+        if not self.loaded:
+            return scores
+        owners, windows = [], []
+        present = [i for i, text in enumerate(texts) if text]
+        if not present:
+            return scores
+        token_ids = self.tokenizer([texts[i] for i in present], add_special_tokens=False, truncation=False,
+                                   return_attention_mask=False)["input_ids"]
+        for i, ids in zip(present, token_ids):
+            for window in self._windows(ids):
+                owners.append(i)
+                windows.append(window)
+        if not windows:
+            return scores
 
-    def _predict_risk(self, text: str) -> float:
         try:
-            # pipe output format: [[{'label': 'positive', 'score': 0.1}, ...]]
-            results = self.pipe(text[:2000]) # backup truncation just in case, though we chunked
-            flat_results = results[0] # List of dicts
-            
-            # Extract score for 'negative' label
-            neg_score = next((r['score'] for r in flat_results if r['label'] == 'negative'), 0.0)
-            neu_score = next((r['score'] for r in flat_results if r['label'] == 'neutral'), 0.0)
-            
-            # Risk = Negative Score + (0.1 * Neutral Score)
-            return neg_score + (0.1 * neu_score)
+            window_scores = self._score_windows(windows)
         except Exception as e:
             print(f"Prediction error: {e}")
-            return 0.0
+            return scores
+        # Aggregate: Use mean to smooth out outlier negative chunks from standard disclosures.
+        owners = np.asarray(owners)
+        totals = np.bincount(owners, weights=window_scores, minlength=len(texts))
+        counts = np.bincount(owners, minlength=len(texts))
+        return [float(total / count) if count else 0.0 for total, count in zip(totals, counts)]
+
+    def _windows(self, ids: List[int]) -> List[List[int]]:
+        # A text that fits is one window; a longer one slides by stride, dropping tiny tail windows
+        if len(ids) <= self.window:
+            return [ids] if ids else []
+        windows = []
+        for i in range(0, len(ids), self.stride):
+            window = ids[i : i + self.window]
+            if len(window) < 10: break # skip tiny chunks
+            windows.append(window)
+        return windows
+
+    def _score_windows(self, windows: List[List[int]]) -> np.ndarray:
+        """
+        Risk score of each token window, Negative + 0.1 * Neutral probability, from padded batches.
+        """
+        scores = []
+        pad_id = self.tokenizer.pad_token_id or 0
+        # Windows of similar length share a batch, so short tail windows are not padded to full ones
+        order = np.argsort([len(w) for w in windows], kind="stable")
+        with torch.inference_mode():
+            for start in range(0, len(windows), self.batch_size):
+                batch = [self.tokenizer.build_inputs_with_special_tokens(windows[j])
+                         for j in order[start:start + self.batch_size]]
+                input_ids = torch.full((len(batch), max(len(ids) for ids in batch)), pad_id, dtype=torch.long)
+                attention_mask = torch.zeros_like(input_ids)
+                for row, ids in enumerate(batch):
+                    input_ids[row, :len(ids)] = torch.tensor(ids, dtype=torch.long)
+                    attention_mask[row, :len(ids)] = 1
+                logits = self.model(input_ids=input_ids, attention_mask=attention_mask,
+                                    token_type_ids=torch.zeros_like(input_ids)).logits
+                probs = torch.softmax(logits.float(), dim=-1).numpy()
+                scores.append(probs[:, self.negative] + 0.1 * probs[:, self.neutral])
+        result = np.empty(len(windows))
+        result[order] = np.concatenate(scores)
+        return result
@@ -0,0 +1,272 @@
+import json
+import os
+import uuid
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# On-disk layout of a sparse index directory: manifest.json names the current file set, <tag>.*, and records
+# {"format", "tag", "k1", "b", "epsilon", "version"} where version identifies the documents it covers.
+#   <tag>.vocab         terms in term id order, newline-separated (tokens never contain whitespace)
+#   <tag>.indptr.npy    int64 CSR offsets into docs/tfs, one more than there are terms
+#   <tag>.docs.npy      int32 document ids, ascending within each term
+#   <tag>.tfs.npy       int32 term frequencies
+#   <tag>.doc_len.npy   int32 tokens per document
+#   <tag>.doc_freq.npy  int64 documents per term
+SPARSE_FORMAT = 1
+SPARSE_ARRAYS = ("indptr", "docs", "tfs", "doc_len", "doc_freq")
+
+def tokenize(text: str) -> List[str]:
+    return text.lower().split()
+
+class PostingsBlock:
+    """
+    Term-major (CSR) postings for a run of documents: the documents containing term t are
+    docs[indptr[t]:indptr[t + 1]], ascending, with their term frequencies in tfs.
+    """
+    def __init__(self, indptr: np.ndarray, docs: np.ndarray, tfs: np.ndarray):
+        self.indptr = indptr
+        self.docs = docs
+        self.tfs = tfs
+
+    @classmethod
+    def from_coo(cls, terms: np.ndarray, docs: np.ndarray, tfs: np.ndarray, n_terms: int) -> "PostingsBlock":
+        # (term, doc, tf) triples in document order; a stable sort by term keeps each term's documents ascending
+        order = np.argsort(terms, kind="stable")
+        indptr = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=n_terms), out=indptr[1:])
+        return cls(indptr, docs[order], tfs[order])
+
+    @property
+    def nnz(self) -> int:
+        return len(self.docs)
+
+    def terms(self) -> np.ndarray:
+        # Term id of every posting
+        return np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+
+    def postings(self, term: int) -> Tuple[np.ndarray, np.ndarray]:
+        if term + 1 >= len(self.indptr):
+            return self.docs[:0], self.tfs[:0]  # term first seen after this block was written
+        start, end = self.indptr[term], self.indptr[term + 1]
+        return self.docs[start:end], self.tfs[start:end]
+
+    def merge(self, later: "PostingsBlock", n_terms: int) -> "PostingsBlock":
+        # later holds documents after all of ours, so concatenating keeps every term's documents ascending
+        return PostingsBlock.from_coo(np.concatenate([self.terms(), later.terms()]),
+                                      np.concatenate([self.docs, later.docs]),
+                                      np.concatenate([self.tfs, later.tfs]), n_terms)
+
+class SparseIndex:
+    """
+    BM25 (scored exactly as rank_bm25's BM25Okapi) over an inverted index of the stored documents.
+
+    Postings are kept in term-major blocks: adding documents tokenizes only them and appends one small
+    block, and blocks are merged while the newer one is as large as the one before it, so there are
+    O(log n) of them. IDF and per-document length norms are precomputed on every add, and a query only
+    touches the postings of its own terms instead of scoring the whole corpus.
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.vocabulary: Dict[str, int] = {}
+        self.blocks: List[PostingsBlock] = []
+        self.doc_len = np.zeros(0, dtype=np.int32)  # tokens per document
+        self.doc_freq = np.zeros(0, dtype=np.int64)  # documents per term
+        self.idf = np.zeros(0)
+        self.norm = np.zeros(0)  # k1 * (1 - b + b * doc_len / avgdl), the length part of BM25's denominator
+
+    def __len__(self) -> int:
+        return len(self.doc_len)
+
+    def add(self, texts: Iterable[str]):
+        """
+        Index documents after the ones already indexed (their ids continue from len(self)).
+        """
+        first = len(self)
+        # Document ids and term frequencies fit 32 bits: 8 bytes per posting
+        terms, docs, tfs, lengths = array("q"), array("i"), array("i"), array("i")
+        vocabulary = self.vocabulary
+        for doc, text in enumerate(texts, first):
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            for token, tf in Counter(tokens).items():
+                term = vocabulary.get(token)
+                if term is None:
+                    term = vocabulary[token] = len(vocabulary)
+                terms.append(term)
+                docs.append(doc)
+                tfs.append(tf)
+        if not lengths:
+            return
+
+        n_terms = len(vocabulary)
+        terms = np.frombuffer(terms, dtype=np.int64)
+        self.blocks.append(PostingsBlock.from_coo(terms, np.frombuffer(docs, dtype=np.int32),
+                                                  np.frombuffer(tfs, dtype=np.int32), n_terms))
+        while len(self.blocks) > 1 and self.blocks[-2].nnz <= self.blocks[-1].nnz:
+            later = self.blocks.pop()
+            self.blocks[-1] = self.blocks[-1].merge(later, n_terms)
+
+        self.doc_freq = np.bincount(terms, minlength=n_terms) + np.pad(self.doc_freq, (0, n_terms - len(self.doc_freq)))
+        self.doc_len = np.concatenate([self.doc_len, np.frombuffer(lengths, dtype=np.int32)])
+        self._update_weights()
+
+    def _update_weights(self):
+        n = len(self.doc_len)
+        idf = np.log(n - self.doc_freq + 0.5) - np.log(self.doc_freq + 0.5)
+        # BM25Okapi floors negative IDFs (terms in over half the documents) at epsilon * the mean IDF
+        idf[idf < 0] = self.epsilon * idf.mean()
+        self.idf = idf
+        self.norm = self.k1 * (1 - self.b + self.b * self.doc_len / self.doc_len.mean())
+
+    def merge_blocks(self):
+        """
+        Fold every postings block into one (done before writing the index out).
+        """
+        if len(self.blocks) > 1:
+            n_terms = len(self.vocabulary)
+            self.blocks = [PostingsBlock.from_coo(np.concatenate([block.terms() for block in self.blocks]),
+                                                  np.concatenate([block.docs for block in self.blocks]),
+                                                  np.concatenate([block.tfs for block in self.blocks]), n_terms)]
+
+    def term_scores(self, term: int, doc_ids: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (document ids, BM25 contribution of term) for every document containing term,
+        or only for those among the sorted doc_ids (looked up in the postings, not scanned).
+        """
+        docs, tfs = [], []
+        for block in self.blocks:
+            block_docs, block_tfs = block.postings(term)
+            if doc_ids is not None and len(doc_ids) < len(block_docs):
+                # Few documents, long postings: binary-search each document
+                slots = np.searchsorted(block_docs, doc_ids[_contains(block_docs, doc_ids)])
+                block_docs, block_tfs = block_docs[slots], block_tfs[slots]
+            elif doc_ids is not None:
+                found = _contains(doc_ids, block_docs)
+                block_docs, block_tfs = block_docs[found], block_tfs[found]
+            docs.append(block_docs)
+            tfs.append(block_tfs)
+        docs, tfs = np.concatenate(docs), np.concatenate(tfs)
+        return docs, self.idf[term] * (tfs * (self.k1 + 1) / (tfs + self.norm[docs]))
+
+    def search_batch(self, queries: List[str], k: int, doc_ids: List[Optional[np.ndarray]] = None,
+                     exclude: np.ndarray = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Top k (document ids, scores) with a positive score for each query, best first, optionally restricted
+        to the sorted ids in doc_ids (one array or None per query) and never returning the sorted ids in exclude.
+        Each distinct term's postings are scored once for the whole batch.
+        """
+        doc_ids = doc_ids or [None] * len(queries)
+        tokenized = [[self.vocabulary[t] for t in tokenize(query) if t in self.vocabulary] for query in queries]
+        # When every query is filtered, only the postings of documents some filter matches are scored
+        scope = None
+        if doc_ids and all(ids is not None for ids in doc_ids):
+            scope = np.unique(np.concatenate(doc_ids))
+        term_scores = {term: self.term_scores(term, scope) for term in set().union(*tokenized)}
+
+        results = []
+        for terms, ids in zip(tokenized, doc_ids):
+            if not terms:
+                results.append((np.zeros(0, dtype=np.int64), np.zeros(0)))
+                continue
+            # A repeated query term counts once per occurrence, as in BM25Okapi.get_scores
+            docs = np.concatenate([term_scores[t][0] for t in terms])
+            weights = np.concatenate([term_scores[t][1] for t in terms])
+            if len(docs) * 8 > len(self):
+                # Common terms: accumulate densely, one slot per document
+                scores = np.bincount(docs, weights=weights, minlength=len(self))
+                docs = np.flatnonzero(scores)
+                scores = scores[docs]
+            else:
+                docs, inverse = np.unique(docs, return_inverse=True)
+                scores = np.bincount(inverse, weights=weights)
+            keep = scores > 0
+            if ids is not None:
+                keep &= _contains(ids, docs)
+            if exclude is not None and len(exclude):
+                keep &= ~_contains(exclude, docs)
+            docs, scores = docs[keep], scores[keep]
+            if len(scores) > k:
+                top = np.argpartition(-scores, k)[:k]
+                docs, scores = docs[top], scores[top]
+            order = np.lexsort((docs, -scores))
+            results.append((docs[order], scores[order]))
+        return results
+
+def write_sparse_index(path: str, index: SparseIndex, version: Dict):
+    """
+    Write index into the directory path under a fresh tag, then publish it by swapping the manifest,
+    so processes reading concurrently see either the old file set or the new one.
+    version is stored as is, for the reader to check against the documents it has.
+    """
+    os.makedirs(path, exist_ok=True)
+    index.merge_blocks()
+    block = index.blocks[0] if index.blocks else PostingsBlock(np.zeros(len(index.vocabulary) + 1, dtype=np.int64),
+                                                               np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32))
+    previous = _read_sparse_manifest(path)
+    tag = uuid.uuid4().hex[:16]
+    prefix = os.path.join(path, tag)
+    with open(prefix + ".vocab", "w", encoding="utf-8") as f:
+        f.write("\n".join(index.vocabulary))  # dicts keep insertion order, which is term id order
+    arrays = {"indptr": block.indptr, "docs": block.docs, "tfs": block.tfs,
+              "doc_len": index.doc_len, "doc_freq": index.doc_freq}
+    for name in SPARSE_ARRAYS:
+        with open(f"{prefix}.{name}.npy", "wb") as f:
+            np.save(f, arrays[name])
+
+    manifest = os.path.join(path, "manifest.json")
+    with open(manifest + ".tmp", "w") as f:
+        json.dump({"format": SPARSE_FORMAT, "tag": tag, "k1": index.k1, "b": index.b, "epsilon": index.epsilon,
+                   "version": version}, f)
+    os.replace(manifest + ".tmp", manifest)
+    if previous:
+        _remove_sparse_files(path, previous["tag"])
+
+def read_sparse_index(path: str) -> Optional[Tuple[SparseIndex, Dict]]:
+    """
+    (index, version) as written by write_sparse_index, with the postings memory-mapped,
+    or None if there is none (or it is in an older format).
+    """
+    manifest = _read_sparse_manifest(path)
+    if not manifest or manifest.get("format") != SPARSE_FORMAT:
+        return None
+    prefix = os.path.join(path, manifest["tag"])
+    try:
+        with open(prefix + ".vocab", "r", encoding="utf-8") as f:
+            terms = f.read()
+        arrays = {name: np.load(f"{prefix}.{name}.npy", mmap_mode="r") for name in SPARSE_ARRAYS}
+    except FileNotFoundError:
+        return None  # replaced by another process between reading the manifest and the files
+
+    index = SparseIndex(manifest["k1"], manifest["b"], manifest["epsilon"])
+    index.vocabulary = {term: i for i, term in enumerate(terms.split("\n") if terms else [])}
+    if len(arrays["doc_len"]):
+        index.blocks = [PostingsBlock(arrays["indptr"], arrays["docs"], arrays["tfs"])]
+        index.doc_len, index.doc_freq = arrays["doc_len"], arrays["doc_freq"]
+        index._update_weights()
+    return index, manifest["version"]
+
+def _read_sparse_manifest(path: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(path, "manifest.json"), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _remove_sparse_files(path: str, tag: str):
+    for ext in [".vocab"] + [f".{name}.npy" for name in SPARSE_ARRAYS]:
+        try:
+            os.remove(os.path.join(path, tag + ext))
+        except FileNotFoundError:
+            pass
+
+def _contains(sorted_ids: np.ndarray, values: np.ndarray) -> np.ndarray:
+    # Membership of values in a sorted id array, without building a set or a corpus-sized mask
+    if not len(sorted_ids):
+        return np.zeros(len(values), dtype=bool)
+    slots = np.minimum(np.searchsorted(sorted_ids, values), len(sorted_ids) - 1)
+    return sorted_ids[slots] == values
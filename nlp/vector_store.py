@@ -1,24 +1,143 @@
+import contextlib
+import itertools
 import faiss
 import numpy as np
+import json
 import pickle
 import os
-from typing import List, Tuple
+import uuid
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from .doc_store import (DocumentList, MetadataColumns, TextColumn, content_hashes, install_documents, read_documents,
+                        remove_documents, write_documents)
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw", "sq_fp16", "sq_int8", "pq")
+# Types whose codes are lossy: their full float32 vectors are kept on disk for re-ranking and rebuilds
+COMPRESSED_TYPES = ("ivf_pq", "sq_fp16", "sq_int8", "pq")
+
+DEFAULT_INDEX_PARAMS = {
+    "nlist": 256,           # IVF: number of inverted lists (capped by the training set size)
+    "nprobe": 16,           # IVF: lists scanned per query
+    "pq_m": 48,             # PQ / IVF-PQ: sub-quantizers, must divide the dimension
+    "pq_nbits": 8,          # PQ / IVF-PQ: bits per sub-quantizer code
+    "hnsw_m": 32,           # HNSW: graph neighbours per node
+    "ef_construction": 80,  # HNSW: build-time beam width
+    "ef_search": 64,        # HNSW: query-time beam width
+    "rerank": 4,            # Compressed types: fetch rerank * k candidates and re-rank them on the full vectors (0: off)
+    "filter_exact_max": 20000,  # Filtered queries matching at most this many documents are scanned exactly
+}
+
+def create_index(index_type: str, dimension: int, n_train: int = 0, params: Dict = None) -> faiss.Index:
+    """
+    Build an empty FAISS index of the given type. IVF sizes are derived from n_train, the number of
+    vectors it will be trained on, so a small corpus still gets a trainable index.
+    """
+    params = {**DEFAULT_INDEX_PARAMS, **(params or {})}
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dimension)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, params["hnsw_m"])
+        index.hnsw.efConstruction = params["ef_construction"]
+        return index
+    if index_type == "sq_fp16":
+        return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16)
+    if index_type == "sq_int8":
+        return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit)
+    # k-means wants roughly 39 training points per centroid
+    pq_m = max(m for m in range(1, params["pq_m"] + 1) if dimension % m == 0)
+    pq_nbits = max(1, min(params["pq_nbits"], int(np.log2(max(n_train // 39, 2)))))
+    if index_type == "pq":
+        return faiss.IndexPQ(dimension, pq_m, pq_nbits)
+    if index_type in ("ivf_flat", "ivf_pq"):
+        nlist = max(1, min(params["nlist"], n_train // 39))
+        if index_type == "ivf_flat":
+            return faiss.index_factory(dimension, f"IVF{nlist},Flat")
+        return faiss.index_factory(dimension, f"IVF{nlist},PQ{pq_m}x{pq_nbits}")
+    raise ValueError(f"Unknown index type '{index_type}'. Expected one of {INDEX_TYPES}.")
+
+def index_type_of(index: faiss.Index) -> str:
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexPQ):
+        return "pq"
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "sq_fp16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq_int8"
+    if faiss.try_extract_index_ivf(index) is not None:
+        return "ivf_flat"
+    return "flat"
 
 class VectorStore:
-    def __init__(self, dimension: int = 384, index_file: str = "faiss_index.bin"):
+    """
+    FAISS index plus the documents and metadata behind it.
+
+    On disk the store is a compacted base (index_file plus the document columns next to it, see
+    nlp.doc_store) followed by immutable segments, one per ingest, listed in index_file.segments/manifest.json. Appending a filing writes
+    one small segment and swaps the manifest, so its cost depends on the new chunks only; compact()
+    folds the segments back into the base. In memory, the base keeps its ANN type (and may be
+    memory-mapped) while appended vectors sit in a flat tail index, and searches merge the two.
+    Persisted texts and metadata are memory-mapped too, and only decoded for the hits returned.
+
+    FAISS ids are positions in document order. Each document also gets a stable id, kept when positions
+    shift: delete() only records tombstones (published in the segment manifest) and masks the documents
+    out of searches; compaction and save() purge them from the files and renumber the positions.
+    """
+    def __init__(self, dimension: int = 384, index_file: str = "faiss_index.bin", mmap: bool = False,
+                 index_type: str = "flat", index_params: Dict = None):
         """
         Initialize FAISS index.
         :param dimension: Dimension of embeddings (384 for MiniLM-L6-v2).
+        :param mmap: Memory-map the vectors on load instead of reading them into process memory,
+                     so every process serving the same file shares one copy through the page cache.
+        :param index_type: flat (exact), ivf_flat, ivf_pq, hnsw, or the compressed sq_fp16, sq_int8 and pq,
+                           used when the base is (re)built. A base loaded from disk keeps its type until rebuild().
+        :param index_params: Overrides for DEFAULT_INDEX_PARAMS (nlist, nprobe, ef_search, ...).
         """
         self.dimension = dimension
         self.index_file = index_file
-        self.index = faiss.IndexFlatL2(dimension)
-        self.documents = []  # Store text mapping
-        self.metadatas = []  # Store metadata (e.g. {"ticker": "AAPL"})
+        self.mmap = mmap
+        self._mapped = False
+        self.index_type = index_type
+        self.index_params = {**DEFAULT_INDEX_PARAMS, **(index_params or {})}
+        self.index = create_index(index_type, dimension, 0, self.index_params)  # compacted base
+        self.tail = faiss.IndexFlatL2(dimension)  # vectors appended since the base was written
+        self._full = None  # full-precision copy of a compressed base's vectors, memory-mapped from disk
+        self.documents = DocumentList()  # Store text mapping
+        self.metadatas = DocumentList()  # Store metadata (e.g. {"ticker": "AAPL"})
+        # Metadata index: (key, value) -> ids of the documents carrying it, in insertion order
+        self._postings = {}
+        self._hashes = np.zeros(0, dtype=np.uint64)  # sorted content hashes of every live text
+        self._hash_order = np.zeros(0, dtype=np.int64)  # position of the document behind each of _hashes
+        self._row_hashes = np.zeros(0, dtype=np.uint64)  # content hash of each document, by position
+        self._ids = np.zeros(0, dtype=np.int64)  # stable id of each document, by position (ascending)
+        self._sentiments = np.zeros(0, dtype=np.float32)  # risk score of each document, by position (NaN: not scored)
+        self._next_id = 0
+        self.deleted = np.zeros(0, dtype=np.int64)  # sorted positions of deleted documents not purged yet
+        self._deletes_published = True
+        self._selectors = None  # IDSelectors masking the deleted documents out of searches, built on demand
+        self.segments = []  # Persisted segments after the base: [{"name", "start", "count", "first_id"}]
+        self._persisted = 0  # Documents already on disk (base + segments)
+        self._base_stat = None
+
+    @property
+    def segment_dir(self) -> str:
+        return self.index_file + ".segments"
 
-    def add_documents(self, embeddings: np.ndarray, texts: List[str], metadatas: List[dict] = None):
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal + self.tail.ntotal
+
+    @property
+    def live_count(self) -> int:
+        return len(self.documents) - len(self.deleted)
+
+    def add_documents(self, embeddings: np.ndarray, texts: List[str], metadatas: List[dict] = None,
+                      sentiments: np.ndarray = None) -> np.ndarray:
         """
-        Add documents to the index.
+        Add documents to the index. They are searchable at once and persisted by append_segment() or save().
+        sentiments are their risk scores, if scored (see sentiments()). Returns their stable ids.
         """
         if len(texts) != embeddings.shape[0]:
             raise ValueError("Number of texts and embeddings must match.")
@@ -26,90 +145,769 @@ class VectorStore:
         if metadatas and len(metadatas) != len(texts):
             raise ValueError("Number of metadatas must match number of texts.")
             
-        self.index.add(embeddings)
+        self.tail.add(np.ascontiguousarray(embeddings, dtype="float32"))
+        first_id = len(self.documents)
         self.documents.extend(texts)
+        ids = np.arange(self._next_id, self._next_id + len(texts), dtype=np.int64)
+        self._next_id += len(texts)
+        self._append_rows(ids, content_hashes(texts), sentiments)
         if metadatas:
             self.metadatas.extend(metadatas)
         else:
             # Add empty dicts if no metadata provided to keep indices aligned
             self.metadatas.extend([{} for _ in texts])
+        self._index_metadata(first_id)
             
         print(f"Added {len(texts)} documents to vector store.")
+        return ids
+
+    def delete(self, filter: dict = None, ids: np.ndarray = None) -> np.ndarray:
+        """
+        Delete the documents matching filter and/or having the given stable ids. They drop out of searches
+        at once; append_segment() publishes the deletion and compaction (or save()) purges them from disk.
+        Returns the positions of the documents deleted.
+        """
+        if not filter and ids is None:
+            raise ValueError("Pass a filter or ids to delete.")
+        targets = [np.asarray(ids, dtype=np.int64).ravel()] if ids is not None else []
+        if filter:
+            targets.append(self._ids[self.matching_ids(filter)])
+        return self._apply_tombstones(np.concatenate(targets))
+
+    def replaced_ids(self, filters: List[dict], texts: List[str]) -> np.ndarray:
+        """
+        Stable ids of the live documents matching any of filters whose text is not among texts:
+        what replacing those documents with texts deletes (unchanged ones are kept, not re-embedded).
+        """
+        if not filters:
+            return np.zeros(0, dtype=np.int64)
+        positions = np.unique(np.concatenate([self.matching_ids(f) for f in filters]))
+        unchanged = np.isin(self._row_hashes[positions], content_hashes(texts))
+        return self._ids[positions[~unchanged]]
+
+    def _positions_of_ids(self, ids: np.ndarray) -> np.ndarray:
+        # Position of each stable id, -1 for ids no longer stored (purged meanwhile)
+        ids = np.asarray(ids, dtype=np.int64)
+        slots = np.minimum(np.searchsorted(self._ids, ids), max(len(self._ids) - 1, 0))
+        found = self._ids[slots] == ids if len(self._ids) else np.zeros(len(ids), dtype=bool)
+        return np.where(found, slots, -1)
+
+    def _apply_tombstones(self, ids: np.ndarray) -> np.ndarray:
+        # Ids already deleted, or no longer stored (purged meanwhile), are ignored
+        positions = self._positions_of_ids(ids)
+        positions = np.setdiff1d(positions[positions >= 0], self.deleted)
+        if not len(positions):
+            return positions
+        self.deleted = np.union1d(self.deleted, positions)
+        self._deletes_published = False
+        self._selectors = None
+        self._unindex(positions)
+        self._reindex_hashes()
+        return positions
+
+    def _append_rows(self, ids: np.ndarray, hashes: np.ndarray, sentiments: np.ndarray = None):
+        if sentiments is None:
+            sentiments = np.full(len(hashes), np.nan, dtype=np.float32)
+        elif len(sentiments) != len(hashes):
+            raise ValueError("Number of sentiments must match number of texts.")
+        self._ids = np.concatenate([self._ids, np.asarray(ids, dtype=np.int64)])
+        self._row_hashes = np.concatenate([self._row_hashes, hashes])
+        self._sentiments = np.concatenate([self._sentiments, np.asarray(sentiments, dtype=np.float32)])
+        self._index_hashes(hashes, len(self._row_hashes) - len(hashes))
+
+    def _drop_rows(self, purged: np.ndarray):
+        # A new base left out these (deleted) positions: forget them and renumber the documents after them
+        if not len(purged):
+            return
+        self._ids = np.delete(self._ids, purged)
+        self._row_hashes = np.delete(self._row_hashes, purged)
+        self._sentiments = np.delete(self._sentiments, purged)
+        remaining = np.setdiff1d(self.deleted, purged)
+        self.deleted = remaining - np.searchsorted(purged, remaining)
+        self._selectors = None
+        self._reindex_hashes()
+        self._index_metadata()
+        self._unindex(self.deleted)
+
+    def rebuild(self, index_type: str = None, index_params: Dict = None):
+        """
+        Re-create the base from every stored vector (tail included), training it on all of them.
+        Use after switching index type or once the corpus has outgrown the IVF lists it was trained with.
+        """
+        self.index_type = index_type or self.index_type
+        self.index_params = {**self.index_params, **(index_params or {})}
+        vectors = np.array(self.vectors())  # a copy: vectors() may be a view of the tail replaced below
+        self.index = self._build_base(vectors)
+        self._full = vectors if self.index_type in COMPRESSED_TYPES else None
+        self.tail = faiss.IndexFlatL2(self.dimension)
+        self._mapped = False
+        self._selectors = None
+
+    def _build_base(self, vectors: np.ndarray) -> faiss.Index:
+        index = create_index(self.index_type, self.dimension, len(vectors), self.index_params)
+        if len(vectors):
+            index.train(vectors)
+            index.add(vectors)
+        self._apply_search_params(index)
+        return index
+
+    def vectors(self, start: int = 0, end: int = None) -> np.ndarray:
+        """
+        Stored vectors start..end in document order (approximate for a compressed base
+        whose full-precision vectors are not on disk, e.g. one built before they were kept).
+        """
+        end = self.ntotal if end is None else end
+        parts = []
+        base_total = self.index.ntotal
+        if start < base_total and self._full is not None:
+            parts.append(self._full[start:min(end, base_total)])
+        elif start < base_total:
+            ivf = faiss.try_extract_index_ivf(self.index)
+            if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+                ivf.make_direct_map()
+            parts.append(self.index.reconstruct_n(start, min(end, base_total) - start))
+        if end > base_total:
+            tail_start = max(start, base_total) - base_total
+            parts.append(self._tail_vectors()[tail_start:end - base_total])
+        if not parts:
+            return np.zeros((0, self.dimension), dtype="float32")
+        return np.concatenate(parts) if len(parts) > 1 else np.ascontiguousarray(parts[0])
+
+    def stable_ids(self, start: int = 0, end: int = None) -> np.ndarray:
+        """
+        Stable ids of documents start..end. Ids only ascend, so the id at a position identifies
+        every document up to it: it changes if any of them is purged.
+        """
+        return self._ids[start:end].copy()
+
+    def sentiments(self, positions: List[int]) -> np.ndarray:
+        """
+        Risk scores of the documents at positions, as stored at ingest (NaN for documents never scored).
+        Kept in a float column of their own rather than the metadata, so they are neither filterable nor dictionary-coded.
+        """
+        return self._sentiments[np.asarray(positions, dtype=np.int64)]
+
+    def unscored_ids(self) -> np.ndarray:
+        """
+        Stable ids of the live documents without a risk score, e.g. ingested before scores were stored.
+        """
+        unscored = np.setdiff1d(np.flatnonzero(np.isnan(self._sentiments)), self.deleted)
+        return self._ids[unscored]
+
+    def texts_of(self, ids: np.ndarray) -> List[Optional[str]]:
+        """
+        Text of the live document with each stable id, or None if it was deleted or purged.
+        """
+        positions = self._positions_of_ids(ids)
+        dead = np.isin(positions, self.deleted)
+        return [self.documents[int(p)] if p >= 0 and not gone else None for p, gone in zip(positions, dead)]
+
+    def set_sentiments(self, ids: np.ndarray, scores: np.ndarray) -> np.ndarray:
+        """
+        Record risk scores for the documents with the given stable ids (those deleted or purged, or already
+        scored, e.g. by another process's backfill, are skipped). Only held in memory: save() writes them out.
+        Returns the positions updated.
+        """
+        positions = self._positions_of_ids(ids)
+        live = (positions >= 0) & ~np.isin(positions, self.deleted)
+        live[live] = np.isnan(self._sentiments[positions[live]])
+        self._sentiments[positions[live]] = np.asarray(scores, dtype=np.float32)[live]
+        return positions[live]
+
+    def _tail_vectors(self) -> np.ndarray:
+        # Zero-copy view of the tail's vectors
+        return _flat_vectors(self.tail, self.dimension)
+
+    def set_search_params(self, **params):
+        """
+        Tune recall against latency at query time (nprobe for IVF, ef_search for HNSW).
+        """
+        self.index_params.update(params)
+        self._apply_search_params()
+
+    def _apply_search_params(self, index: faiss.Index = None):
+        index = self.index if index is None else index
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            ivf.nprobe = min(self.index_params["nprobe"], ivf.nlist)
+        if isinstance(index, faiss.IndexHNSW):
+            index.hnsw.efSearch = self.index_params["ef_search"]
+
+    def _index_metadata(self, first_id: int = 0):
+        if first_id == 0:
+            self._postings = {}
+        for start, part in self.metadatas.spans():
+            if start + len(part) <= first_id:
+                continue
+            if isinstance(part, MetadataColumns) and start >= first_id:
+                self._index_columns(part, start)
+                continue
+            for offset in range(max(first_id - start, 0), len(part)):
+                for key, value in part[offset].items():
+                    try:
+                        ids = self._postings.setdefault((key, value), array("q"))
+                    except TypeError:
+                        continue  # unhashable values are not filterable
+                    ids.append(start + offset)
+
+    def _index_columns(self, columns: MetadataColumns, first_id: int):
+        # Postings straight from the dictionary-coded columns, without materializing a dict per document
+        for key_value, ids in columns.postings():
+            try:
+                postings = self._postings.setdefault(key_value, array("q"))
+            except TypeError:
+                continue
+            postings.frombytes((ids + first_id).astype(np.int64).tobytes())
+
+    def _unindex(self, positions: np.ndarray):
+        # Drop deleted documents from the metadata index, so filters (and metadata_values) skip them
+        if not len(positions):
+            return
+        for key_value, ids in list(self._postings.items()):
+            current = np.frombuffer(ids, dtype=np.int64)
+            live = ~np.isin(current, positions)
+            if live.all():
+                continue
+            if live.any():
+                self._postings[key_value] = array("q", current[live].tobytes())
+            else:
+                del self._postings[key_value]
+
+    def _index_hashes(self, hashes: np.ndarray, first_id: int):
+        # Merge the hashes of new documents first_id.. into the sorted index, without re-sorting what is there
+        order = np.argsort(hashes, kind="stable")
+        slots = np.searchsorted(self._hashes, hashes[order], side="right")
+        self._hashes = np.insert(self._hashes, slots, hashes[order])
+        self._hash_order = np.insert(self._hash_order, slots, first_id + order)
+
+    def _reindex_hashes(self):
+        # Rebuilt when documents are deleted (they leave the index) or purged (positions shift)
+        live = np.setdiff1d(np.arange(len(self._row_hashes)), self.deleted)
+        order = np.argsort(self._row_hashes[live], kind="stable")
+        self._hash_order = live[order]
+        self._hashes = self._row_hashes[self._hash_order]
+
+    def new_positions(self, texts: List[str]) -> List[int]:
+        """
+        Positions of the texts not stored yet (by content hash), keeping only the first of any repeats.
+        """
+        hashes = content_hashes(texts)
+        slots = np.minimum(np.searchsorted(self._hashes, hashes), max(len(self._hashes) - 1, 0))
+        known = (self._hashes[slots] == hashes) if len(self._hashes) else np.zeros(len(hashes), dtype=bool)
+        seen = set()
+        positions = []
+        for i, h in enumerate(hashes.tolist()):
+            if not known[i] and h not in seen:
+                seen.add(h)
+                positions.append(i)
+        return positions
+
+    def positions_of(self, texts: List[str]) -> List[Optional[int]]:
+        """
+        Position of the live document holding each text (by content hash), or None if it is not stored.
+        A lookup in the sorted hash index, so its cost follows the number of texts, not the corpus size.
+        """
+        hashes = content_hashes(texts)
+        slots = np.minimum(np.searchsorted(self._hashes, hashes), max(len(self._hashes) - 1, 0))
+        known = (self._hashes[slots] == hashes) if len(self._hashes) else np.zeros(len(hashes), dtype=bool)
+        return [int(self._hash_order[slot]) if found else None for slot, found in zip(slots.tolist(), known.tolist())]
+
+    def metadata_values(self, key: str, end: int = None) -> set:
+        """
+        Distinct values of a metadata key among live documents 0..end (all documents by default).
+        """
+        end = len(self.metadatas) if end is None else end
+        return {value for (k, value), ids in self._postings.items() if k == key and ids and ids[0] < end}
+
+    def matching_ids(self, filter: dict) -> np.ndarray:
+        """
+        Sorted ids (positions) of the live documents whose metadata matches every key/value in filter.
+        """
+        postings = []
+        for key, value in filter.items():
+            try:
+                ids = self._postings.get((key, value))
+            except TypeError:
+                ids = None
+            if not ids:
+                return np.zeros(0, dtype="int64")
+            postings.append(np.array(ids, dtype="int64"))
+        # Intersect starting from the rarest value, so the cost follows the smallest posting list
+        postings.sort(key=len)
+        matched = postings[0]
+        for ids in postings[1:]:
+            matched = np.intersect1d(matched, ids, assume_unique=True)
+        return matched
 
     def search(self, query_embedding: np.ndarray, k: int = 5, filter: dict = None) -> List[Tuple[str, float]]:
         """
         Search for similar documents with optional filtering.
+        Filters are resolved through the metadata index first, so a filtered query returns k hits
+        whenever k matching documents exist, however small a share of the corpus they are.
         """
         # Faiss expects 2D array
         if len(query_embedding.shape) == 1:
             query_embedding = query_embedding.reshape(1, -1)
-            
-        # If we have a filter, we might need to fetch more candidates to ensure we have enough after filtering
-        search_k = k * 10 if filter else k
-        
-        distances, indices = self.index.search(query_embedding, search_k)
-        
-        results = []
-        found_count = 0
-        
-        for i in range(search_k):
-            # Safe check for index bounds (FAISS can return -1)
-            if i >= len(indices[0]): break
-            
-            idx = indices[0][i]
-            if idx != -1 and idx < len(self.documents):
-                # Check filter
-                if filter:
-                    match = True
-                    # Metadata for this doc
-                    doc_meta = self.metadatas[idx] if idx < len(self.metadatas) else {}
-                    
-                    for key, val in filter.items():
-                        if doc_meta.get(key) != val:
-                            match = False
-                            break
-                    if not match:
-                        continue
-                
-                results.append((self.documents[idx], float(distances[0][i])))
-                found_count += 1
-                if found_count >= k:
-                    break
-        
+        return self.search_batch(query_embedding[:1], k, [filter])[0]
+
+    def search_batch(self, query_embeddings: np.ndarray, k: int = 5, filters: List[dict] = None) -> List[List[Tuple[str, float]]]:
+        """
+        search() for every row of query_embeddings, each with its own optional filter.
+        Queries sharing a filter (or having none) go through FAISS, or the exact scan, as one matrix.
+        """
+        queries = np.ascontiguousarray(np.atleast_2d(query_embeddings), dtype="float32")
+        filters = filters or [None] * len(queries)
+        if len(filters) != len(queries):
+            raise ValueError("Number of filters must match number of queries.")
+
+        groups = {}
+        for row, filter in enumerate(filters):
+            key = json.dumps(filter, sort_keys=True, default=str) if filter else None
+            groups.setdefault(key, (filter, []))[1].append(row)
+
+        results = [None] * len(queries)
+        for filter, rows in groups.values():
+            distances, indices = self._search_group(queries[rows], k, filter)
+            for row, row_distances, row_indices in zip(rows, distances, indices):
+                # FAISS pads with -1 when there are fewer than k hits
+                results[row] = [
+                    (self.documents[idx], float(distance))
+                    for distance, idx in zip(row_distances, row_indices)
+                    if idx != -1 and idx < len(self.documents)
+                ]
         return results
 
+    def _search_group(self, queries: np.ndarray, k: int, filter: dict = None) -> Tuple[np.ndarray, np.ndarray]:
+        base_total = self.index.ntotal
+        rerank = self.index_params["rerank"] if self._full is not None else 0
+        if filter:
+            ids = self.matching_ids(filter)
+            base_hits = self._search_subset(queries, k, ids[ids < base_total])
+            tail_ids = ids[ids >= base_total]
+            tail_hits = _exact_search(queries, k, tail_ids, self._tail_vectors()[tail_ids - base_total])
+        else:
+            base_selector, tail_selector = self._live_selectors()
+            if not base_total:
+                base_hits = _no_hits(len(queries))
+            elif rerank:
+                base_hits = self._rerank(queries, self._search_base(queries, k * rerank, base_selector), k)
+            else:
+                base_hits = self._search_base(queries, k, base_selector)
+            if not self.tail.ntotal:
+                tail_hits = _no_hits(len(queries))
+            elif tail_selector is not None:
+                tail_hits = self.tail.search(queries, k, params=faiss.SearchParameters(sel=tail_selector))
+            else:
+                tail_hits = self.tail.search(queries, k)
+            tail_hits = (tail_hits[0], np.where(tail_hits[1] >= 0, tail_hits[1] + base_total, -1))
+        return _merge_hits(k, base_hits, tail_hits)
+
+    def _search_base(self, queries: np.ndarray, n: int, selector: faiss.IDSelector = None) -> Tuple[np.ndarray, np.ndarray]:
+        if selector is None:
+            return self.index.search(queries, n)
+        params = self._search_params(selector)
+        if params is not None:
+            return self.index.search(queries, n, params=params)
+        # IndexPQ takes no search parameters (it scans every code anyway): over-fetch by the deleted count and drop them
+        dead = self.deleted[self.deleted < self.index.ntotal]
+        distances, indices = self.index.search(queries, min(n + len(dead), self.index.ntotal))
+        distances[np.isin(indices, dead)] = np.inf
+        return _top_k(n, distances, indices)
+
+    def _search_params(self, selector: faiss.IDSelector) -> Optional[faiss.SearchParameters]:
+        # Search parameters restricting the base to selector, or None if its type cannot take them
+        if isinstance(self.index, faiss.IndexHNSW):
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=self.index_params["ef_search"])
+        if faiss.try_extract_index_ivf(self.index) is not None:
+            return faiss.SearchParametersIVF(sel=selector, nprobe=self.index_params["nprobe"])
+        if isinstance(self.index, faiss.IndexPQ):
+            return None
+        return faiss.SearchParameters(sel=selector)
+
+    def _live_selectors(self) -> Tuple[Optional[faiss.IDSelector], Optional[faiss.IDSelector]]:
+        # (base, tail) selectors excluding the deleted documents, None where nothing is deleted
+        base_total = self.index.ntotal
+        if self._selectors is None or self._selectors[0] != base_total:
+            selectors, batches = [], []
+            for ids in (self.deleted[self.deleted < base_total], self.deleted[self.deleted >= base_total] - base_total):
+                if len(ids):
+                    batches.append(faiss.IDSelectorBatch(ids))  # referenced here so it outlives the Not wrapping it
+                    selectors.append(faiss.IDSelectorNot(batches[-1]))
+                else:
+                    selectors.append(None)
+            self._selectors = (base_total, tuple(selectors), batches)
+        return self._selectors[1]
+
+    def _search_subset(self, queries: np.ndarray, k: int, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        k nearest neighbours among base ids only. Small subsets (and any subset of a flat base) are scanned
+        exactly; large ones go through the ANN index restricted by an IDSelector, with an exact scan
+        as the fallback if the approximate search comes back short.
+        """
+        if len(ids) == 0:
+            return _no_hits(len(queries))
+
+        if self.index_type not in ("flat", "pq") and len(ids) > self.index_params["filter_exact_max"]:
+            selector = faiss.IDSelectorBatch(ids)
+            params = self._search_params(selector)
+            rerank = self.index_params["rerank"] if self._full is not None else 0
+            distances, indices = self.index.search(queries, k * max(rerank, 1), params=params)
+            if ((indices != -1).sum(axis=1) >= min(k, len(ids))).all():
+                return self._rerank(queries, (distances, indices), k) if rerank else (distances, indices)
+
+        return _exact_search(queries, k, ids, self._base_vectors_for(ids))
+
+    def _rerank(self, queries: np.ndarray, hits: Tuple[np.ndarray, np.ndarray], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        # Exact distances for the compressed index's candidates, read from the full-precision vectors
+        indices = hits[1]
+        valid = indices != -1
+        candidates = self._full[np.where(valid, indices, 0)]
+        distances = ((candidates - queries[:, None, :]) ** 2).sum(axis=2)
+        distances[~valid] = np.inf
+        return _top_k(k, distances, indices)
+
+    def _base_vectors_for(self, ids: np.ndarray) -> np.ndarray:
+        if self._full is not None:
+            return self._full[ids]
+        if isinstance(self.index, faiss.IndexFlat):
+            # Zero-copy view of the stored vectors (also works when they are memory-mapped)
+            return _flat_vectors(self.index, self.dimension)[ids]
+        ivf = faiss.try_extract_index_ivf(self.index)
+        if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+            ivf.make_direct_map()
+        return self.index.reconstruct_batch(ids)
+
+    # Persistence
+
+    def append_segment(self) -> Optional[str]:
+        """
+        Persist the documents added since the last save or append as a new immutable segment,
+        then publish it, and any deletions, by swapping the manifest. Costs I/O proportional to the new documents only.
+        """
+        start, end = self._persisted, len(self.documents)
+        if end == start:
+            if not self._deletes_published:
+                self._write_segment_manifest(self.segments)
+            return None
+        os.makedirs(self.segment_dir, exist_ok=True)
+        name = f"seg-{uuid.uuid4().hex[:16]}"
+        path = os.path.join(self.segment_dir, name)
+
+        with open(path + ".npy.tmp", "wb") as f:
+            np.save(f, self.vectors(start, end))
+        write_documents(path, self.documents.items, self.metadatas.items, ".tmp", self._ids[start:end],
+                        self._sentiments[start:end])
+        os.replace(path + ".npy.tmp", path + ".npy")
+        install_documents(path, ".tmp")
+
+        self.segments.append({"name": name, "start": start, "count": end - start, "first_id": int(self._ids[start])})
+        self._write_segment_manifest(self.segments)
+        self._persisted = end
+        # From now on serve the new documents from their mapped files instead of the heap
+        texts, metadatas = read_documents(path)
+        self.documents.persist(texts)
+        self.metadatas.persist(metadatas)
+        print(f"Appended segment {name} ({end - start} documents)")
+        return name
+
     def save(self):
         """
-        Save index and documents/metadata to disk.
+        Write a full snapshot: the tail is folded into the base, deleted documents are purged and the segments are dropped.
         """
-        faiss.write_index(self.index, self.index_file)
-        with open(self.index_file + ".pkl", "wb") as f:
-            data = {
-                "documents": self.documents,
-                "metadatas": self.metadatas
-            }
-            pickle.dump(data, f)
+        count, purged = len(self.documents), self.deleted
+        documents, metadatas, ids, sentiments = self.documents, self.metadatas, self._ids, self._sentiments
+        if len(purged):
+            # Positions shift, so the base is rebuilt from the live vectors
+            live = np.ones(count, dtype=bool)
+            live[purged] = False
+            vectors = self.vectors()[live]
+            self.index = self._build_base(vectors)
+            self._full = vectors if self.index_type in COMPRESSED_TYPES else None
+            self.tail = faiss.IndexFlatL2(self.dimension)
+            self._mapped = False
+            documents, metadatas = itertools.compress(self.documents, live), itertools.compress(self.metadatas, live)
+            ids, sentiments = self._ids[live], self._sentiments[live]
+        elif self.tail.ntotal:
+            if self.index.is_trained and self.index.ntotal:
+                if self._mapped:
+                    # A memory-mapped index is a read-only view of the file; take a private copy before growing it
+                    self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+                    self._mapped = False
+                appended = self.vectors(self.index.ntotal)
+                if self._full is not None:
+                    self._full = np.concatenate([self._full, appended])
+                self.index.add(appended)
+                self.tail = faiss.IndexFlatL2(self.dimension)
+            else:
+                self.rebuild()
+        self._write_base(self.index, documents, metadatas, ".tmp", self._full, ids, sentiments)
+        self._install_base(".tmp")
+        self._full = self._read_full_vectors()
+        self._rebase_documents(count)
+        self._drop_rows(purged)
+        self._persisted = len(self.documents)
+        self._replace_base(count, len(purged))
         print(f"Index saved to {self.index_file}")
 
+    def prepare_compaction(self, lock=None) -> Optional[Dict]:
+        """
+        Build a new base from everything persisted so far, without touching the live store.
+        Only the snapshot is taken under lock (the one guarding add_documents); training and
+        writing the new base run outside it. Install the result with install_compaction().
+        """
+        with lock or contextlib.nullcontext():
+            count = self._persisted
+            purged = self.deleted[self.deleted < count]
+            if not self.segments and not len(purged):
+                return None
+            live = np.ones(count, dtype=bool)
+            live[purged] = False
+            vectors = self.vectors(0, count)[live]
+            ids, sentiments = self._ids[:count][live], self._sentiments[:count][live]
+            # Persisted parts are immutable, so they can be streamed into the new base after the lock is released
+            documents = itertools.compress(itertools.islice(iter(self.documents), count), live)
+            metadatas = itertools.compress(itertools.islice(iter(self.metadatas), count), live)
+            segments = [s["name"] for s in self.segments if s["start"] < count]
+        index = self._build_base(vectors)
+        suffix = f".{uuid.uuid4().hex[:8]}.compact"
+        self._write_base(index, documents, metadatas, suffix, vectors if self.index_type in COMPRESSED_TYPES else None,
+                         ids, sentiments)
+        return {"count": count, "purged": purged, "index": index, "segments": segments, "suffix": suffix}
+
+    def install_compaction(self, compaction: Dict) -> bool:
+        """
+        Swap in a base built by prepare_compaction(). Segments appended meanwhile stay on as segments, and
+        documents deleted meanwhile stay tombstoned; those the new base purged are dropped, shifting positions.
+        Returns False (and discards the build) if the store changed under it, e.g. another process compacted.
+        Callers hold the same locks as for append_segment().
+        """
+        on_disk = self._read_segment_manifest()["segments"]
+        if self._stat_base() != self._base_stat or \
+                [s["name"] for s in on_disk if s["start"] < compaction["count"]] != compaction["segments"]:
+            for path in (self.index_file, self.index_file + ".vectors.npy"):
+                if os.path.exists(path + compaction["suffix"]):
+                    os.remove(path + compaction["suffix"])
+            remove_documents(self.index_file, compaction["suffix"])
+            return False
+
+        remaining = self.vectors(compaction["count"]).copy()
+        self._install_base(compaction["suffix"])
+        if self.mmap:
+            self.index = self._read_base_index()
+        else:
+            self.index = compaction["index"]
+            self._mapped = False
+        self._full = self._read_full_vectors()
+        self.tail = faiss.IndexFlatL2(self.dimension)
+        if len(remaining):
+            self.tail.add(remaining)
+        self._rebase_documents(compaction["count"])
+        self._drop_rows(compaction["purged"])
+        self._persisted -= len(compaction["purged"])
+        self._replace_base(compaction["count"], len(compaction["purged"]))
+        return True
+
+    def _write_base(self, index: faiss.Index, documents: List[str], metadatas: List[dict], suffix: str,
+                    full_vectors: np.ndarray = None, ids: np.ndarray = None, sentiments: np.ndarray = None):
+        # Written under temporary names and renamed by _install_base, so processes loading concurrently never see a torn file
+        faiss.write_index(index, self.index_file + suffix)
+        write_documents(self.index_file, documents, metadatas, suffix, ids, sentiments)
+        if full_vectors is not None:
+            with open(self.index_file + ".vectors.npy" + suffix, "wb") as f:
+                np.save(f, np.ascontiguousarray(full_vectors, dtype="float32"))
+
+    def _install_base(self, suffix: str):
+        os.replace(self.index_file + suffix, self.index_file)
+        install_documents(self.index_file, suffix)
+        if os.path.exists(self.index_file + ".vectors.npy" + suffix):
+            os.replace(self.index_file + ".vectors.npy" + suffix, self.index_file + ".vectors.npy")
+        elif os.path.exists(self.index_file + ".vectors.npy"):
+            os.remove(self.index_file + ".vectors.npy")  # the new base is not compressed
+        if os.path.exists(self.index_file + ".pkl"):
+            os.remove(self.index_file + ".pkl")  # pickled documents from before the columnar format
+
+    def _rebase_documents(self, count: int):
+        # Serve documents [0, count), now in the base, from its files, dropping the parts (and heap copies) it replaced
+        texts, metadatas = read_documents(self.index_file)
+        self.documents = self.documents.rebase(texts, count)
+        self.metadatas = self.metadatas.rebase(metadatas, count)
+
+    def _read_full_vectors(self) -> Optional[np.ndarray]:
+        # Only read on demand, for re-ranking and rebuilds: the compressed codes are what stays resident
+        path = self.index_file + ".vectors.npy"
+        if index_type_of(self.index) not in COMPRESSED_TYPES or not os.path.exists(path):
+            return None
+        vectors = np.load(path, mmap_mode="r")
+        return vectors if len(vectors) == self.index.ntotal else None
+
+    def _read_base_index(self) -> faiss.Index:
+        if self.mmap:
+            # IO_FLAG_MMAP_IFC maps flat index codes; older faiss builds only know IO_FLAG_MMAP
+            self._mapped = True
+            index = faiss.read_index(self.index_file, getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP))
+        else:
+            self._mapped = False
+            index = faiss.read_index(self.index_file)
+        self._apply_search_params(index)
+        return index
+
+    def _replace_base(self, base_count: int, purged: int = 0):
+        # The base now covers documents [0, base_count), less the purged ones: drop the segments it absorbed
+        dropped = [s for s in self.segments if s["start"] < base_count]
+        self.segments = [{**s, "start": s["start"] - purged} for s in self.segments if s["start"] >= base_count]
+        self._write_segment_manifest(self.segments)
+        self._base_stat = self._stat_base()
+        for segment in dropped:
+            path = os.path.join(self.segment_dir, segment["name"])
+            remove_documents(path)
+            try:
+                os.remove(path + ".npy")
+            except FileNotFoundError:
+                pass
+
+    def _read_segment_manifest(self) -> Dict:
+        try:
+            with open(os.path.join(self.segment_dir, "manifest.json"), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"segments": []}
+
+    def _write_segment_manifest(self, segments: List[Dict]):
+        self._deletes_published = True
+        if not segments and not len(self.deleted) and not os.path.isdir(self.segment_dir):
+            return
+        os.makedirs(self.segment_dir, exist_ok=True)
+        path = os.path.join(self.segment_dir, "manifest.json")
+        with open(path + ".tmp", "w") as f:
+            # Tombstones are stable ids, so they stay valid while another process compacts
+            json.dump({"dimension": self.dimension, "segments": segments, "next_id": self._next_id,
+                       "deleted": self._ids[self.deleted].tolist()}, f)
+        os.replace(path + ".tmp", path)
+
+    def _stat_base(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.index_file)
+            return stat.st_ino, stat.st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load_segments(self, manifest: Dict):
+        for segment in sorted(manifest["segments"], key=lambda s: s["start"]):
+            # Segments from before stable ids were numbered by position
+            first_id = segment.get("first_id", segment["start"])
+            if len(self._ids) and first_id <= self._ids[-1]:
+                continue  # already loaded, or absorbed by the base (compaction finished before the manifest swap)
+            path = os.path.join(self.segment_dir, segment["name"])
+            texts, metadatas = read_documents(path)
+            self.tail.add(np.load(path + ".npy"))
+            start = len(self.documents)
+            self.documents.add_part(texts)
+            self.metadatas.add_part(metadatas)
+            self._append_rows(texts.ids if texts.ids is not None else first_id + np.arange(len(texts)), texts.hashes,
+                              texts.sentiments)
+            self._index_columns(metadatas, start)
+            self.segments.append({**segment, "start": start, "first_id": int(first_id)})
+        self._persisted = len(self.documents)
+        self._next_id = max(self._next_id, manifest.get("next_id", 0), int(self._ids[-1]) + 1 if len(self._ids) else 0)
+        # Deletions published by this or other processes; any of ours not yet published stay pending
+        pending = not self._deletes_published
+        self._apply_tombstones(manifest.get("deleted", []))
+        self._deletes_published = not pending
+
+    def sync(self) -> Optional[int]:
+        """
+        Load segments other processes have appended since this store was loaded.
+        Returns the id of the first new document, or None if the base itself changed and a full load() is needed.
+        """
+        if self._stat_base() != self._base_stat:
+            return None
+        first_id = len(self.documents)
+        self._load_segments(self._read_segment_manifest())
+        return first_id
+
     def load(self):
         """
         Load index and documents from disk.
         """
+        manifest = self._read_segment_manifest()
         if os.path.exists(self.index_file):
-            self.index = faiss.read_index(self.index_file)
-            if os.path.exists(self.index_file + ".pkl"):
+            self.index = self._read_base_index()
+            self._full = self._read_full_vectors()
+            loaded_type = index_type_of(self.index)
+            if loaded_type != self.index_type and self.index_type != "flat":
+                print(f"Index on disk is {loaded_type}, not {self.index_type}; rebuild it to switch.")
+            self.index_type = loaded_type
+            if os.path.exists(self.index_file + ".meta.json"):
+                texts, metadatas = read_documents(self.index_file)
+                self.documents, self.metadatas = DocumentList([texts]), DocumentList([metadatas])
+            elif os.path.exists(self.index_file + ".pkl"):
+                # Pickled documents from before the columnar format; the next save or compaction converts them
                 with open(self.index_file + ".pkl", "rb") as f:
                     data = pickle.load(f)
                     # Handle legacy format where data was just a list of strings
                     if isinstance(data, list):
-                        self.documents = data
-                        self.metadatas = [{} for _ in data]
+                        self.documents = DocumentList([data])
+                        self.metadatas = DocumentList([[{} for _ in data]])
                     elif isinstance(data, dict):
-                        self.documents = data.get("documents", [])
-                        self.metadatas = data.get("metadatas", [])
+                        self.documents = DocumentList([data.get("documents", [])])
+                        self.metadatas = DocumentList([data.get("metadatas", [])])
             print(f"Index loaded from {self.index_file}")
-        else:
+        elif not manifest["segments"]:
             print("Index file not found, starting fresh.")
+            return
+
+        self._base_stat = self._stat_base()
+        self.tail = faiss.IndexFlatL2(self.dimension)
+        self.segments = []
+        self._index_metadata()
+        self._ids, self._row_hashes = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint64)
+        self._sentiments = np.zeros(0, dtype=np.float32)
+        self._hashes, self.deleted, self._selectors = np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64), None
+        self._hash_order = np.zeros(0, dtype=np.int64)
+        for part in self.documents.parts:
+            if isinstance(part, TextColumn) and part.ids is not None:
+                self._append_rows(part.ids, part.hashes, part.sentiments)
+            else:
+                # Written before documents had stable ids, when nothing had ever been deleted: ids are positions
+                hashes = part.hashes if isinstance(part, TextColumn) else content_hashes(part)
+                self._append_rows(len(self._ids) + np.arange(len(part)), hashes)
+        self._load_segments(manifest)
+        if self.segments:
+            print(f"Loaded {len(self.segments)} segments ({self.tail.ntotal} documents) on top of the base")
+
+def _no_hits(n: int) -> Tuple[np.ndarray, np.ndarray]:
+    return np.zeros((n, 0), dtype="float32"), np.zeros((n, 0), dtype="int64")
+
+def _flat_vectors(index: faiss.IndexFlat, dimension: int) -> np.ndarray:
+    if index.ntotal == 0:
+        return np.zeros((0, dimension), dtype="float32")
+    return faiss.rev_swig_ptr(index.get_xb(), index.ntotal * dimension).reshape(index.ntotal, dimension)
+
+def _exact_search(queries: np.ndarray, k: int, ids: np.ndarray, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    if len(ids) == 0:
+        return _no_hits(len(queries))
+    if len(queries) == 1:
+        distances = ((vectors - queries[0]) ** 2).sum(axis=1)[None, :]
+    else:
+        # ||q - v||^2 expanded, so a batch is one matrix product (as FAISS does for batched flat search)
+        distances = (queries ** 2).sum(axis=1)[:, None] - 2 * queries @ vectors.T + (vectors ** 2).sum(axis=1)[None, :]
+        np.maximum(distances, 0, out=distances)
+    return _top_k(k, distances, np.broadcast_to(ids, distances.shape))
+
+def _top_k(k: int, distances: np.ndarray, indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Row-wise k smallest distances, ascending; infinite distances mark missing candidates (-1)
+    if distances.shape[1] > k:
+        top = np.argpartition(distances, k, axis=1)[:, :k]
+        distances, indices = np.take_along_axis(distances, top, axis=1), np.take_along_axis(indices, top, axis=1)
+    order = np.argsort(distances, axis=1, kind="stable")
+    distances, indices = np.take_along_axis(distances, order, axis=1), np.take_along_axis(indices, order, axis=1)
+    return distances, np.where(np.isinf(distances), -1, indices)
+
+def _merge_hits(k: int, *hits: Tuple[np.ndarray, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    distances = np.concatenate([d for d, _ in hits], axis=1).astype("float32")
+    indices = np.concatenate([i for _, i in hits], axis=1)
+    distances[indices == -1] = np.inf
+    return _top_k(k, distances, indices)
 
 if __name__ == "__main__":
     # Test
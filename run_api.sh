@@ -11,4 +11,9 @@ fi
 echo "Starting Credit Risk System API..."
 source venv/bin/activate
 export PYTHONPATH=$PYTHONPATH:$(pwd)
-uvicorn app.main:app --reload --host 0.0.0.0 --port 8000
+if [ "${RISK_WORKERS:-1}" -gt 1 ]; then
+    # Pre-forked workers sharing the loaded models and memory-mapped index
+    python -m app.server --host 0.0.0.0 --port 8000
+else
+    uvicorn app.main:app --reload --host 0.0.0.0 --port 8000
+fi